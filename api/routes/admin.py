@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Rutas de administración
+"""
+import hmac
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from loguru import logger
+
+from app.config import current_settings, reload_settings, settings_reloads
+from core.supabase import supabase
+
+router = APIRouter()
+
+def require_api_key(x_api_key: Optional[str] = Header(None, alias="X-API-Key")) -> None:
+    """Las rutas de administración requieren API_KEY configurada y enviada en X-API-Key"""
+    expected = current_settings().api_key
+    if not expected or not x_api_key or not hmac.compare_digest(x_api_key, expected):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@router.post("/settings/reload", dependencies=[Depends(require_api_key)])
+async def reload_configuration() -> Dict[str, Any]:
+    """
+    Relee .env y reemplaza el snapshot de configuración (rotación del
+    token de WhatsApp sin reiniciar)
+    """
+    try:
+        changed = reload_settings()
+    except Exception as e:
+        logger.error(f"Recarga de configuración rechazada, se mantiene la anterior: {e}")
+        raise HTTPException(status_code=422, detail="Configuración inválida, se mantiene la anterior")
+
+    logger.info(f"Configuración recargada; campos cambiados: {changed}")
+    return {"status": "reloaded", "changed": changed, "reloads": settings_reloads()}
+
+@router.post("/schema/refresh", dependencies=[Depends(require_api_key)])
+async def refresh_schema() -> Dict[str, Any]:
+    """
+    Vuelve a descubrir las columnas de las tablas (tras aplicar una migración)
+    """
+    return await supabase.load_schema()
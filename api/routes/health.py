@@ -6,7 +6,7 @@ from fastapi import APIRouter
 from datetime import datetime
 from typing import Dict, Any
 
-from app.config import settings
+from app.config import current_settings, settings
 
 router = APIRouter()
 
@@ -40,8 +40,8 @@ async def detailed_health_check() -> Dict[str, Any]:
     config_ok = all([
         settings.supabase_url and settings.supabase_url != "https://tuproyecto.supabase.co",
         settings.gemini_api_key and settings.gemini_api_key.startswith("AIza"),
-        settings.whatsapp_cloud_token and len(settings.whatsapp_cloud_token) > 20,
-        settings.verify_token and len(settings.verify_token) > 5
+        current_settings().whatsapp_access_token and len(current_settings().whatsapp_access_token) > 20,
+        settings.whatsapp_verify_token and len(settings.whatsapp_verify_token) > 5
     ])
     
     overall_status = "healthy" if config_ok else "degraded"
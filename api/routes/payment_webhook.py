@@ -172,9 +172,9 @@ async def _notify_user_premium_activated(user_id: str, activation_result: Dict):
         # Obtener info del usuario para enviar mensaje
         from core.supabase import supabase
         
-        user_result = supabase._get_client().table("users").select(
+        user_result = await supabase.execute(supabase.table("users").select(
             "whatsapp_number, name, adhd_language_preference"
-        ).eq("id", user_id).single().execute()
+        ).eq("id", user_id).single())
         
         if not user_result.data:
             logger.warning(f"Usuario {user_id} no encontrado para notificación")
@@ -239,9 +239,9 @@ async def get_payment_status(transaction_id: str):
     try:
         from core.supabase import supabase
         
-        result = supabase._get_client().table("payment_transactions").select("*").eq(
+        result = await supabase.execute(supabase.table("payment_transactions").select("*").eq(
             "transaction_id", transaction_id
-        ).execute()
+        ))
         
         if result.data:
             return {
@@ -5,6 +5,18 @@ Rutas para estadisticas
 from fastapi import APIRouter
 from typing import Dict, Any
 
+from services.message_queue import message_queue
+from services.message_dedup import message_dedup
+from services.message_coalescer import message_coalescer
+from services.album_collector import album_collector
+from core.supabase import supabase
+from services.gemini import gemini_service
+from services.expense_parser import expense_parser
+from services.temporal_resolver import temporal_resolver
+from services.intent_classifier import intent_classifier
+from services.media_cache import media_cache
+from services.media_fetcher import media_fetcher
+
 router = APIRouter()
 
 @router.get("/")
@@ -28,4 +40,24 @@ async def get_user_stats() -> Dict[str, Any]:
         "active_users": 0,
         "new_users_today": 0,
         "total_users": 0
-    }
\ No newline at end of file
+    }
+
+@router.get("/pipeline")
+async def get_pipeline_stats() -> Dict[str, Any]:
+    """
+    Metricas del pipeline de procesamiento de mensajes
+    """
+    return {
+        "message_queue": message_queue.get_stats(),
+        "message_dedup": message_dedup.get_stats(),
+        "message_coalescer": message_coalescer.get_stats(),
+        "album_collector": album_collector.get_stats(),
+        "supabase": supabase.get_stats(),
+        "schema": supabase.schema.get_stats(),
+        "gemini": gemini_service.get_stats(),
+        "expense_parser": expense_parser.get_stats(),
+        "temporal_resolver": temporal_resolver.get_stats(),
+        "intent_classifier": intent_classifier.get_stats(),
+        "media_cache": media_cache.get_stats(),
+        "media_fetcher": media_fetcher.get_stats()
+    }
@@ -1,11 +1,14 @@
 """
 Rutas para webhooks de WhatsApp usando WAHA
 """
-from fastapi import APIRouter, Request, BackgroundTasks
+from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import JSONResponse
 from loguru import logger
 from typing import Dict, Any
 
+from services.message_queue import message_queue, lane_key, QueueFullError
+from services.message_dedup import message_dedup
+
 
 router = APIRouter()
 
@@ -30,7 +33,7 @@ async def meta_webhook_verify(request: Request):
     return JSONResponse(content="Invalid verification", status_code=403)
 
 @router.post("/meta")
-async def meta_webhook_handler(request: Request, background_tasks: BackgroundTasks):
+async def meta_webhook_handler(request: Request):
     """
     Recibe mensajes y eventos de WhatsApp Cloud API (Meta)
     Documentación: https://developers.facebook.com/docs/whatsapp/cloud-api/webhooks/payload-examples/
@@ -44,26 +47,25 @@ async def meta_webhook_handler(request: Request, background_tasks: BackgroundTas
                 value = change.get("value", {})
                 messages = value.get("messages", [])
                 for message in messages:
-                    # Idempotencia: verificar si ya procesamos este mensaje
+                    # Idempotencia: cache en memoria compartido con /webhook/cloud
                     message_id = message.get("id")
-                    if message_id:
-                        from core.supabase import supabase
-                        try:
-                            existing = supabase._get_client().table("entries").select("id").eq(
-                                "id_meta", message_id
-                            ).execute()
-                            if existing.data:
-                                logger.info(f"⚠️ Mensaje duplicado ignorado: {message_id}")
-                                continue
-                        except Exception as e:
-                            logger.warning(f"Error verificando idempotencia Meta: {e}")
-                    # Procesar en background
-                    background_tasks.add_task(
-                        process_meta_message_async,
-                        message,
-                        value
-                    )
+                    if message_dedup.is_duplicate(message_id):
+                        continue
+                    # Procesar en background, en orden dentro del carril del usuario
+                    try:
+                        await message_queue.enqueue(
+                            lane_key(message.get("from")),
+                            process_meta_message_async,
+                            message,
+                            value
+                        )
+                    except QueueFullError:
+                        message_dedup.forget(message_id)
+                        raise
         return {"status": "accepted"}
+    except QueueFullError as e:
+        logger.error(f"❌ Webhook Meta rechazado, cola saturada: {e}")
+        raise HTTPException(status_code=503, detail="Message queue full")
     except Exception as e:
         logger.error(f"❌ Error en webhook Meta: {e}")
         return {"status": "error", "message": str(e)}
@@ -238,10 +240,7 @@ async def test_image_internal():
         }
 
 @router.post("")
-async def webhook_handler(
-    request: Request, 
-    background_tasks: BackgroundTasks
-) -> Dict[str, Any]:
+async def webhook_handler(request: Request) -> Dict[str, Any]:
     """
     Maneja webhooks de WAHA
     Documentación WAHA: https://waha.devlike.pro/docs/how-to/webhooks
@@ -272,32 +271,28 @@ async def webhook_handler(
             logger.info("⏭️ Ignorando mensaje propio")
             return {"status": "ignored", "reason": "own message"}
         
-        # IDEMPOTENCIA: Verificar si ya procesamos este mensaje
+        # IDEMPOTENCIA: Verificar si ya procesamos este mensaje (cache en memoria)
         message_id = payload.get("id")
-        if message_id:
-            # Verificar si ya existe en la DB
-            from core.supabase import supabase
-            try:
-                existing = supabase._get_client().table("entries").select("id").eq(
-                    "id_waha", message_id
-                ).execute()
-                
-                if existing.data:
-                    logger.info(f"⚠️ Mensaje duplicado ignorado: {message_id}")
-                    return {"status": "duplicate", "message_id": message_id}
-            except Exception as e:
-                logger.warning(f"Error verificando idempotencia: {e}")
-                # Continúa procesando si hay error en verificación
-        
-        # Procesar en background para respuesta rápida
-        background_tasks.add_task(
-            process_message_async,
-            payload,
-            session
-        )
+        if message_dedup.is_duplicate(message_id):
+            return {"status": "duplicate", "message_id": message_id}
+        
+        # Procesar en background para respuesta rápida (en orden por usuario)
+        try:
+            await message_queue.enqueue(
+                lane_key(payload.get("from")),
+                process_message_async,
+                payload,
+                session
+            )
+        except QueueFullError:
+            message_dedup.forget(message_id)
+            raise
         
         return {"status": "accepted", "timestamp": data.get("timestamp")}
         
+    except QueueFullError as e:
+        logger.error(f"❌ Webhook rechazado, cola saturada: {e}")
+        raise HTTPException(status_code=503, detail="Message queue full")
     except Exception as e:
         logger.error(f"❌ Error en webhook: {e}")
         return {"status": "error", "message": str(e)}
@@ -11,9 +11,14 @@ import hashlib
 import hmac
 import json
 
-from app.config import settings
+from app.config import current_settings, settings
 from handlers.message_handler import message_handler
 from services.whatsapp_cloud import whatsapp_cloud_service
+from services.message_queue import message_queue, lane_key, QueueFullError
+from services.message_dedup import message_dedup
+from services.message_coalescer import message_coalescer
+from services.album_collector import album_collector
+from services.media_fetcher import MediaFetchError, media_fetcher
 from core.supabase import supabase
 
 router = APIRouter()
@@ -154,23 +159,49 @@ async def handle_webhook(
                         for message_data in messages:
                             phone_number = message_data.get("from")
                             message_type = message_data.get("type")
+                            message_id = message_data.get("id")
+                            
+                            # Idempotencia: Meta reintenta entregas lentas con el mismo ID
+                            if message_dedup.is_duplicate(message_id):
+                                continue
                             
                             logger.info(f"Processing {message_type} message from {phone_number}")
                             
                             if phone_number:
-                                # MÓDULOS SEPARADOS POR TIPO
-                                if message_type == "text":
-                                    message_text = message_data.get("text", {}).get("body")
-                                    if message_text:
-                                        await process_text_message(phone_number, message_text, contact_name)
-                                elif message_type == "interactive":
-                                    await process_interactive_message(phone_number, message_data, contact_name)
-                                elif message_type == "image":
-                                    await process_image_message(phone_number, message_data, contact_name)
-                                elif message_type == "audio" or message_type == "voice":
-                                    await process_audio_message(phone_number, message_data, contact_name)
-                                else:
-                                    logger.warning(f"Message type {message_type} not supported yet")
+                                # MÓDULOS SEPARADOS POR TIPO (encolados en el carril del usuario)
+                                lane = lane_key(phone_number)
+                                message_text = message_data.get("text", {}).get("body") if message_type == "text" else None
+                                try:
+                                    if message_type != "image":
+                                        # Un álbum pendiente sale antes que cualquier otro mensaje
+                                        await album_collector.flush(lane)
+
+                                    if message_coalescer.accepts(message_text):
+                                        # Ráfagas de texto del mismo usuario se procesan como un solo mensaje
+                                        await message_coalescer.add(lane, message_text, process_text_message, phone_number, contact_name=contact_name)
+                                        continue
+
+                                    # Comandos y otros tipos: primero sale la ráfaga pendiente para conservar el orden
+                                    await message_coalescer.flush(lane)
+                                    if message_type == "text":
+                                        if message_text:
+                                            await message_queue.enqueue(lane, process_text_message, phone_number, message_text, contact_name)
+                                    elif message_type == "interactive":
+                                        await message_queue.enqueue(lane, process_interactive_message, phone_number, message_data, contact_name)
+                                    elif message_type == "image" and album_collector.enabled:
+                                        # Fotos seguidas (álbum) se procesan en una sola llamada
+                                        await album_collector.add(lane, message_data, process_image_messages, phone_number, contact_name=contact_name)
+                                    elif message_type == "image":
+                                        await message_queue.enqueue(lane, process_image_message, phone_number, message_data, contact_name)
+                                    elif message_type == "audio" or message_type == "voice":
+                                        await message_queue.enqueue(lane, process_audio_message, phone_number, message_data, contact_name)
+                                    else:
+                                        logger.warning(f"Message type {message_type} not supported yet")
+                                except QueueFullError:
+                                    # No se encoló: aceptar el reintento de Meta. Un álbum o
+                                    # ráfaga pendiente que no cupo sigue en su buffer
+                                    message_dedup.forget(message_id)
+                                    raise
                             else:
                                 logger.warning("Missing phone_number, skipping")
         
@@ -179,6 +210,10 @@ async def handle_webhook(
         
         return {"status": "ok"}
         
+    except QueueFullError as e:
+        # 503 para que Meta reintente la entrega más tarde
+        logger.error(f"Webhook rechazado, cola saturada: {e}")
+        raise HTTPException(status_code=503, detail="Message queue full")
     except Exception as e:
         logger.error(f"ERROR in webhook: {e}")
         return {"status": "error", "message": str(e)}
@@ -246,6 +281,37 @@ async def process_image_message(phone_number: str, message_data: dict, contact_n
             logger.error(f"Error sending error message: {send_error}")
         return {"status": "error", "message": str(e)}
 
+async def process_image_messages(phone_number: str, contact_name: str, messages: list):
+    """MÓDULO: Procesa imágenes agrupadas por AlbumCollector (una sola o un álbum)"""
+    if len(messages) == 1:
+        return await process_image_message(phone_number, messages[0], contact_name)
+
+    try:
+        logger.info(f"ALBUM MODULE: Starting processing of {len(messages)} images for {phone_number}")
+
+        # Obtener o crear usuario en Supabase con contexto completo (incluye perfil)
+        user = await supabase.get_user_with_context(phone_number)
+        logger.info(f"ALBUM MODULE: User obtained/created: {user.get('id', 'temp')}")
+
+        images = []
+        for message_data in messages:
+            image_data = message_data.get("image", {})
+            images.append({"media": image_data, "caption": image_data.get("caption", "")})
+
+        result = await message_handler.handle_album(images, user)
+        logger.info(f"ALBUM MODULE: Result: {result.get('status', 'unknown')}")
+
+        return result
+
+    except Exception as e:
+        logger.error(f"ALBUM MODULE ERROR: {e}")
+        # Fallback - enviar mensaje de error
+        try:
+            await send_message_simple(phone_number, f"Error procesando imágenes: {str(e)}")
+        except Exception as send_error:
+            logger.error(f"Error sending error message: {send_error}")
+        return {"status": "error", "message": str(e)}
+
 async def process_audio_message(phone_number: str, message_data: dict, contact_name: str):
     """MÓDULO: Procesa mensajes de audio"""
     try:
@@ -607,18 +673,11 @@ async def send_message_simple(phone_number: str, message: str):
         
         import httpx
         
-        # Clean token (remove any extra spaces or newlines)
-        clean_token = settings.whatsapp_cloud_token.strip()
-        
-        url = f"https://graph.facebook.com/v18.0/{settings.whatsapp_phone_number_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {clean_token}",
-            "Content-Type": "application/json"
-        }
+        # URL y headers del snapshot de configuración (token ya limpio)
+        base_url, headers = whatsapp_cloud_service._get_base_url(), dict(whatsapp_cloud_service._get_headers())
+        url = f"{base_url}/messages"
         
-        print(f"13.1. Using token length: {len(clean_token)} chars")
-        print(f"13.2. Token starts with: {clean_token[:50]}...")
-        print(f"13.3. Using phone_number_id: {settings.whatsapp_phone_number_id}")
+        print(f"13.1. Using URL: {url}")
         payload = {
             "messaging_product": "whatsapp",
             "to": phone_number,
@@ -851,14 +910,11 @@ async def send_whatsapp_message(
         import aiohttp
         
         # URL de la API
-        phone_id = phone_number_id or getattr(settings, 'whatsapp_phone_number_id', 'YOUR_PHONE_NUMBER_ID')
+        phone_id = phone_number_id or current_settings().whatsapp_phone_number_id
         url = f"https://graph.facebook.com/v18.0/{phone_id}/messages"
         
-        # Headers
-        headers = {
-            "Authorization": f"Bearer {settings.whatsapp_cloud_token}",
-            "Content-Type": "application/json"
-        }
+        # Headers con el token del snapshot vigente
+        headers = dict(whatsapp_cloud_service._get_headers())
         
         # Payload
         payload = {
@@ -912,40 +968,22 @@ def verify_webhook_signature(payload: bytes, signature: str, app_secret: str) ->
         return False
 
 
-# Funciones de utilidad para el handler anterior
+# Funciones de utilidad para el handler anterior (ver services.media_fetcher)
 async def get_media_url(media_id: str) -> str:
-    """Obtiene URL de media usando Cloud API"""
+    """Obtiene URL de media usando Cloud API ("" si falla)"""
     try:
-        import aiohttp
-        
-        url = f"https://graph.facebook.com/v18.0/{media_id}"
-        headers = {"Authorization": f"Bearer {settings.whatsapp_cloud_token}"}
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get("url", "")
-                    
-        return ""
-    except:
+        return await media_fetcher.get_media_url(media_id)
+    except MediaFetchError as e:
+        logger.error(f"❌ Error obteniendo URL de media {media_id}: {e}")
         return ""
 
 
 async def download_media(media_url: str) -> bytes:
-    """Descarga archivo de media"""
+    """Descarga archivo de media (b"" si falla)"""
     try:
-        import aiohttp
-        
-        headers = {"Authorization": f"Bearer {settings.whatsapp_cloud_token}"}
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(media_url, headers=headers) as response:
-                if response.status == 200:
-                    return await response.read()
-                    
-        return b""
-    except:
+        return await media_fetcher.download(media_url)
+    except MediaFetchError as e:
+        logger.error(f"❌ Error descargando media: {e}")
         return b""
 
 
@@ -1032,22 +1070,13 @@ async def test_connection():
     Endpoint para probar la conexión con WhatsApp Cloud API
     """
     try:
-        # DEBUG: Log token info
-        logger.info(f"DEBUG Token length: {len(settings.whatsapp_cloud_token)}")
-        logger.info(f"DEBUG Token start: {settings.whatsapp_cloud_token[:50]}...")
-        logger.info(f"DEBUG Phone ID: {settings.whatsapp_phone_number_id}")
-        
         # Hacer una petición simple para verificar credenciales
         import httpx
         
-        url = f"https://graph.facebook.com/v18.0/{settings.whatsapp_phone_number_id}"
-        clean_token = settings.whatsapp_cloud_token.strip()
-        headers = {
-            "Authorization": f"Bearer {clean_token}",
-        }
+        url = whatsapp_cloud_service._get_base_url()
+        headers = {"Authorization": whatsapp_cloud_service._get_headers()["Authorization"]}
         
         logger.info(f"DEBUG URL: {url}")
-        logger.info(f"DEBUG Headers: {headers}")
         
         async with httpx.AsyncClient() as client:
             response = await client.get(url, headers=headers)
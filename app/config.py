@@ -2,7 +2,7 @@
 Configuración usando Pydantic Settings para validación
 """
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import List, Optional
 from functools import lru_cache
 
 class Settings(BaseSettings):
@@ -49,7 +49,98 @@ class Settings(BaseSettings):
     google_client_secret: Optional[str] = None
     base_url: str = "http://localhost:8000/"
     encryption_master_key: Optional[str] = None
-    
+
+    # Capa de datos Supabase
+    supabase_max_workers: int = 10  # Hilos dedicados a consultas PostgREST
+    supabase_query_timeout: float = 10.0  # Segundos máximos por consulta
+    supabase_measure_payloads: bool = False  # Registrar bytes/filas devueltos por consulta
+    supabase_rpc_retry_seconds: int = 600  # Espera antes de volver a probar get_request_context si no existe
+    user_cache_max_size: int = 5000  # Usuarios/perfiles en memoria
+    user_cache_ttl_seconds: int = 300  # Vigencia de usuario y perfil cacheados
+
+    # Router de modelos Gemini para texto
+    gemini_fast_model: str = "gemini-1.5-flash"  # Primer intento (también usado para imágenes)
+    gemini_pro_model: str = "gemini-1.5-pro"  # Escalamiento y audio
+    gemini_router_enabled: bool = True  # False = todo el texto va directo al modelo pro
+    gemini_route_max_chars: int = 280  # Mensajes más largos van directo a pro
+    gemini_route_max_clauses: int = 3  # Líneas/frases/ítems antes de ir directo a pro
+    gemini_route_min_confidence: float = 0.6  # Confianza mínima del modelo rápido para aceptar su respuesta
+    gemini_fast_timeout: float = 15.0  # Segundos para el modelo rápido antes de escalar
+    gemini_max_in_flight: int = 8  # Llamadas simultáneas a Gemini; el resto espera en cola
+    gemini_executor_workers: int = 4  # Hilos para llamadas que el SDK solo ofrece síncronas
+    gemini_native_async: bool = True  # Usar generate_content_async del SDK cuando exista
+    gemini_prompt_token_budget: int = 600  # Tokens máximos de la sección por usuario (perfil, contexto y mensaje)
+    gemini_json_mode: bool = True  # Pedir application/json si el SDK lo soporta (google-generativeai >= 0.4)
+    gemini_message_deadline: float = 30.0  # SLO por mensaje: modelo rápido, escalamiento y hedge comparten este presupuesto
+    gemini_min_call_budget: float = 3.0  # Segundos mínimos restantes para lanzar otra llamada (escalamiento o hedge)
+    gemini_hedge_enabled: bool = False  # Segunda llamada si la primera tarda más que el percentil configurado
+    gemini_hedge_model: str = "fast"  # Modelo del hedge: "fast" (más barato) o "same"
+    gemini_hedge_percentile: float = 0.9  # Percentil de latencia de la ruta que dispara el hedge
+    gemini_hedge_default_delay: float = 4.0  # Segundos de espera mientras la ruta tiene pocas muestras
+    gemini_hedge_min_samples: int = 20  # Muestras de latencia antes de usar el percentil
+    gemini_extra_api_keys: str = ""  # Keys adicionales separadas por comas; se suman a gemini_api_key en el pool
+    gemini_fast_rpm: int = 1000  # Requests por minuto por key del modelo rápido
+    gemini_fast_tpm: int = 4000000  # Tokens por minuto por key del modelo rápido
+    gemini_pro_rpm: int = 360  # Requests por minuto por key del modelo pro
+    gemini_pro_tpm: int = 4000000  # Tokens por minuto por key del modelo pro
+    gemini_quota_headroom: float = 0.9  # Fracción del límite usable antes de esperar o degradar
+    gemini_quota_max_wait: float = 5.0  # Segundos en cola esperando cupo antes de degradar
+    gemini_inline_audio_max_bytes: int = 4000000  # Notas de voz más grandes se suben como archivo (si el SDK lo permite)
+
+    # Preprocesamiento de imágenes antes de Gemini
+    image_max_edge: int = 1536  # Píxeles del lado mayor (recibos siguen legibles)
+    image_format: str = "JPEG"  # JPEG, WEBP o PNG
+    image_quality: int = 85  # Calidad de recompresión (JPEG/WEBP)
+    image_workers: int = 2  # Hilos para decodificar/redimensionar con PIL
+
+    # Descarga de media de WhatsApp (pool compartido, por bloques)
+    media_fetch_pool_size: int = 20  # Conexiones simultáneas a Graph API / CDN
+    media_fetch_timeout: float = 30.0  # Segundos por intento (URL o descarga completa)
+    media_fetch_connect_timeout: float = 5.0
+    media_fetch_max_bytes: int = 16000000  # Límite de WhatsApp para audio; imágenes llegan a 5MB
+    media_spool_memory_bytes: int = 2000000  # Por encima el buffer pasa a disco
+    media_fetch_retries: int = 2  # Reintentos ante 429/5xx, timeouts o conexiones caídas
+    media_fetch_backoff: float = 0.5  # Segundos antes del primer reintento (se duplica)
+
+    # Cache por contenido de imágenes y notas de voz reenviadas
+    media_cache_enabled: bool = True
+    media_cache_size: int = 1000  # Archivos recordados en total
+    media_cache_ttl_seconds: int = 3600  # Corto: fechas relativas ("ayer") se resolvieron al primer envío
+    media_cache_perceptual: bool = False  # También por dHash: comprobantes de la misma plantilla pueden coincidir
+    media_cache_phash_max_distance: int = 6  # Bits distintos (de 256) para considerar la misma imagen
+
+    # Atajo sin LLM para gastos/ingresos simples
+    intents_path: str = "config/intents.json"  # Saludos, gracias y comandos sin slash
+    expense_parser_enabled: bool = True  # False = todo mensaje pasa por Gemini
+    expense_parser_min_confidence: float = 0.8  # Confianza mínima para omitir el LLM
+    temporal_resolver_enabled: bool = True  # Recordatorios simples sin LLM y corrección de fechas del LLM
+
+    # Contexto de prompts de Gemini por usuario
+    prompt_context_cache_size: int = 2000  # Usuarios con contexto derivado en memoria
+    prompt_context_ttl_seconds: int = 120  # Vigencia máxima (los cambios en entries lo invalidan antes)
+
+    # Cola de procesamiento de mensajes entrantes
+    message_workers: int = 4  # Workers concurrentes que drenan la cola
+    message_queue_max_size: int = 500  # Mensajes en espera antes de rechazar (503)
+    message_queue_drain_timeout: float = 25.0  # Segundos para drenar la cola al apagar
+    message_max_lanes: int = 200  # Usuarios distintos con mensajes en espera
+    message_lane_max_backlog: int = 20  # Mensajes en espera por usuario
+
+    # Idempotencia de mensajes entrantes
+    message_dedup_max_size: int = 20000  # IDs recordados
+    message_dedup_ttl_seconds: int = 86400  # Ventana de reintentos cubierta
+    message_dedup_snapshot_path: Optional[str] = None  # ej. "data/seen_messages.json" para sobrevivir reinicios
+    message_dedup_snapshot_interval_seconds: float = 30.0  # Guardado periódico del snapshot (0 = solo al apagar)
+
+    # Agrupación de ráfagas de texto por usuario (0 = desactivado)
+    message_coalesce_window_seconds: float = 0.0  # Espera sin mensajes nuevos antes de procesar
+    message_coalesce_max_messages: int = 5  # Mensajes por ráfaga antes de procesar sin esperar
+    message_buffer_requeue_limit: int = 3  # Ventanas extra para reintentar una ráfaga/álbum rechazado por cola llena
+
+    # Álbumes: imágenes seguidas del mismo usuario en una sola llamada (0 = desactivado)
+    image_album_window_seconds: float = 2.0  # WhatsApp entrega cada foto del álbum como un mensaje aparte
+    image_album_max_images: int = 10  # Imágenes por álbum antes de procesar sin esperar
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -58,12 +149,44 @@ class Settings(BaseSettings):
     )
 
 def get_settings() -> Settings:
-    """Get settings (no cache in development)"""
+    """Lee .env y valida una instancia nueva (costoso: usar current_settings en rutas calientes)"""
     # Force reload .env file
     import os
     from dotenv import load_dotenv
     load_dotenv(override=True)  # This forces reload
     return Settings()
 
-# Create fresh instance every time
-settings = get_settings()
\ No newline at end of file
+# Snapshot leído al arrancar; reload_settings() lo reemplaza
+settings = get_settings()
+_snapshot = settings
+_reloads = 0
+
+
+def current_settings() -> Settings:
+    """Snapshot vigente de la configuración, sin leer .env ni validar de nuevo"""
+    return _snapshot
+
+
+def reload_settings() -> List[str]:
+    """
+    Relee .env y reemplaza el snapshot con una sola asignación (rotación de
+    tokens). Si la validación falla se lanza el error y sigue el anterior.
+
+    Solo lo que se lee con current_settings() (credenciales de WhatsApp)
+    toma los valores nuevos; el resto de `settings` requiere reiniciar.
+
+    Returns:
+        Nombres de los campos que cambiaron (sin sus valores)
+    """
+    global _snapshot, _reloads
+    previous = _snapshot
+    fresh = get_settings()
+    _snapshot = fresh
+    _reloads += 1
+    old, new = previous.model_dump(), fresh.model_dump()
+    return sorted(name for name in new if old.get(name) != new[name])
+
+
+def settings_reloads() -> int:
+    """Veces que se recargó la configuración desde el arranque"""
+    return _reloads
\ No newline at end of file
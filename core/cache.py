@@ -0,0 +1,94 @@
+"""
+Cache en memoria con TTL y límite de tamaño (LRU)
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterator, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Cache LRU acotado por tamaño donde cada entrada expira tras `ttl_seconds`.
+    Lleva contadores de aciertos/fallos para exponer la tasa de acierto.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, name: str = "cache"):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Devuelve el valor vigente o `default`, contando acierto/fallo"""
+        item = self._data.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Guarda un valor, desalojando el menos usado si se excede el tamaño"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._data[key] = (time.time() + ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def set_until(self, key: Hashable, value: Any, expires_at: float) -> None:
+        """Guarda un valor con expiración absoluta (epoch), usado al restaurar snapshots"""
+        if expires_at > time.time():
+            self.set(key, value, ttl_seconds=expires_at - time.time())
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Como `get` pero sin afectar contadores ni el orden LRU"""
+        item = self._data.get(key)
+        if item is not None and item[0] > time.time():
+            return item[1]
+        return default
+
+    def delete(self, key: Hashable) -> None:
+        """Elimina una entrada si existe"""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Vacía el cache (los contadores se mantienen)"""
+        self._data.clear()
+
+    def items(self) -> Iterator[Tuple[Hashable, Any, float]]:
+        """Entradas vigentes como (clave, valor, expira_en_epoch)"""
+        now = time.time()
+        for key, (expires_at, value) in list(self._data.items()):
+            if expires_at > now:
+                yield key, value, expires_at
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and item[0] > time.time()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores y tasa de acierto"""
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
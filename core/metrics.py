@@ -0,0 +1,57 @@
+"""
+Métricas en memoria: histogramas de latencia para /api/stats
+"""
+import bisect
+from typing import Any, Dict, List, Optional, Sequence
+
+# Límites superiores (ms) pensados para llamadas a modelos y APIs externas
+DEFAULT_LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 15000, 30000)
+
+
+class LatencyHistogram:
+    """
+    Histograma de latencias con buckets fijos. Los percentiles se estiman
+    con el límite superior del bucket donde caen, suficiente para comparar
+    rutas y ajustar umbrales sin guardar cada muestra.
+    """
+
+    def __init__(self, buckets_ms: Optional[Sequence[float]] = None):
+        self.bounds: List[float] = sorted(buckets_ms or DEFAULT_LATENCY_BUCKETS_MS)
+        # Un bucket extra para todo lo que excede el último límite
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms: float) -> None:
+        """Registra una muestra en milisegundos"""
+        self.counts[bisect.bisect_left(self.bounds, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, q: float) -> float:
+        """Límite superior del bucket que contiene el percentil `q` (0-1)"""
+        if not self.count:
+            return 0.0
+
+        target = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target and bucket_count:
+                return self.bounds[index] if index < len(self.bounds) else self.max_ms
+        return self.max_ms
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Resumen y conteo por bucket ("<=1000", ">30000", ...)"""
+        buckets = {f"<={bound:g}": count for bound, count in zip(self.bounds, self.counts)}
+        buckets[f">{self.bounds[-1]:g}"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(self.max_ms, 2),
+            "buckets": buckets
+        }
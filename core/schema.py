@@ -0,0 +1,107 @@
+"""
+Registro de columnas disponibles por tabla (descubierto al iniciar)
+"""
+from typing import Any, Dict, Iterable, Optional, Set
+from loguru import logger
+
+# Tablas cuyos payloads de escritura dependen de columnas opcionales
+SCHEMA_TABLES = ("entries", "users", "user_profiles", "ai_insights")
+
+_ENTRY_FINANCE = ("id", "type", "amount", "category", "description", "datetime", "status")
+_ENTRY_AGENDA = (
+    "id", "type", "description", "datetime", "datetime_end", "status", "priority",
+    "task_category", "external_id", "external_service"
+)
+
+# Proyecciones con nombre para las consultas calientes (en lugar de select("*"))
+PROJECTIONS: Dict[str, Dict[str, tuple]] = {
+    "entries": {
+        # Gastos/ingresos: totales, categorías y último movimiento
+        "finance": _ENTRY_FINANCE,
+        # Tareas/eventos: listados, botones y sincronización externa
+        "agenda": _ENTRY_AGENDA,
+        # Resúmenes que mezclan ambos (today, monthly)
+        "overview": tuple(dict.fromkeys(_ENTRY_FINANCE + _ENTRY_AGENDA)),
+        # Mensajes automáticos del scheduler
+        "reminder": ("type", "description", "datetime", "priority"),
+        # Ventana única para el contexto del prompt de Gemini
+        "prompt_context": ("type", "amount", "category", "description", "datetime")
+    }
+}
+
+
+class SchemaRegistry:
+    """
+    Columnas conocidas de cada tabla. Se llena una vez al iniciar
+    (`SupabaseService.load_schema`) y se puede refrescar manualmente, de modo
+    que las escrituras ajustan sus payloads sin consultar la BD para saber
+    si una columna existe.
+
+    Una tabla sin información se trata como desconocida: `has_column`
+    devuelve None y `shape` deja el payload intacto.
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, Set[str]] = {}
+        self.sources: Dict[str, str] = {}
+        self.dropped: Dict[str, Set[str]] = {}
+        self.loaded_at: Optional[str] = None
+
+    def set_columns(self, table: str, columns: Iterable[str], source: str) -> None:
+        """Registra las columnas de una tabla y de dónde se obtuvieron"""
+        self.tables[table] = set(columns)
+        self.sources[table] = source
+
+    def columns(self, table: str) -> Optional[Set[str]]:
+        """Columnas de la tabla o None si no se conocen"""
+        return self.tables.get(table)
+
+    def has_column(self, table: str, column: str) -> Optional[bool]:
+        """True/False si la tabla es conocida, None si no hay información"""
+        columns = self.tables.get(table)
+        if columns is None:
+            return None
+        return column in columns
+
+    def select(self, table: str, projection: str) -> str:
+        """
+        Columnas de la proyección `projection` como string para `select()`,
+        limitadas a las columnas existentes. Sin schema conocido devuelve "*"
+        para no pedir una columna inexistente.
+        """
+        columns = PROJECTIONS[table][projection]
+        known = self.tables.get(table)
+        if known is None:
+            return "*"
+        return ", ".join(column for column in columns if column in known)
+
+    def shape(self, table: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Quita del payload las claves que no son columnas de la tabla"""
+        columns = self.tables.get(table)
+        if columns is None:
+            return payload
+
+        unknown = set(payload) - columns
+        if not unknown:
+            return payload
+
+        new_keys = unknown - self.dropped.setdefault(table, set())
+        if new_keys:
+            self.dropped[table] |= new_keys
+            logger.warning(f"Schema: columnas inexistentes en {table} omitidas: {sorted(new_keys)}")
+
+        return {key: value for key, value in payload.items() if key in columns}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Tablas conocidas, origen de la información y claves omitidas"""
+        return {
+            "loaded_at": self.loaded_at,
+            "tables": {
+                table: {
+                    "columns": len(columns),
+                    "source": self.sources.get(table),
+                    "dropped_keys": sorted(self.dropped.get(table, set()))
+                }
+                for table, columns in self.tables.items()
+            }
+        }
@@ -1,11 +1,18 @@
 """
 Schemas para validacion de datos con Pydantic
 """
-from pydantic import BaseModel, Field
+import math
+import re
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
 
+from services.expense_parser import parse_number
+
+# Monto en texto: dígitos con separadores de miles/decimales ("18.500", "1.250,50")
+AMOUNT_TEXT = re.compile(r"-?\d[\d.,]*")
+
 class MessageType(str, Enum):
     """Tipos de mensaje soportados"""
     text = "text"
@@ -99,7 +106,7 @@ class GeminiEntryResponse(BaseModel):
     type: EntryType
     description: str = Field(..., min_length=1, max_length=500)
     amount: Optional[float] = Field(None, ge=0)
-    datetime: str  # ISO format
+    datetime: Optional[str] = None  # ISO format; tareas sin fecha no lo traen
     datetime_end: Optional[str] = None  # ISO format
     priority: Priority = Priority.media
     recurrence: str = "none"
@@ -107,9 +114,86 @@ class GeminiEntryResponse(BaseModel):
     remember: Optional[str] = None  # ISO format
     task_category: Optional[str] = Field(None, max_length=50)
     status: Status = Status.pending
+    confidence: Optional[float] = Field(None, ge=0, le=1)  # Usado por el router de modelos
     
     class Config:
-        extra = 'forbid'
+        extra = 'ignore'  # Campos de más del modelo no invalidan la respuesta
+
+    # Respuestas casi correctas del modelo se normalizan en vez de rechazarse:
+    # solo un JSON inválido o un `type` desconocido justifican el fallback
+
+    @field_validator("amount", mode="before")
+    @classmethod
+    def _normalize_amount(cls, value):
+        """
+        Montos negativos (gasto como salida) se toman en valor absoluto y el
+        texto ("₡18.500") se lee con los separadores de `parse_number`;
+        inf/nan o texto que no es un número invalidan la respuesta
+        """
+        if value is None or isinstance(value, bool):
+            return None
+        if isinstance(value, str):
+            number = re.sub(r"₡|colones|\s", "", value.lower())
+            if not number:
+                return None
+            if not AMOUNT_TEXT.fullmatch(number):
+                raise ValueError(f"monto no numérico: {value!r}")
+            value = -parse_number(number[1:]) if number.startswith("-") else parse_number(number)
+        if not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"monto inválido: {value!r}")
+        return abs(value)
+
+    @field_validator("recurrence", mode="before")
+    @classmethod
+    def _default_recurrence(cls, value):
+        return value or "none"
+
+    @field_validator("priority", mode="before")
+    @classmethod
+    def _normalize_priority(cls, value):
+        aliases = {"high": "alta", "urgent": "alta", "medium": "media", "normal": "media", "low": "baja"}
+        value = str(value or "").strip().lower()
+        value = aliases.get(value, value)
+        return value if value in Priority.__members__ else Priority.media
+
+    @field_validator("status", mode="before")
+    @classmethod
+    def _normalize_status(cls, value):
+        aliases = {"pendiente": "pending", "completada": "completed", "completado": "completed",
+                   "done": "completed", "cancelada": "cancelled", "cancelado": "cancelled", "canceled": "cancelled"}
+        value = str(value or "").strip().lower()
+        value = aliases.get(value, value)
+        return value if value in Status.__members__ else Status.pending
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _clamp_confidence(cls, value):
+        """Acepta porcentajes (85 -> 0.85); lo que no es un número se ignora"""
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+        if value != value:  # NaN
+            return None
+        if 1 < value <= 100:
+            value /= 100
+        return min(max(value, 0.0), 1.0)
+
+class GeminiAudioEntryResponse(GeminiEntryResponse):
+    """Respuesta de Gemini para notas de voz: la entry más su transcripción"""
+    transcription: str = Field("", max_length=4000)
+
+class GeminiImageEntryResponse(GeminiEntryResponse):
+    """Respuesta de Gemini para imágenes: la entry más el texto/contexto extraído"""
+    extracted_text: str = Field("", max_length=4000)
+
+class GeminiAlbumEntry(GeminiImageEntryResponse):
+    """Entry de una imagen dentro de un álbum"""
+    image: int = Field(1, ge=1)  # Posición de la imagen (1..N)
+
+class GeminiAlbumResponse(BaseModel):
+    """Respuesta de Gemini para un álbum: una entry por imagen"""
+    entries: List[GeminiAlbumEntry] = Field(..., min_length=1)
 
 # Entry Database Schemas
 class EntryCreate(BaseModel):
@@ -2,30 +2,230 @@
 Cliente Supabase mejorado con manejo de errores
 """
 from supabase import create_client, Client
-from typing import Optional, List, Dict, Any
+from supabase.lib.client_options import ClientOptions
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import json
+import time
 from datetime import datetime, timedelta
 import pytz
 from loguru import logger
 from app.config import settings
+from core.cache import TTLCache
+from core.schema import SchemaRegistry, SCHEMA_TABLES
+
+# Códigos de "función no existe": solo estos desactivan get_request_context
+RPC_MISSING_FUNCTION_CODES = ("PGRST202", "42883")
 
 class SupabaseService:
     def __init__(self):
         self.client: Optional[Client] = None
         self.tz = pytz.timezone(settings.timezone)
+        # supabase-py es síncrono: las consultas corren en un pool propio y acotado
+        # para no bloquear el event loop ni competir con el executor por defecto
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.supabase_max_workers,
+            thread_name_prefix="supabase"
+        )
+        # Usuarios y perfiles por id; el índice por teléfono solo guarda el id
+        # (el teléfono no cambia) para que invalidar por id baste
+        self.user_cache = TTLCache(settings.user_cache_max_size, settings.user_cache_ttl_seconds, name="users")
+        self.phone_index = TTLCache(settings.user_cache_max_size, settings.user_cache_ttl_seconds, name="user_phone_index")
+        self.profile_cache = TTLCache(settings.user_cache_max_size, settings.user_cache_ttl_seconds, name="user_profiles")
+        # Contexto de request (plan, límites, integraciones) por user_id
+        self.context_cache = TTLCache(settings.user_cache_max_size, settings.user_cache_ttl_seconds, name="request_context")
+        self.request_context_rpc = True  # Se desactiva si la función SQL no está desplegada
+        self.request_context_rpc_retry_at: Optional[float] = None  # Cuándo volver a probarla (monotonic)
+        # Columnas por tabla, descubiertas al iniciar (ver load_schema)
+        self.schema = SchemaRegistry()
+        # Callbacks(user_id) para caches derivados de `entries` (p.ej. contexto de prompts)
+        self.entry_listeners: List[Callable[[str], None]] = []
+        self.payload_stats: Dict[str, Dict[str, int]] = {}  # Solo con supabase_measure_payloads
+        self.stats = {
+            "queries": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0
+        }
         
     def _get_client(self) -> Client:
         """Lazy initialization del cliente Supabase"""
         if self.client is None:
             try:
+                # Un solo cliente: el PostgREST interno reutiliza su pool de conexiones HTTP
                 self.client = create_client(
                     settings.supabase_url,
-                    settings.supabase_key
+                    settings.supabase_key,
+                    options=ClientOptions(postgrest_client_timeout=settings.supabase_query_timeout)
                 )
                 logger.info("Cliente Supabase inicializado")
             except Exception as e:
                 logger.warning(f"No se pudo conectar a Supabase: {e}")
                 raise
         return self.client
+    
+    # Acceso a datos
+    def table(self, table_name: str):
+        """Query builder de una tabla; ejecutar siempre con `await supabase.execute(...)`"""
+        return self._get_client().table(table_name)
+    
+    def select(self, table_name: str, projection: str):
+        """Query builder con una proyección con nombre (ver core.schema.PROJECTIONS)"""
+        return self.table(table_name).select(self.schema.select(table_name, projection))
+    
+    def rpc(self, function_name: str, params: Optional[Dict[str, Any]] = None):
+        """Query builder de una función RPC; ejecutar con `await supabase.execute(...)`"""
+        return self._get_client().rpc(function_name, params or {})
+    
+    async def execute(self, query, timeout: Optional[float] = None):
+        """
+        Ejecuta un query builder de supabase-py en el pool de Supabase
+        
+        Args:
+            query: Builder devuelto por `table(...)` o `rpc(...)` con sus filtros
+            timeout: Segundos máximos de espera (por defecto `supabase_query_timeout`)
+            
+        Raises:
+            asyncio.TimeoutError: si la consulta excede el timeout
+        """
+        timeout = timeout or settings.supabase_query_timeout
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(self.executor, query.execute),
+                timeout=timeout
+            )
+            if settings.supabase_measure_payloads:
+                self._measure_payload(query, result)
+            return result
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.warning(f"Consulta Supabase excedió {timeout}s")
+            raise
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            elapsed_ms = (time.monotonic() - started) * 1000
+            self.stats["queries"] += 1
+            self.stats["total_ms"] += elapsed_ms
+            self.stats["max_ms"] = max(self.stats["max_ms"], elapsed_ms)
+    
+    def _measure_payload(self, query, result) -> None:
+        """Modo medición: registra filas y bytes JSON devueltos por consulta"""
+        data = getattr(result, "data", None)
+        if data is None:
+            return
+        
+        params = getattr(query, "params", None)
+        select = params.get("select", "") if params is not None else ""
+        label = f"{getattr(query, 'path', '?')} select={select or '*'}"
+        size = len(json.dumps(data, default=str).encode("utf-8"))
+        rows = len(data) if isinstance(data, list) else 1
+        
+        entry = self.payload_stats.setdefault(label, {"queries": 0, "rows": 0, "bytes": 0})
+        entry["queries"] += 1
+        entry["rows"] += rows
+        entry["bytes"] += size
+        logger.info(f"Supabase payload: {label} filas={rows} bytes={size}")
+    
+    async def load_schema(self, tables: tuple = SCHEMA_TABLES) -> Dict[str, Any]:
+        """
+        Descubre las columnas de `tables` desde la especificación OpenAPI de
+        PostgREST; las tablas que no aparezcan se sondean con una fila.
+        Se ejecuta al iniciar y desde el endpoint de refresco manual.
+        """
+        definitions = {}
+        try:
+            session = self._get_client().postgrest.session
+            loop = asyncio.get_running_loop()
+            response = await asyncio.wait_for(
+                loop.run_in_executor(self.executor, session.get, "/"),
+                timeout=settings.supabase_query_timeout
+            )
+            response.raise_for_status()
+            definitions = response.json().get("definitions", {})
+        except Exception as e:
+            logger.warning(f"Schema: no se pudo leer OpenAPI de PostgREST: {e}")
+        
+        for table in tables:
+            properties = definitions.get(table, {}).get("properties")
+            if properties:
+                self.schema.set_columns(table, properties.keys(), "openapi")
+                continue
+            
+            try:
+                result = await self.execute(self.table(table).select("*").limit(1))
+                if result.data:
+                    self.schema.set_columns(table, result.data[0].keys(), "sample_row")
+                else:
+                    logger.warning(f"Schema: {table} sin filas, columnas desconocidas")
+            except Exception as e:
+                logger.warning(f"Schema: no se pudo sondear {table}: {e}")
+        
+        self.schema.loaded_at = datetime.now(self.tz).isoformat()
+        logger.info(f"Schema cargado: {', '.join(f'{t}({len(c)})' for t, c in self.schema.tables.items())}")
+        return self.schema.get_stats()
+    
+    def shutdown(self):
+        """Libera el pool de consultas al apagar la aplicación"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas de la capa de datos"""
+        return {
+            **self.stats,
+            "workers": self.executor._max_workers,
+            "query_timeout": settings.supabase_query_timeout,
+            "avg_ms": round(self.stats["total_ms"] / self.stats["queries"], 2) if self.stats["queries"] else 0.0,
+            "payloads": self.payload_stats,
+            "caches": {
+                "users": self.user_cache.get_stats(),
+                "phone_index": self.phone_index.get_stats(),
+                "profiles": self.profile_cache.get_stats(),
+                "request_context": self.context_cache.get_stats()
+            }
+        }
+    
+    # Cache de usuarios
+    def _cache_user(self, user: Dict[str, Any], phone: Optional[str] = None) -> None:
+        """Guarda el usuario por id y, si se conoce, indexa su teléfono"""
+        self.user_cache.set(user["id"], user)
+        phone = ''.join(filter(str.isdigit, phone or user.get("whatsapp_number") or ""))
+        if phone:
+            self.phone_index.set(phone, user["id"])
+    
+    def invalidate_user(self, user_id: str) -> None:
+        """Descarta el usuario cacheado tras escribir en `users`"""
+        self.user_cache.delete(user_id)
+        self.context_cache.delete(user_id)
+    
+    def invalidate_profile(self, user_id: str) -> None:
+        """Descarta el perfil cacheado tras escribir en `user_profiles`"""
+        self.profile_cache.delete(user_id)
+        self.context_cache.delete(user_id)
+    
+    def invalidate_request_context(self, user_id: str) -> None:
+        """Descarta plan/límites/integraciones cacheados (nueva tarea, integración modificada)"""
+        self.context_cache.delete(user_id)
+    
+    def on_entries_changed(self, callback: Callable[[str], None]) -> None:
+        """Registra un callback que recibe el user_id cuando cambian sus entries"""
+        self.entry_listeners.append(callback)
+    
+    def notify_entries_changed(self, user_id: Optional[str]) -> None:
+        """Avisa a los caches derivados que las entries del usuario cambiaron"""
+        if not user_id:
+            return
+        for callback in self.entry_listeners:
+            try:
+                callback(user_id)
+            except Exception as e:
+                logger.warning(f"Error notificando cambio de entries: {e}")
         
     # Usuario methods
     async def get_user_by_phone(self, phone: str) -> Optional[Dict[str, Any]]:
@@ -34,21 +234,29 @@ class SupabaseService:
             # Limpiar número
             clean_phone = ''.join(filter(str.isdigit, phone))
             
+            user_id = self.phone_index.get(clean_phone)
+            if user_id:
+                cached = self.user_cache.get(user_id)
+                if cached:
+                    return dict(cached)
+            
             # Intentar buscar con número limpio primero (nuevo formato)
-            result = self._get_client().table("users").select("*").eq(
+            result = await self.execute(self.table("users").select("*").eq(
                 "whatsapp_number", clean_phone
-            ).execute()
+            ))
             
-            if result.data:
-                return result.data[0]
+            if not result.data:
+                # Si no encuentra, intentar con formato @c.us (formato legacy)
+                legacy_phone = f"{clean_phone}@c.us"
+                result = await self.execute(self.table("users").select("*").eq(
+                    "whatsapp_number", legacy_phone
+                ))
             
-            # Si no encuentra, intentar con formato @c.us (formato legacy)
-            legacy_phone = f"{clean_phone}@c.us"
-            result = self._get_client().table("users").select("*").eq(
-                "whatsapp_number", legacy_phone
-            ).execute()
+            if not result.data:
+                return None
             
-            return result.data[0] if result.data else None
+            self._cache_user(result.data[0], clean_phone)
+            return dict(result.data[0])
             
         except Exception as e:
             logger.error(f"Error buscando usuario: {e}")
@@ -57,11 +265,19 @@ class SupabaseService:
     async def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Busca usuario por ID"""
         try:
-            result = self._get_client().table("users").select("*").eq(
+            cached = self.user_cache.get(user_id)
+            if cached:
+                return dict(cached)
+            
+            result = await self.execute(self.table("users").select("*").eq(
                 "id", user_id
-            ).execute()
+            ))
             
-            return result.data[0] if result.data else None
+            if not result.data:
+                return None
+            
+            self._cache_user(result.data[0])
+            return dict(result.data[0])
             
         except Exception as e:
             logger.error(f"Error buscando usuario por ID: {e}")
@@ -77,8 +293,9 @@ class SupabaseService:
                 "created_at": datetime.now(self.tz).isoformat()
             }
             
-            result = self._get_client().table("users").insert(clean_data).execute()
+            result = await self.execute(self.table("users").insert(clean_data))
             logger.info(f"Nuevo usuario creado: {clean_data.get('whatsapp_number')}")
+            self._cache_user(result.data[0])
             return result.data[0]
             
         except Exception as e:
@@ -88,9 +305,10 @@ class SupabaseService:
     async def update_user(self, user_id: str, update_data: Dict[str, Any]) -> Dict[str, Any]:
         """Actualiza usuario"""
         try:
-            result = self._get_client().table("users").update(update_data).eq(
+            result = await self.execute(self.table("users").update(self.schema.shape("users", update_data)).eq(
                 "id", user_id
-            ).execute()
+            ))
+            self.invalidate_user(user_id)
             return result.data[0] if result.data else {}
             
         except Exception as e:
@@ -197,7 +415,11 @@ class SupabaseService:
             if 'created_at' not in entry_data:
                 entry_data['created_at'] = datetime.now(self.tz).isoformat()
                 
-            result = self._get_client().table("entries").insert(entry_data).execute()
+            result = await self.execute(self.table("entries").insert(self.schema.shape("entries", entry_data)))
+            if entry_data.get('type') == 'tarea' and entry_data.get('user_id'):
+                # El trigger de tareas cambia el contador mensual del plan FREE
+                self.invalidate_request_context(entry_data['user_id'])
+            self.notify_entries_changed(entry_data.get('user_id'))
             return result.data[0]
             
         except Exception as e:
@@ -210,11 +432,12 @@ class SupabaseService:
             # Asegurar timestamp de actualización
             update_data['updated_at'] = datetime.now(self.tz).isoformat()
                 
-            result = self._get_client().table("entries").update(update_data).eq(
-                "id", entry_id
-            ).execute()
+            result = await self.execute(self.table("entries").update(
+                self.schema.shape("entries", update_data)
+            ).eq("id", entry_id))
             
             if result.data:
+                self.notify_entries_changed(result.data[0].get('user_id'))
                 return result.data[0]
             else:
                 raise ValueError(f"No se encontró entrada con ID: {entry_id}")
@@ -240,25 +463,24 @@ class SupabaseService:
                 update_data['completed_at'] = now.isoformat()
                 logger.info(f"📅 Agregando completed_at: {update_data['completed_at']}")
             
-            # Intentar agregar updated_at solo si existe la columna
-            try:
-                # Test si updated_at existe haciendo una query simple
-                test_result = self._get_client().table("entries").select("updated_at").limit(1).execute()
+            # Agregar updated_at salvo que el schema descarte la columna (None = sin información)
+            if self.schema.has_column("entries", "updated_at") is not False:
                 update_data['updated_at'] = now.isoformat()
                 logger.info(f"📅 Agregando updated_at: {update_data['updated_at']}")
-            except Exception as col_error:
-                logger.warning(f"⚠️ Columna updated_at no existe, continuando sin ella: {col_error}")
+            
+            update_data = self.schema.shape("entries", update_data)
             
             logger.info(f"📝 Datos a actualizar: {update_data}")
             
-            result = self._get_client().table("entries").update(update_data).eq(
+            result = await self.execute(self.table("entries").update(update_data).eq(
                 "id", entry_id
-            ).execute()
+            ))
             
             logger.info(f"📊 Resultado de Supabase: {result}")
             
             if result.data:
                 logger.info(f"✅ Entrada {entry_id} marcada como {new_status} exitosamente")
+                self.notify_entries_changed(result.data[0].get('user_id'))
                 return result.data[0]
             else:
                 logger.error(f"❌ No se encontró entrada con ID: {entry_id} o no se actualizó")
@@ -272,9 +494,9 @@ class SupabaseService:
     async def get_entry_by_id(self, entry_id: str) -> Optional[Dict[str, Any]]:
         """Obtiene una entrada por ID"""
         try:
-            result = self._get_client().table("entries").select("*").eq(
+            result = await self.execute(self.table("entries").select("*").eq(
                 "id", entry_id
-            ).execute()
+            ))
             
             return result.data[0] if result.data else None
             
@@ -290,11 +512,11 @@ class SupabaseService:
             month_start = now.replace(day=1, hour=0, minute=0, second=0)
             
             # Obtener todas las entries del mes
-            entries = self._get_client().table("entries").select("*").eq(
+            entries = await self.execute(self.select("entries", "finance").eq(
                 "user_id", user_id
             ).gte(
                 "datetime", month_start.isoformat()
-            ).execute()
+            ))
             
             # Calcular estadísticas
             stats = {
@@ -336,14 +558,18 @@ class SupabaseService:
         try:
             path = f"{datetime.now().strftime('%Y/%m/%d')}/{filename}"
             
-            self._get_client().storage.from_("korei-media").upload(
+            bucket = self._get_client().storage.from_("korei-media")
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                self.executor,
+                bucket.upload,
                 path,
                 file_data,
                 {"content-type": content_type}
             )
             
             # Obtener URL pública
-            url = self._get_client().storage.from_("korei-media").get_public_url(path)
+            url = bucket.get_public_url(path)
             return url
             
         except Exception as e:
@@ -354,13 +580,13 @@ class SupabaseService:
     async def search_entries(self, user_id: str, query: str) -> List[Dict[str, Any]]:
         """Busca entries por texto"""
         try:
-            result = self._get_client().table("entries").select("*").eq(
+            result = await self.execute(self.table("entries").select("*").eq(
                 "user_id", user_id
             ).ilike(
                 "description", f"%{query}%"
             ).order(
                 "datetime", desc=True
-            ).limit(10).execute()
+            ).limit(10))
             
             return result.data
             
@@ -374,7 +600,7 @@ class SupabaseService:
         try:
             now = datetime.now(self.tz)
             
-            result = self._get_client().table("entries").select(
+            result = await self.execute(self.table("entries").select(
                 "*, users!inner(whatsapp_number, name)"
             ).lte(
                 "datetime_remember", now.isoformat()
@@ -382,7 +608,7 @@ class SupabaseService:
                 "status", "pending"
             ).in_(
                 "type", ["recordatorio", "tarea", "evento"]
-            ).execute()
+            ))
             
             return result.data
             
@@ -391,24 +617,32 @@ class SupabaseService:
             return []
     
     # User Profile methods
+    def _default_profile(self, user_id: str) -> Dict[str, Any]:
+        """Perfil básico para usuarios sin fila en user_profiles"""
+        return {
+            "user_id": user_id,
+            "occupation": None,
+            "hobbies": [],
+            "context_summary": None,
+            "preferences": {}
+        }
+    
     async def get_user_profile(self, user_id: str) -> Dict[str, Any]:
         """Obtiene perfil completo del usuario"""
         try:
-            result = self._get_client().table("user_profiles").select("*").eq(
-                "user_id", user_id
-            ).execute()
+            cached = self.profile_cache.get(user_id)
+            if cached:
+                return dict(cached)
             
-            if result.data:
-                return result.data[0]
+            result = await self.execute(self.table("user_profiles").select("*").eq(
+                "user_id", user_id
+            ))
             
             # Si no tiene perfil, crear uno básico
-            return {
-                "user_id": user_id,
-                "occupation": None,
-                "hobbies": [],
-                "context_summary": None,
-                "preferences": {}
-            }
+            profile = result.data[0] if result.data else self._default_profile(user_id)
+            
+            self.profile_cache.set(user_id, profile)
+            return dict(profile)
             
         except Exception as e:
             logger.error(f"Error obteniendo perfil: {e}")
@@ -418,22 +652,23 @@ class SupabaseService:
         """Crea o actualiza perfil de usuario"""
         try:
             # Verificar si ya existe
-            existing = self._get_client().table("user_profiles").select("id").eq(
+            existing = await self.execute(self.table("user_profiles").select("id").eq(
                 "user_id", user_id
-            ).execute()
+            ))
             
             if existing.data:
                 # Actualizar existente
-                result = self._get_client().table("user_profiles").update(
-                    profile_data
-                ).eq("user_id", user_id).execute()
+                result = await self.execute(self.table("user_profiles").update(
+                    self.schema.shape("user_profiles", profile_data)
+                ).eq("user_id", user_id))
             else:
                 # Crear nuevo
                 profile_data["user_id"] = user_id
-                result = self._get_client().table("user_profiles").insert(
-                    profile_data
-                ).execute()
+                result = await self.execute(self.table("user_profiles").insert(
+                    self.schema.shape("user_profiles", profile_data)
+                ))
             
+            self.invalidate_profile(user_id)
             return result.data[0] if result.data else {}
             
         except Exception as e:
@@ -443,9 +678,10 @@ class SupabaseService:
     async def update_user_context(self, user_id: str, context_summary: str) -> None:
         """Actualiza el resumen de contexto del usuario"""
         try:
-            self._get_client().table("user_profiles").update({
+            await self.execute(self.table("user_profiles").update({
                 "context_summary": context_summary
-            }).eq("user_id", user_id).execute()
+            }).eq("user_id", user_id))
+            self.invalidate_profile(user_id)
             
             logger.info(f"Contexto actualizado para usuario {user_id}")
             
@@ -457,13 +693,13 @@ class SupabaseService:
         try:
             cutoff_date = (datetime.now(self.tz) - timedelta(days=days))
             
-            result = self._get_client().table("entries").select("*").eq(
+            result = await self.execute(self.select("entries", "finance").eq(
                 "user_id", user_id
             ).eq(
                 "type", "gasto"
             ).gte(
                 "datetime", cutoff_date.isoformat()
-            ).order("datetime", desc=True).execute()
+            ).order("datetime", desc=True))
             
             expenses = result.data
             
@@ -518,19 +754,19 @@ class SupabaseService:
             
             # Último mes
             last_month = now - timedelta(days=30)
-            result_month = self._get_client().table("entries").select("*").eq(
+            result_month = await self.execute(self.select("entries", "finance").eq(
                 "user_id", user_id
             ).gte(
                 "datetime", last_month.isoformat()
-            ).execute()
+            ))
             
             # Últimos 3 meses para tendencias
             last_3_months = now - timedelta(days=90)
-            result_3_months = self._get_client().table("entries").select("*").eq(
+            result_3_months = await self.execute(self.select("entries", "finance").eq(
                 "user_id", user_id
             ).gte(
                 "datetime", last_3_months.isoformat()
-            ).execute()
+            ))
             
             entries_month = result_month.data
             entries_3_months = result_3_months.data
@@ -606,7 +842,7 @@ class SupabaseService:
             }
             
             # Crear tabla si no existe (esto sería mejor en migración)
-            self._get_client().table("ai_insights").insert(insight_data).execute()
+            await self.execute(self.table("ai_insights").insert(self.schema.shape("ai_insights", insight_data)))
             
         except Exception as e:
             logger.warning(f"Error almacenando insight de IA: {e}")  # No critical
@@ -614,26 +850,103 @@ class SupabaseService:
     async def get_recent_ai_insights(self, user_id: str, insight_type: str = None, limit: int = 10) -> List[Dict[str, Any]]:
         """Obtiene insights recientes de IA para contexto"""
         try:
-            query = self._get_client().table("ai_insights").select("*").eq("user_id", user_id)
+            query = self.table("ai_insights").select("*").eq("user_id", user_id)
             
             if insight_type:
                 query = query.eq("insight_type", insight_type)
             
-            result = query.order("created_at", desc=True).limit(limit).execute()
+            result = await self.execute(query.order("created_at", desc=True).limit(limit))
             return result.data
             
         except Exception as e:
             logger.warning(f"Error obteniendo insights de IA: {e}")
             return []
     
+    async def load_request_context(self, phone: str) -> Dict[str, Any]:
+        """
+        Carga en un solo viaje (función SQL `get_request_context`) todo lo que
+        el pipeline necesita del usuario: fila de users, perfil, plan/límites de
+        tareas e integraciones activas.
+        
+        Returns:
+            Dict con user (None si no existe), profile, entitlements,
+            remaining_tasks e integrations. Si la función no está disponible se
+            arma con consultas individuales y entitlements/integrations quedan
+            en None (los llamadores deben resolverlos como antes)
+        """
+        clean_phone = ''.join(filter(str.isdigit, phone or ""))
+        
+        user_id = self.phone_index.get(clean_phone)
+        if user_id:
+            cached = self.context_cache.get(user_id)
+            if cached:
+                return dict(cached)
+        
+        if not self.request_context_rpc and self.request_context_rpc_retry_at is not None \
+                and time.monotonic() >= self.request_context_rpc_retry_at:
+            # Pasó el cooldown: la función pudo desplegarse sin reiniciar
+            self.request_context_rpc = True
+            self.request_context_rpc_retry_at = None
+        
+        if self.request_context_rpc:
+            try:
+                result = await self.execute(self.rpc("get_request_context", {"phone_input": clean_phone}))
+                context = result.data or {}
+                
+                user = context.get("user")
+                if user:
+                    context["profile"] = context.get("profile") or self._default_profile(user["id"])
+                    self._cache_user(user, clean_phone)
+                    self.profile_cache.set(user["id"], context["profile"])
+                    self.context_cache.set(user["id"], context)
+                
+                return dict(context)
+                
+            except Exception as e:
+                if self._is_missing_function(e):
+                    # Función no desplegada: no reintentar en cada mensaje, solo tras el cooldown
+                    self.request_context_rpc = False
+                    self.request_context_rpc_retry_at = time.monotonic() + settings.supabase_rpc_retry_seconds
+                    logger.warning(
+                        f"get_request_context no disponible, usando consultas individuales "
+                        f"(se reintenta en {settings.supabase_rpc_retry_seconds}s)"
+                    )
+                else:
+                    # Timeouts o errores transitorios: solo este mensaje usa las consultas individuales
+                    logger.error(f"Error cargando contexto de request: {e}")
+        
+        user = await self.get_user_by_phone(clean_phone)
+        return {
+            "user": user,
+            "profile": await self.get_user_profile(user["id"]) if user else None,
+            "entitlements": None,
+            "remaining_tasks": None,
+            "integrations": None
+        }
+    
+    @staticmethod
+    def _is_missing_function(error: Exception) -> bool:
+        """PGRST202 (PostgREST) o 42883 (Postgres): la función SQL no existe"""
+        code = getattr(error, "code", None)
+        return code in RPC_MISSING_FUNCTION_CODES or any(
+            missing in str(error) for missing in RPC_MISSING_FUNCTION_CODES
+        )
+    
     async def get_user_with_context(self, phone: str) -> Dict[str, Any]:
         """Obtiene usuario con toda su información de contexto"""
         try:
-            # Obtener o crear usuario
-            user = await self.get_or_create_user(phone)
+            request_context = await self.load_request_context(phone)
             
-            # Obtener perfil
-            profile = await self.get_user_profile(user["id"])
+            if request_context.get("user"):
+                user = request_context["user"]
+                profile = request_context["profile"]
+            else:
+                # Obtener o crear usuario
+                request_context = None
+                user = await self.get_or_create_user(phone)
+                
+                # Obtener perfil
+                profile = await self.get_user_profile(user["id"])
             
             # Combinar información
             return {
@@ -646,7 +959,9 @@ class SupabaseService:
                     "hobbies": profile.get("hobbies", []),
                     "context_summary": profile.get("context_summary"),
                     "preferences": profile.get("preferences", {})
-                }
+                },
+                # Plan e integraciones ya resueltos, consumidos por MessageHandler
+                "request_context": request_context
             }
             
         except Exception as e:
@@ -201,7 +201,7 @@ class CommandHandler:
             """
             
             # Llamar a Gemini para extraer información
-            extracted_info = gemini_service.model.generate_content(registration_prompt)
+            extracted_info = await gemini_service.generate(gemini_service.model, registration_prompt, "pro", 30.0)
             
             # Parsear respuesta de Gemini
             import json
@@ -364,7 +364,7 @@ class CommandHandler:
                 period_text = "mañana"
             
             # Obtener tareas del período
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.select("entries", "agenda").eq(
                 "user_id", user_id
             ).eq(
                 "type", "tarea"
@@ -372,7 +372,7 @@ class CommandHandler:
                 "datetime", start_date.isoformat()
             ).lte(
                 "datetime", end_date.isoformat()
-            ).order("datetime").execute()
+            ).order("datetime"))
             
             tasks = result.data
             
@@ -441,7 +441,7 @@ class CommandHandler:
             end_date = now.replace(hour=23, minute=59, second=59, microsecond=999999)
             
             # Obtener gastos del día
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.select("entries", "finance").eq(
                 "user_id", user_id
             ).eq(
                 "type", "gasto"
@@ -449,7 +449,7 @@ class CommandHandler:
                 "datetime", start_date.isoformat()
             ).lte(
                 "datetime", end_date.isoformat()
-            ).order("datetime", desc=True).execute()
+            ).order("datetime", desc=True))
             
             expenses = result.data
             
@@ -508,7 +508,7 @@ class CommandHandler:
             end_date = now.replace(hour=23, minute=59, second=59, microsecond=999999)
             
             # Obtener ingresos del día
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.select("entries", "finance").eq(
                 "user_id", user_id
             ).eq(
                 "type", "ingreso"
@@ -516,7 +516,7 @@ class CommandHandler:
                 "datetime", start_date.isoformat()
             ).lte(
                 "datetime", end_date.isoformat()
-            ).order("datetime", desc=True).execute()
+            ).order("datetime", desc=True))
             
             income = result.data
             
@@ -561,11 +561,11 @@ class CommandHandler:
             month_start = now.replace(day=1, hour=0, minute=0, second=0)
             
             # Obtener todas las entries del mes
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.select("entries", "overview").eq(
                 "user_id", user_id
             ).gte(
                 "datetime", month_start.isoformat()
-            ).order("datetime", desc=True).execute()
+            ).order("datetime", desc=True))
             
             entries = result.data
             
@@ -684,7 +684,7 @@ class CommandHandler:
             """
             
             # Llamar a Gemini
-            response = gemini_service.model.generate_content(enhanced_prompt)
+            response = await gemini_service.generate(gemini_service.model, enhanced_prompt, "pro", 30.0)
             tips_content = response.text.strip()
             
             # Almacenar el insight para referencia futura
@@ -837,11 +837,11 @@ class CommandHandler:
             now = datetime.now(tz)
             today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
             
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.select("entries", "finance").eq(
                 "user_id", user_id
             ).gte(
                 "datetime", today_start.isoformat()
-            ).execute()
+            ))
             
             today_entries = result.data
             
@@ -1206,7 +1206,7 @@ class CommandHandler:
                 period_text = "mañana"
             
             # Obtener eventos del período
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.select("entries", "agenda").eq(
                 "user_id", user_id
             ).eq(
                 "type", "evento"
@@ -1214,7 +1214,7 @@ class CommandHandler:
                 "datetime", start_date.isoformat()
             ).lte(
                 "datetime", end_date.isoformat()
-            ).order("datetime").execute()
+            ).order("datetime"))
             
             events = result.data
             
@@ -1465,13 +1465,13 @@ class CommandHandler:
             end_date = now.replace(hour=23, minute=59, second=59, microsecond=999999)
             
             # Obtener todas las entries del día
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.select("entries", "overview").eq(
                 "user_id", user_id
             ).gte(
                 "datetime", start_date.isoformat()
             ).lte(
                 "datetime", end_date.isoformat()
-            ).order("datetime").execute()
+            ).order("datetime"))
             
             entries = result.data
             
@@ -1604,13 +1604,13 @@ class CommandHandler:
             end_date = tomorrow.replace(hour=23, minute=59, second=59, microsecond=999999)
             
             # Obtener entries de mañana
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.select("entries", "agenda").eq(
                 "user_id", user_id
             ).gte(
                 "datetime", start_date.isoformat()
             ).lte(
                 "datetime", end_date.isoformat()
-            ).order("datetime").execute()
+            ).order("datetime"))
             
             entries = result.data
             
@@ -1688,7 +1688,7 @@ class CommandHandler:
             # Buscar en tareas de hoy y días anteriores
             past_date = now - timedelta(days=7)  # Últimos 7 días
             
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.select("entries", "agenda").eq(
                 "user_id", user_id
             ).eq(
                 "type", "tarea"
@@ -1696,7 +1696,7 @@ class CommandHandler:
                 "status", "pending"
             ).gte(
                 "datetime", past_date.isoformat()
-            ).order("datetime", desc=True).execute()
+            ).order("datetime", desc=True))
             
             pending_tasks = result.data
             
@@ -1824,7 +1824,7 @@ class CommandHandler:
             end_date = sunday.replace(hour=23, minute=59, second=59, microsecond=999999)
             
             # Obtener todas las entries de la semana
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.select("entries", "agenda").eq(
                 "user_id", user_id
             ).in_(
                 "type", ["tarea", "evento"]
@@ -1832,7 +1832,7 @@ class CommandHandler:
                 "datetime", start_date.isoformat()
             ).lte(
                 "datetime", end_date.isoformat()
-            ).order("datetime").execute()
+            ).order("datetime"))
             
             entries = result.data
             
@@ -1966,7 +1966,7 @@ class CommandHandler:
                 period_text = "esta semana"
             
             # Obtener tareas pendientes del período
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.select("entries", "agenda").eq(
                 "user_id", user_id
             ).eq(
                 "type", "tarea"
@@ -1976,7 +1976,7 @@ class CommandHandler:
                 "datetime", start_date.isoformat()
             ).lte(
                 "datetime", end_date.isoformat()
-            ).order("datetime").execute()
+            ).order("datetime"))
             
             pending_tasks = result.data
             
@@ -2062,11 +2062,12 @@ class CommandHandler:
                 }
             
             # Eliminar de la base de datos
-            delete_result = supabase._get_client().table("entries").delete().eq(
+            delete_result = await supabase.execute(supabase.table("entries").delete().eq(
                 "id", task_id
-            ).execute()
+            ))
             
             if delete_result.data:
+                supabase.notify_entries_changed(user_id)
                 # Intentar eliminar de Todoist si está conectado
                 todoist_message = ""
                 try:
@@ -2126,13 +2127,13 @@ class CommandHandler:
             end_date = now.replace(hour=23, minute=59, second=59, microsecond=999999)
             
             # Obtener estadísticas del día
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.select("entries", "finance").eq(
                 "user_id", user_id
             ).gte(
                 "datetime", start_date.isoformat()
             ).lte(
                 "datetime", end_date.isoformat()
-            ).execute()
+            ))
             
             entries_today = result.data
             pending_tasks = [e for e in entries_today if e['type'] == 'tarea' and e['status'] == 'pending']
@@ -2,8 +2,8 @@
 Manejador principal de mensajes
 """
 from typing import Dict, Any, List
-import os
-import tempfile
+import asyncio
+import time
 from datetime import datetime
 from loguru import logger
 
@@ -11,19 +11,45 @@ from core.supabase import supabase
 from services.whatsapp import whatsapp_service
 from services.whatsapp_cloud import whatsapp_cloud_service
 from services.gemini import gemini_service
+from services.expense_parser import expense_parser
+from services.temporal_resolver import temporal_resolver
+from services.intent_classifier import intent_classifier
 from handlers.command_handler import command_handler
 from services.reminder_scheduler import reminder_scheduler
 from services.formatters import message_formatter
+from services.media_fetcher import media_fetcher
 
 class MessageHandler:
-    def __init__(self):
-        self.temp_dir = tempfile.gettempdir()
+    async def get_request_context(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Contexto de request (usuario, plan, integraciones) ya cargado por
+        `supabase.get_user_with_context`, o cargado en un solo viaje si falta
+        """
+        if not user or not user.get('whatsapp_number'):
+            return {}
+        
+        return user.get('request_context') or await supabase.load_request_context(user['whatsapp_number'])
+    
+    async def get_integration(self, user: Dict[str, Any], request_context: Dict[str, Any], service: str):
+        """Integración del usuario; no consulta la BD si el contexto indica que no está conectada"""
+        connected = request_context.get('integrations')
+        if connected is not None and service not in connected:
+            return None
+        
+        from services.integrations.integration_manager import integration_manager
+        return await integration_manager.get_user_integration(user['id'], service)
     
-    async def verify_user_and_payment(self, user: Dict[str, Any]) -> Dict[str, Any]:
+    async def verify_user_and_payment(self, user: Dict[str, Any],
+                                      request_context: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Verifica que el usuario exista y tenga acceso básico
         Ahora usa el nuevo sistema de planes (FREE/BASIC/ADHD)
         
+        Args:
+            user: Usuario del webhook
+            request_context: Contexto de `get_request_context`; si trae la fila
+                del usuario no se vuelve a consultar
+        
         Returns:
             Dict con is_valid (bool) y message (str)
         """
@@ -46,7 +72,11 @@ class MessageHandler:
             
             # Obtener datos completos del usuario desde la base de datos
             try:
-                user_data = await supabase.get_user_by_id(user['id'])
+                context_user = (request_context or {}).get('user')
+                if context_user and context_user.get('id') == user['id']:
+                    user_data = context_user
+                else:
+                    user_data = await supabase.get_user_by_id(user['id'])
                 if not user_data:
                     return {
                         'is_valid': False,
@@ -83,7 +113,8 @@ class MessageHandler:
             is_register_command = message_clean.startswith('/register') or message_clean.startswith('/registro')
             
             # Verificar si el usuario está registrado
-            user_verification = await self.verify_user_and_payment(user)
+            request_context = await self.get_request_context(user)
+            user_verification = await self.verify_user_and_payment(user, request_context)
             
             if not user_verification['is_valid']:
                 # Si no está registrado, SOLO permitir /register
@@ -104,13 +135,18 @@ class MessageHandler:
             if intent_result['should_handle_directly']:
                 return intent_result
             
-            # Procesar con Gemini solo si es contenido real
-            result = await gemini_service.process_message(message, user)
+            # Gastos/ingresos y recordatorios simples se interpretan localmente sin LLM
+            result = expense_parser.try_parse(message) or temporal_resolver.try_reminder(message)
+            if result is None:
+                # Procesar con Gemini solo si es contenido real
+                result = await gemini_service.process_message(message, user)
+                # Validar la fecha del LLM contra la expresión de tiempo del mensaje
+                result = temporal_resolver.correct(result, message)
             
             # VERIFICAR LÍMITES DEL PLAN ANTES DE CREAR TAREAS
             if result.get('type') == 'tarea' and user.get('id'):
                 from middleware.plan_verification import check_task_creation_limit
-                limit_check = await check_task_creation_limit(user)
+                limit_check = await check_task_creation_limit(user, request_context.get('entitlements'))
                 
                 if not limit_check.get('can_create', True):
                     # Usuario ha alcanzado el límite - enviar mensaje de upgrade
@@ -128,12 +164,8 @@ class MessageHandler:
             if result.get('type') == 'evento' and user.get('id'):
                 logger.info(f"AVAILABILITY-CHECK: Detectado evento, revisando disponibilidad...")
                 try:
-                    from services.integrations.integration_manager import integration_manager
-                    
                     # Obtener integración de Google Calendar del usuario
-                    google_integration = await integration_manager.get_user_integration(
-                        user['id'], 'google_calendar'
-                    )
+                    google_integration = await self.get_integration(user, request_context, 'google_calendar')
                     
                     if google_integration:
                         # Revisar disponibilidad en Google Calendar
@@ -173,9 +205,8 @@ class MessageHandler:
                 # Si es tarea o recordatorio, intentar crear primero en Todoist
                 if result.get('type') in ['tarea', 'recordatorio']:
                     try:
-                        from services.integrations.integration_manager import integration_manager
                         from services.integrations.todoist_integration import select_optimal_project
-                        todoist_integration = await integration_manager.get_user_integration(user['id'], 'todoist')
+                        todoist_integration = await self.get_integration(user, request_context, 'todoist')
                         if todoist_integration:
                             projects = await todoist_integration.get_projects()
                             user_context = user.get('profile', {})
@@ -209,10 +240,7 @@ class MessageHandler:
                 if entry and result.get('type') == 'evento':
                     logger.info(f"AUTO-SYNC: Creando evento en Google Calendar...")
                     try:
-                        from services.integrations.integration_manager import integration_manager
-                        google_integration = await integration_manager.get_user_integration(
-                            user['id'], 'google_calendar'
-                        )
+                        google_integration = await self.get_integration(user, request_context, 'google_calendar')
                         if google_integration:
                             google_event_id = await google_integration.sync_to_external(result)
                             if google_event_id:
@@ -316,10 +344,11 @@ class MessageHandler:
     
     async def handle_audio(self, message_data: Dict[str, Any], 
                           user: Dict[str, Any]) -> Dict[str, Any]:
-        """Procesa mensajes de audio usando pipeline de dos pasos"""
+        """Procesa mensajes de audio: transcripción y extracción en una sola llamada"""
         try:
             # 🔒 SEGURIDAD ULTRA ESTRICTA: Solo usuarios registrados pueden enviar audio
-            user_verification = await self.verify_user_and_payment(user)
+            request_context = await self.get_request_context(user)
+            user_verification = await self.verify_user_and_payment(user, request_context)
             if not user_verification['is_valid']:
                 # SILENCIO TOTAL - No responder a audio de usuarios no registrados
                 logger.warning(f"ACCESO DENEGADO SILENCIOSO - Audio de usuario no registrado: {user.get('whatsapp_number', 'unknown')}")
@@ -340,63 +369,32 @@ class MessageHandler:
             if not media_id:
                 raise ValueError("No se encontró ID del audio")
             
-            logger.info(f"AUDIO-DOWNLOAD: Getting media URL for ID: {media_id}")
+            # Nota reenviada: el sha256 del webhook evita descargarla otra vez
+            fingerprint = media_info.get('sha256')
+            voice_note = gemini_service.cached_voice_note(user, fingerprint)
             
-            # Obtener URL del archivo desde WhatsApp Cloud API
-            from api.routes.whatsapp_cloud import get_media_url, download_media
-            media_url = await get_media_url(media_id)
-            
-            if not media_url:
-                raise ValueError("No se pudo obtener URL del audio")
+            if voice_note is None:
+                logger.info(f"AUDIO-DOWNLOAD: Downloading media ID: {media_id}")
                 
-            logger.info(f"AUDIO-DOWNLOAD: Downloading from URL: {media_url[:50]}...")
-            
-            # Descargar archivo
-            audio_data = await download_media(media_url)
-            
-            if not audio_data:
-                raise ValueError("No se pudo descargar el audio")
-            
-            # Guardar temporalmente
-            temp_path = os.path.join(self.temp_dir, f"audio_{user['id']}.ogg")
-            with open(temp_path, 'wb') as f:
-                f.write(audio_data)
-            
-            # PASO 1: Extraer contexto del audio con Gemini (REAL)
-            logger.info(f"AUDIO-STEP1: Iniciando transcripción real con Gemini")
-            logger.info(f"AUDIO-STEP1: Archivo temporal: {temp_path}")
-            logger.info(f"AUDIO-STEP1: Usuario: {user.get('name', 'Unknown')}")
-            
-            try:
-                logger.info(f"AUDIO-STEP1: Llamando gemini_service.extract_audio_context...")
-                audio_context = await gemini_service.extract_audio_context(temp_path, user)
-                logger.info(f"AUDIO-SUCCESS: Transcripción exitosa!")
-                logger.info(f"AUDIO-CONTEXT: {audio_context[:200]}...")
-            except Exception as e:
-                logger.error(f"AUDIO-ERROR: Error en transcripción real: {e}")
-                logger.error(f"AUDIO-ERROR: Tipo de error: {type(e).__name__}")
-                import traceback
-                logger.error(f"AUDIO-ERROR: Traceback: {traceback.format_exc()}")
-                audio_context = "Usuario envió un mensaje de audio que no se pudo transcribir completamente."
-            
-            # PASO 2: Procesar contexto extraído a través del pipeline enriquecido
-            logger.info(f"AUDIO-STEP2: Procesando contexto extraído con pipeline completo")
-            enhanced_message = f"Información extraída de audio: {audio_context}"
-            
-            # Usar el pipeline completo de procesamiento (con contexto financiero, eventos, etc.)
-            result = await gemini_service.process_message(enhanced_message, user)
-            logger.info(f"AUDIO-RESULT: {result}")
+                # URL + descarga por el pool compartido (MediaFetchError si falla)
+                download_started = time.monotonic()
+                audio_data = await media_fetcher.fetch_media(media_id)
+                gemini_service.record_media_stage("audio", "download", (time.monotonic() - download_started) * 1000)
+                
+                # Transcripción y extracción en una sola llamada a Gemini
+                mime_type = (media_info.get('mime_type') or "audio/ogg").split(';')[0].strip()
+                voice_note = await gemini_service.process_voice_note(audio_data, user, mime_type, fingerprint)
+            result = voice_note["result"]
+            audio_context = voice_note["transcription"] or "(sin transcripción)"
+            logger.info(f"AUDIO-CONTEXT: {audio_context[:200]}...")
+            logger.info(f"AUDIO-RESULT: {result} ({voice_note['mode']}, {voice_note['timings_ms']})")
             
             # NUEVA FUNCIONALIDAD: Revisar disponibilidad ANTES de crear evento (igual que imágenes)
             if result.get('type') == 'evento' and user.get('id'):
                 logger.info(f"AUDIO-AVAILABILITY: Detectado evento en audio, revisando disponibilidad...")
                 try:
-                    from services.integrations.integration_manager import integration_manager
-                    
                     # Obtener integración de Google Calendar del usuario
-                    google_integration = await integration_manager.get_user_integration(
-                        user['id'], 'google_calendar'
-                    )
+                    google_integration = await self.get_integration(user, request_context, 'google_calendar')
                     
                     if google_integration:
                         # Revisar disponibilidad en Google Calendar
@@ -451,12 +449,8 @@ class MessageHandler:
                 if entry and result.get('type') == 'evento':
                     logger.info(f"AUDIO-AUTO-SYNC: Creando evento en Google Calendar...")
                     try:
-                        from services.integrations.integration_manager import integration_manager
-                        
                         # Obtener integración de Google Calendar del usuario
-                        google_integration = await integration_manager.get_user_integration(
-                            user['id'], 'google_calendar'
-                        )
+                        google_integration = await self.get_integration(user, request_context, 'google_calendar')
                         
                         if google_integration:
                             # Sincronizar este evento específico
@@ -476,9 +470,6 @@ class MessageHandler:
                     except Exception as sync_error:
                         logger.error(f"AUDIO-AUTO-SYNC ERROR: {sync_error}")
             
-            # Limpiar archivo temporal
-            os.remove(temp_path)
-            
             # RESPUESTA SIMPLIFICADA (FUNCIONAL)
             response = f"🎤 **Audio recibido y procesado:**\n\n"
             response += message_formatter.format_entry_response(result)
@@ -509,10 +500,11 @@ class MessageHandler:
     
     async def handle_image(self, message_data: Dict[str, Any], 
                           user: Dict[str, Any]) -> Dict[str, Any]:
-        """Procesa imágenes con Gemini Vision usando pipeline de dos pasos"""
+        """Procesa imágenes con Gemini Vision: extracción y clasificación en una sola llamada"""
         try:
             # 🔒 SEGURIDAD ULTRA ESTRICTA: Solo usuarios registrados pueden enviar imágenes
-            user_verification = await self.verify_user_and_payment(user)
+            request_context = await self.get_request_context(user)
+            user_verification = await self.verify_user_and_payment(user, request_context)
             if not user_verification['is_valid']:
                 # SILENCIO TOTAL - No responder a imágenes de usuarios no registrados
                 logger.warning(f"ACCESO DENEGADO SILENCIOSO - Imagen de usuario no registrado: {user.get('whatsapp_number', 'unknown')}")
@@ -533,27 +525,15 @@ class MessageHandler:
             if not media_id:
                 raise ValueError(f"No se encontro ID de la imagen. media_info: {media_info}")
             
-            logger.info(f"IMAGE-DOWNLOAD: Getting media URL for ID: {media_id}")
-            
-            # Obtener URL del archivo desde WhatsApp Cloud API
-            from api.routes.whatsapp_cloud import get_media_url, download_media
-            media_url = await get_media_url(media_id)
+            # Imagen reenviada: el sha256 del webhook evita descargarla otra vez
+            fingerprint = media_info.get('sha256')
+            result = gemini_service.cached_image(user, fingerprint, caption)
             
-            if not media_url:
-                raise ValueError("No se pudo obtener URL de la imagen")
+            if result is None:
+                image_data = await self.download_image(media_id)
                 
-            logger.info(f"IMAGE-DOWNLOAD: Downloading from URL: {media_url[:50]}...")
-            
-            # Descargar imagen
-            image_data = await download_media(media_url)
-            
-            if not image_data:
-                raise ValueError("No se pudo descargar la imagen")
-            
-            logger.info(f"IMAGE-DOWNLOAD: Downloaded {len(image_data)} bytes")
-            
-            # Procesar imagen con Gemini
-            result = await gemini_service.process_image(image_data, caption, user)
+                # Procesar imagen con Gemini
+                result = await gemini_service.process_image(image_data, caption, user, fingerprint)
             
             print(f"STEP 6A: IMAGE PROCESSED - Type: {result.get('type')}")
             print(f"STEP 6B: About to format response")
@@ -634,12 +614,8 @@ class MessageHandler:
             if result.get('type') == 'evento' and user.get('id'):
                 logger.info(f"IMAGE-AVAILABILITY: Detectado evento en imagen, revisando disponibilidad...")
                 try:
-                    from services.integrations.integration_manager import integration_manager
-                    
                     # Obtener integración de Google Calendar del usuario
-                    google_integration = await integration_manager.get_user_integration(
-                        user['id'], 'google_calendar'
-                    )
+                    google_integration = await self.get_integration(user, request_context, 'google_calendar')
                     
                     if google_integration:
                         # Revisar disponibilidad en Google Calendar
@@ -685,12 +661,8 @@ class MessageHandler:
                 if entry and result.get('type') == 'evento':
                     logger.info(f"IMAGE-AUTO-SYNC: Creando evento en Google Calendar...")
                     try:
-                        from services.integrations.integration_manager import integration_manager
-                        
                         # Obtener integración de Google Calendar del usuario
-                        google_integration = await integration_manager.get_user_integration(
-                            user['id'], 'google_calendar'
-                        )
+                        google_integration = await self.get_integration(user, request_context, 'google_calendar')
                         
                         if google_integration:
                             # Sincronizar este evento específico
@@ -758,6 +730,147 @@ class MessageHandler:
             
             return {"status": "error", "message": str(e)}
     
+    async def save_entry(self, result: Dict[str, Any], user: Dict[str, Any],
+                         request_context: Dict[str, Any], tag: str = "ENTRY") -> Dict[str, Any]:
+        """
+        Guarda una entry de un álbum como lo hace el flujo de imagen: a un
+        evento primero se le revisa disponibilidad en Google Calendar (con
+        conflicto no se crea) y, creado, se sincroniza con `sync_to_external`
+        
+        Returns:
+            {"status": "saved"|"conflict", "entry": entry|None, "conflicts": [...]}
+        
+        Raises:
+            Errores de supabase.create_entry (el llamador decide cómo reportarlos)
+        """
+        is_event = result.get('type') == 'evento'
+        google_integration = None
+        if is_event:
+            try:
+                google_integration = await self.get_integration(user, request_context, 'google_calendar')
+                if google_integration:
+                    availability_result = await self.check_calendar_availability(google_integration, result)
+                    if availability_result['has_conflict']:
+                        logger.info(f"{tag}-AVAILABILITY: Conflicto de horario, no se crea el evento")
+                        return {"status": "conflict", "entry": None, "conflicts": availability_result['conflicts']}
+                else:
+                    logger.info(f"{tag}-AVAILABILITY: Usuario no tiene Google Calendar, creando sin verificar")
+            except Exception as availability_error:
+                logger.error(f"{tag}-AVAILABILITY ERROR: {availability_error}")
+                # Si falla la verificación, continuar normalmente
+        
+        entry = await supabase.create_entry({**result, "user_id": user['id']})
+        
+        # Sincronización automática con Google Calendar (solo si no hubo conflicto)
+        if entry and google_integration:
+            try:
+                google_event_id = await google_integration.sync_to_external(result)
+                if google_event_id:
+                    logger.info(f"{tag}-AUTO-SYNC: Evento sincronizado con Google Calendar. ID: {google_event_id}")
+                    await supabase.update_entry(entry['id'], {
+                        'external_service': 'google_calendar',
+                        'external_id': google_event_id
+                    })
+                else:
+                    logger.warning(f"{tag}-AUTO-SYNC: Falló la sincronización con Google Calendar")
+            except Exception as sync_error:
+                logger.error(f"{tag}-AUTO-SYNC ERROR: {sync_error}")
+        
+        return {"status": "saved", "entry": entry, "conflicts": []}
+    
+    async def download_image(self, media_id: str, stage_kind: str = "image") -> bytes:
+        """
+        Descarga una imagen de WhatsApp Cloud API registrando la latencia de la descarga
+        
+        Raises:
+            MediaFetchError: si no se pudo obtener la URL o el archivo
+        """
+        logger.info(f"IMAGE-DOWNLOAD: Downloading media ID: {media_id}")
+        
+        download_started = time.monotonic()
+        image_data = await media_fetcher.fetch_media(media_id)
+        gemini_service.record_media_stage(stage_kind, "download", (time.monotonic() - download_started) * 1000)
+        
+        logger.info(f"IMAGE-DOWNLOAD: Downloaded {len(image_data)} bytes")
+        return image_data
+    
+    async def handle_album(self, images: List[Dict[str, Any]],
+                           user: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Procesa un álbum (ver AlbumCollector): descarga las imágenes en
+        paralelo, las analiza en una sola llamada a Gemini y responde con un
+        solo mensaje con todas las entries
+        """
+        try:
+            # 🔒 SEGURIDAD ULTRA ESTRICTA: Solo usuarios registrados pueden enviar imágenes
+            request_context = await self.get_request_context(user)
+            user_verification = await self.verify_user_and_payment(user, request_context)
+            if not user_verification['is_valid']:
+                logger.warning(f"ACCESO DENEGADO SILENCIOSO - Álbum de usuario no registrado: {user.get('whatsapp_number', 'unknown')}")
+                return {"status": "silent_denial", "message": "Usuario no registrado - sin respuesta"}
+            
+            media_ids = [image.get('media', {}).get('id') for image in images]
+            captions = [image.get('caption', '') for image in images]
+            
+            # Descargas concurrentes; una imagen que falla no tumba el álbum
+            downloaded = await asyncio.gather(
+                *(self.download_image(media_id, "album") for media_id in media_ids if media_id),
+                return_exceptions=True
+            )
+            image_data = [data for data in downloaded if not isinstance(data, BaseException)]
+            failed = len(images) - len(image_data)
+            for error in downloaded:
+                if isinstance(error, BaseException):
+                    logger.warning(f"ALBUM-DOWNLOAD: imagen no descargada: {error}")
+            
+            if not image_data:
+                raise ValueError("No se pudo descargar ninguna imagen del álbum")
+            
+            results = await gemini_service.process_album(image_data, captions, user)
+            
+            # Cada entry pasa por el mismo guardado que una imagen suelta; una
+            # que falla no invalida las que sí se guardaron
+            entries, outcomes = [], []
+            for result in results:
+                if not user.get('id') or not result.get('type') or result.get('type') == 'consulta':
+                    outcomes.append("skipped")
+                    continue
+                try:
+                    saved = await self.save_entry(result, user, request_context, "ALBUM")
+                except Exception as db_error:
+                    logger.error(f"ALBUM-SAVE ERROR: {db_error}")
+                    outcomes.append("error")
+                    continue
+                outcomes.append(saved['status'])
+                if saved['entry']:
+                    entries.append(saved['entry'])
+            
+            # Una sola respuesta para todo el álbum
+            await whatsapp_cloud_service.send_text_message(
+                to=user['whatsapp_number'],
+                message=message_formatter.format_album_response(results, failed, outcomes)
+            )
+            
+            unsaved = sum(1 for outcome in outcomes if outcome in ("error", "conflict"))
+            logger.info(
+                f"ALBUM: {len(image_data)} imágenes, {len(results)} entries, "
+                f"{failed} sin descargar, {unsaved} sin guardar"
+            )
+            status = "partial" if failed or unsaved else "success"
+            return {"status": status, "results": results, "entries": entries,
+                    "outcomes": outcomes, "failed": failed}
+            
+        except Exception as e:
+            logger.error(f"Error procesando álbum: {e}")
+            
+            error_message = f"❌ No pude procesar tus imágenes.\n\n💡 {message_formatter.format_error_message('imagen')}"
+            await whatsapp_cloud_service.send_text_message(
+                to=user['whatsapp_number'],
+                message=error_message
+            )
+            
+            return {"status": "error", "message": str(e)}
+    
     async def check_calendar_availability(self, google_integration, event_data: Dict[str, Any]) -> Dict[str, Any]:
         """Verifica disponibilidad en Google Calendar antes de crear evento"""
         try:
@@ -874,146 +987,35 @@ class MessageHandler:
         Retorna: {should_handle_directly: bool, response: str, type: str}
         """
         try:
-            message_lower = message.lower().strip()
-            
-            # 1. SALUDOS SIMPLES - Responder directamente
-            greetings = [
-                'hola', 'hello', 'hi', 'hey', 'buenas', 'buenos días', 'buenas tardes', 
-                'buenas noches', 'good morning', 'good afternoon', 'good evening',
-                'qué tal', 'como estas', 'como estás', 'how are you', 'saludos'
-            ]
+            intent = intent_classifier.classify(message)
             
-            if any(greeting == message_lower for greeting in greetings):
-                logger.info(f"INTENT: Saludo detectado - {message}")
-                
-                # Respuesta simple sin emojis para evitar problemas de encoding
-                response = f"Hola! Soy Korei, tu asistente personal. En que te puedo ayudar hoy?"
-                
-                # Enviar respuesta
-                await whatsapp_cloud_service.send_text_message(
-                    to=user['whatsapp_number'],
-                    message=response
-                )
-                
+            # Contenido real que debe procesarse con Gemini
+            if intent is None:
+                logger.info(f"INTENT: Contenido real detectado, enviando a Gemini - {message[:50]}...")
                 return {
-                    'should_handle_directly': True,
-                    'status': 'handled',
-                    'type': 'greeting',
-                    'message': 'Saludo procesado'
+                    'should_handle_directly': False,
+                    'type': 'real_content'
                 }
             
-            # 2. COMANDOS SIN SLASH - Redirigir a comando handler
-            command_words = {
-                'help': '/help', 'ayuda': '/help',
-                'stats': '/stats', 'estadisticas': '/stats', 'estadísticas': '/stats',
-                'hoy': '/hoy', 'today': '/hoy',
-                'mañana': '/mañana', 'tomorrow': '/mañana',
-                'agenda': '/agenda', 'schedule': '/agenda',
-                'tareas': '/tareas', 'tasks': '/tareas',
-                'profile': '/profile', 'perfil': '/perfil'
-            }
+            # Comandos sin slash y pedidos de ayuda - Redirigir a comando handler
+            if intent['command']:
+                logger.info(f"🎯 INTENT: Comando sin slash detectado - {message} -> {intent['command']}")
+                command_result = await self.handle_command(intent['command'], user)
+                return {**command_result, 'should_handle_directly': True}
             
-            if message_lower in command_words:
-                logger.info(f"🎯 INTENT: Comando sin slash detectado - {message} -> {command_words[message_lower]}")
-                return await self.handle_command(command_words[message_lower], user)
+            # Saludos, agradecimientos, confirmaciones, etc. - Responder directamente
+            logger.info(f"INTENT: {intent['intent']} detectado - {message}")
             
-            # 3. PREGUNTAS SIMPLES - Responder directamente sin crear entrada
-            simple_questions = [
-                '¿qué tal?', 'que tal?', 'como va todo', 'cómo va todo',
-                'how is it going', 'whats up', 'what\'s up', 'qué pasa',
-                'que pasa', 'todo bien', '¿todo bien?', 'como estas',
-                'cómo estás', 'how are you doing'
-            ]
-            
-            if any(q in message_lower for q in simple_questions):
-                logger.info(f"INTENT: Pregunta simple detectada - {message}")
-                
-                response = "Todo excelente! En que te puedo ayudar hoy?"
-                
-                await whatsapp_cloud_service.send_text_message(
-                    to=user['whatsapp_number'],
-                    message=response
-                )
-                
-                return {
-                    'should_handle_directly': True,
-                    'status': 'handled',
-                    'type': 'simple_question',
-                    'message': 'Pregunta simple respondida'
-                }
-            
-            # 4. AGRADECIMIENTOS - Responder cordialmente
-            thanks = [
-                'gracias', 'thanks', 'thank you', 'muchas gracias', 'perfecto gracias',
-                'ok gracias', 'excelente gracias', 'genial gracias', 'perfect thanks'
-            ]
-            
-            if any(thank in message_lower for thank in thanks):
-                logger.info(f"INTENT: Agradecimiento detectado - {message}")
-                
-                responses = [
-                    "De nada!", 
-                    "Un placer ayudarte!",
-                    "Para eso estoy!",
-                    "Siempre a tu disposicion!"
-                ]
-                
-                import random
-                response = random.choice(responses)
-                
-                await whatsapp_cloud_service.send_text_message(
-                    to=user['whatsapp_number'],
-                    message=response
-                )
-                
-                return {
-                    'should_handle_directly': True,
-                    'status': 'handled',
-                    'type': 'thanks',
-                    'message': 'Agradecimiento respondido'
-                }
-            
-            # 5. MENSAJES MUY CORTOS Y AMBIGUOS - Pedir clarificación
-            if len(message_lower) <= 2 or message_lower in ['ok', 'si', 'sí', 'no', 'bien', 'mal', 'mmm', 'ahh', 'ohh']:
-                logger.info(f"INTENT: Mensaje muy corto/ambiguo - {message}")
-                
-                response = "Podrias ser mas especifico? Dime que necesitas y te ayudo."
-                
-                await whatsapp_cloud_service.send_text_message(
-                    to=user['whatsapp_number'],
-                    message=response
-                )
-                
-                return {
-                    'should_handle_directly': True,
-                    'status': 'handled',
-                    'type': 'ambiguous',
-                    'message': 'Mensaje ambiguo, pidiendo clarificación'
-                }
-            
-            # 6. EMOJIS SOLOS - Responder de forma amigable
-            if all(ord(char) > 127 for char in message.strip()) and len(message.strip()) <= 10:  # Solo emojis/símbolos
-                logger.info(f"INTENT: Solo emojis detectados - {message}")
-                
-                response = "Entendido!"
-                
-                await whatsapp_cloud_service.send_text_message(
-                    to=user['whatsapp_number'],
-                    message=response
-                )
-                
-                return {
-                    'should_handle_directly': True,
-                    'status': 'handled',
-                    'type': 'emoji_only',
-                    'message': 'Emoji respondido'
-                }
+            await whatsapp_cloud_service.send_text_message(
+                to=user['whatsapp_number'],
+                message=intent['response']
+            )
             
-            # 7. Si llegamos aquí, es contenido real que debe procesarse con Gemini
-            logger.info(f"INTENT: Contenido real detectado, enviando a Gemini - {message[:50]}...")
             return {
-                'should_handle_directly': False,
-                'type': 'real_content'
+                'should_handle_directly': True,
+                'status': 'handled',
+                'type': intent['intent'],
+                'message': intent['summary']
             }
             
         except Exception as e:
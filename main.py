@@ -5,12 +5,22 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from loguru import logger
+import asyncio
+import signal
 import sys
 
-from app.config import settings
-from api.routes import webhook, stats, health, integrations, whatsapp_cloud, payment_webhook
+from app.config import reload_settings, settings
+from api.routes import webhook, stats, health, integrations, whatsapp_cloud, payment_webhook, admin
 from api.middleware import LoggingMiddleware, ErrorHandlerMiddleware
 from services.reminder_scheduler import reminder_scheduler
+from services.message_queue import message_queue
+from services.message_dedup import message_dedup
+from services.message_coalescer import message_coalescer
+from services.album_collector import album_collector
+from core.supabase import supabase
+from services.gemini_calls import gemini_calls
+from services.image_preprocessor import image_preprocessor
+from services.media_fetcher import media_fetcher
 
 
 # Configurar Loguru (siempre, incluso con Uvicorn)
@@ -22,6 +32,14 @@ logger.add(
 )
 logger.add("logs/app.log", rotation="10 MB", retention="10 days", level="INFO")
 
+def reload_settings_on_signal():
+    """SIGHUP: recarga .env (rotación de tokens) sin reiniciar"""
+    try:
+        changed = reload_settings()
+        logger.info(f"SIGHUP: configuración recargada; campos cambiados: {changed}")
+    except Exception as e:
+        logger.error(f"SIGHUP: configuración inválida, se mantiene la anterior: {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manejo del ciclo de vida de la aplicación"""
@@ -33,12 +51,44 @@ async def lifespan(app: FastAPI):
     await reminder_scheduler.start()
     logger.info("✅ Sistema de recordatorios y mensajes automáticos iniciado")
     
+    # Descubrir columnas de las tablas principales (evita sondeos en cada escritura)
+    try:
+        await supabase.load_schema()
+    except Exception as e:
+        logger.warning(f"No se pudo cargar el schema de Supabase: {e}")
+    
+    # Restaurar IDs de mensajes ya vistos (si hay snapshot configurado) y guardarlos periódicamente
+    message_dedup.load_snapshot()
+    message_dedup.start_autosave()
+    
+    # Iniciar pool de workers para mensajes entrantes
+    await message_queue.start()
+    
+    # `kill -HUP <pid>` recarga la configuración (no disponible en Windows)
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_settings_on_signal)
+    except (AttributeError, NotImplementedError, RuntimeError):
+        logger.info("Recarga por SIGHUP no disponible; usar POST /api/admin/settings/reload")
+    
     yield
     
     # Shutdown
     logger.info("Cerrando aplicación")
+    
+    # Encolar ráfagas y álbumes aún en ventana y drenar mensajes pendientes antes de detener el resto de servicios
+    await message_coalescer.flush_all()
+    await album_collector.flush_all()
+    await message_queue.stop()
+    await message_dedup.stop_autosave()
+    message_dedup.save_snapshot()
+    
     await reminder_scheduler.stop()
     logger.info("⏹️ Sistema de recordatorios detenido")
+    
+    supabase.shutdown()
+    gemini_calls.shutdown()
+    image_preprocessor.shutdown()
+    await media_fetcher.close()
 
 # Crear aplicación
 app = FastAPI(
@@ -72,6 +122,7 @@ app.include_router(whatsapp_cloud.router, prefix="/webhook/cloud", tags=["WhatsA
 app.include_router(payment_webhook.router, prefix="/webhook/payment", tags=["Payment Webhooks"])
 app.include_router(stats.router, prefix="/api/stats", tags=["Statistics"])
 app.include_router(integrations.router, prefix="/api", tags=["Integrations"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,7 +1,7 @@
 """
 Middleware para verificar acceso según plan del usuario
 """
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from loguru import logger
 from services.premium_service import premium_service
 
@@ -184,19 +184,26 @@ Esta función requiere un plan de pago.
 • `/help` - Ver comandos disponibles"""
 
 
-async def check_task_creation_limit(user_context: Dict[str, Any]) -> Dict[str, Any]:
+async def check_task_creation_limit(user_context: Dict[str, Any],
+                                    entitlements: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Verifica específicamente si el usuario puede crear más tareas
+    
+    Args:
+        user_context: Contexto del usuario
+        entitlements: Accesos ya resueltos por `supabase.load_request_context`
+            (evita las llamadas a check_feature_access)
     """
-    access_result = await verify_feature_access(user_context, 'unlimited_tasks')
+    entitlements = entitlements or {}
+    access_result = entitlements.get('unlimited_tasks') or await verify_feature_access(user_context, 'unlimited_tasks')
     
-    if access_result['has_access']:
+    if access_result.get('has_access'):
         return {'can_create': True}
     
     # Si no tiene acceso ilimitado, verificar límites del plan FREE
-    free_access = await verify_feature_access(user_context, 'limited_tasks')
+    free_access = entitlements.get('limited_tasks') or await verify_feature_access(user_context, 'limited_tasks')
     
-    if free_access['has_access']:
+    if free_access.get('has_access'):
         remaining = free_access.get('remaining_tasks', 0)
         return {
             'can_create': True,
@@ -207,6 +214,6 @@ async def check_task_creation_limit(user_context: Dict[str, Any]) -> Dict[str, A
     else:
         return {
             'can_create': False,
-            'reason': free_access['reason'],
+            'reason': free_access.get('reason'),
             'upgrade_message': get_upgrade_message(free_access, 'tareas')
         }
\ No newline at end of file
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark del clasificador de intenciones: costo por mensaje en microsegundos
+comparado con las listas lineales que usaba detect_user_intent
+
+Uso: python scripts/benchmark_intents.py [iteraciones]
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.intent_classifier import intent_classifier
+
+MESSAGES = [
+    "hola", "Hola!!", "buenas tardes", "holaaa como estas?", "ok gracias", "muchas gracias korei",
+    "perfecto", "dale", "👍", "ayuda", "que puedes hacer", "mis tareas", "mañana",
+    "gasté 5000 en almuerzo", "reunión con el equipo mañana a las 3 en la oficina",
+    "recordame llamar a mamá el viernes en la tarde",
+    "tengo que terminar el informe de ventas antes del lunes y enviarlo a Carlos",
+    "gracias, mañana tengo cita con el dentista a las 10",
+]
+
+# Listas de la versión anterior de detect_user_intent (referencia)
+LEGACY_GREETINGS = [
+    'hola', 'hello', 'hi', 'hey', 'buenas', 'buenos días', 'buenas tardes',
+    'buenas noches', 'good morning', 'good afternoon', 'good evening',
+    'qué tal', 'como estas', 'como estás', 'how are you', 'saludos'
+]
+LEGACY_COMMANDS = {
+    'help': '/help', 'ayuda': '/help', 'stats': '/stats', 'estadisticas': '/stats',
+    'estadísticas': '/stats', 'hoy': '/hoy', 'today': '/hoy', 'mañana': '/mañana',
+    'tomorrow': '/mañana', 'agenda': '/agenda', 'schedule': '/agenda', 'tareas': '/tareas',
+    'tasks': '/tareas', 'profile': '/profile', 'perfil': '/perfil'
+}
+LEGACY_QUESTIONS = [
+    '¿qué tal?', 'que tal?', 'como va todo', 'cómo va todo', 'how is it going', 'whats up',
+    'what\'s up', 'qué pasa', 'que pasa', 'todo bien', '¿todo bien?', 'como estas',
+    'cómo estás', 'how are you doing'
+]
+LEGACY_THANKS = [
+    'gracias', 'thanks', 'thank you', 'muchas gracias', 'perfecto gracias',
+    'ok gracias', 'excelente gracias', 'genial gracias', 'perfect thanks'
+]
+
+
+def legacy_classify(message: str):
+    message_lower = message.lower().strip()
+    if any(greeting == message_lower for greeting in LEGACY_GREETINGS):
+        return "greeting"
+    if message_lower in LEGACY_COMMANDS:
+        return "command"
+    if any(q in message_lower for q in LEGACY_QUESTIONS):
+        return "simple_question"
+    if any(thank in message_lower for thank in LEGACY_THANKS):
+        return "thanks"
+    if len(message_lower) <= 2 or message_lower in ['ok', 'si', 'sí', 'no', 'bien', 'mal', 'mmm', 'ahh', 'ohh']:
+        return "ambiguous"
+    if all(ord(char) > 127 for char in message.strip()) and len(message.strip()) <= 10:
+        return "emoji_only"
+    return None
+
+
+def measure(classify, iterations: int) -> float:
+    """Microsegundos promedio por mensaje"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for message in MESSAGES:
+            classify(message)
+    return (time.perf_counter() - started) / (iterations * len(MESSAGES)) * 1_000_000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    print(f"{'Mensaje':55} {'anterior':>16} {'clasificador':>16}")
+    print("-" * 89)
+    for message in MESSAGES:
+        result = intent_classifier.classify(message)
+        print(f"{message[:55]:55} {str(legacy_classify(message)):>16} {str(result and result['intent']):>16}")
+
+    legacy_us = measure(legacy_classify, iterations)
+    classifier_us = measure(intent_classifier.classify, iterations)
+
+    print()
+    print(f"Mensajes: {len(MESSAGES)} x {iterations} iteraciones")
+    legacy_phrases = len(LEGACY_GREETINGS) + len(LEGACY_COMMANDS) + len(LEGACY_QUESTIONS) + len(LEGACY_THANKS)
+    print(f"Listas lineales:  {legacy_us:8.2f} µs/mensaje ({legacy_phrases} frases, costo crece con cada frase)")
+    print(f"Clasificador:     {classifier_us:8.2f} µs/mensaje ({intent_classifier.load()} frases, costo por token)")
+
+
+if __name__ == "__main__":
+    main()
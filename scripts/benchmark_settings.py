@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Benchmark del costo de configuración por envío de WhatsApp: releer .env y
+validar Settings dos veces (headers + URL, versión anterior) contra el
+snapshot que usa WhatsAppCloudService
+
+Uso: python scripts/benchmark_settings.py [iteraciones]
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import get_settings
+from services.whatsapp_cloud import whatsapp_cloud_service
+
+
+def legacy_endpoint():
+    """_get_headers() + _get_base_url() de la versión anterior"""
+    headers = {
+        "Authorization": f"Bearer {get_settings().whatsapp_access_token.strip()}",
+        "Content-Type": "application/json"
+    }
+    return f"https://graph.facebook.com/v18.0/{get_settings().whatsapp_phone_number_id}", headers
+
+
+def snapshot_endpoint():
+    return whatsapp_cloud_service._get_base_url(), whatsapp_cloud_service._get_headers()
+
+
+def measure(endpoint, iterations: int) -> float:
+    """Microsegundos promedio por envío"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        endpoint()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    legacy_us = measure(legacy_endpoint, iterations)
+    snapshot_us = measure(snapshot_endpoint, iterations * 100)
+
+    print(f"Envíos simulados: {iterations} (anterior) / {iterations * 100} (snapshot)")
+    print(f"get_settings() x2 por envío: {legacy_us:10.2f} µs/envío (lee .env y valida Settings)")
+    print(f"Snapshot:                    {snapshot_us:10.2f} µs/envío")
+    print(f"Ahorro:                      {legacy_us / snapshot_us:10.0f}x")
+
+
+if __name__ == "__main__":
+    main()
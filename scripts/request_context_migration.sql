@@ -0,0 +1,66 @@
+-- Migración: contexto de request en un solo viaje a la base de datos
+-- Ejecutar después de tiered_plans_migration.sql y database_migrations.sql
+
+-- 1. Función que devuelve usuario, perfil, plan e integraciones juntos
+--    (reemplaza 4-6 llamadas PostgREST secuenciales por mensaje)
+CREATE OR REPLACE FUNCTION get_request_context(phone_input VARCHAR)
+RETURNS JSONB AS $$
+DECLARE
+    clean_phone VARCHAR;
+    user_record users%ROWTYPE;
+    profile_json JSONB;
+    unlimited_access JSONB;
+    limited_access JSONB;
+    services JSONB;
+BEGIN
+    clean_phone := regexp_replace(phone_input, '[^0-9]', '', 'g');
+
+    -- Formato nuevo primero, luego el legacy de WAHA (@c.us)
+    SELECT * INTO user_record
+    FROM users
+    WHERE whatsapp_number IN (clean_phone, clean_phone || '@c.us')
+    ORDER BY (whatsapp_number = clean_phone) DESC
+    LIMIT 1;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('user', NULL);
+    END IF;
+
+    SELECT to_jsonb(p) INTO profile_json
+    FROM user_profiles p
+    WHERE p.user_id = user_record.id
+    LIMIT 1;
+
+    -- Reutiliza las reglas de planes existentes (también resetea el contador mensual)
+    unlimited_access := check_feature_access(user_record.id, 'unlimited_tasks');
+    IF (unlimited_access->>'has_access')::BOOLEAN THEN
+        limited_access := NULL;
+    ELSE
+        limited_access := check_feature_access(user_record.id, 'limited_tasks');
+    END IF;
+
+    SELECT COALESCE(jsonb_agg(service), '[]'::JSONB) INTO services
+    FROM user_integrations
+    WHERE user_id = user_record.id AND status = 'active';
+
+    -- Releer el usuario por si check_feature_access reseteó el contador
+    SELECT * INTO user_record FROM users WHERE id = user_record.id;
+
+    RETURN jsonb_build_object(
+        'user', to_jsonb(user_record),
+        'profile', profile_json,
+        'entitlements', jsonb_build_object(
+            'plan_type', COALESCE(user_record.plan_type, 'free'),
+            'unlimited_tasks', unlimited_access,
+            'limited_tasks', limited_access
+        ),
+        'remaining_tasks', limited_access->'remaining_tasks',
+        'integrations', services
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- 2. Índice para la búsqueda por teléfono (ambos formatos)
+CREATE INDEX IF NOT EXISTS idx_users_whatsapp_number ON users(whatsapp_number);
+
+COMMENT ON FUNCTION get_request_context IS 'Usuario, perfil, plan/límites e integraciones activas en una sola llamada (usado por SupabaseService.load_request_context)';
@@ -0,0 +1,37 @@
+"""
+Agrupación de imágenes seguidas de un mismo usuario (álbumes)
+"""
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from services.lane_buffer import LaneBuffer
+from services.message_queue import MessageQueue
+
+
+class AlbumCollector(LaneBuffer):
+    """
+    Ventana de debounce por usuario para imágenes: WhatsApp entrega cada
+    foto de un álbum como un mensaje aparte (en el mismo webhook o con
+    segundos de diferencia). Las imágenes se acumulan y, cuando pasan
+    `window_seconds` sin imágenes nuevas o se llega a `max_images`, se
+    encolan juntas en el carril del usuario para procesarlas con una sola
+    llamada a Gemini y una sola respuesta.
+    """
+
+    name = "AlbumCollector"
+
+    def __init__(self, window_seconds: Optional[float] = None, max_images: Optional[int] = None,
+                 queue: Optional[MessageQueue] = None):
+        super().__init__(
+            window_seconds if window_seconds is not None else settings.image_album_window_seconds,
+            max_images or settings.image_album_max_images,
+            queue
+        )
+
+    def merge(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """El handler recibe `messages` con los mensajes de imagen en orden de llegada"""
+        return {"messages": items}
+
+
+# Instancia singleton usada por el webhook de WhatsApp Cloud
+album_collector = AlbumCollector()
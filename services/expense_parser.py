@@ -0,0 +1,277 @@
+"""
+Parser determinístico para gastos e ingresos simples (sin LLM)
+"""
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytz
+from loguru import logger
+
+from app.config import settings
+
+
+def strip_accents(text: str) -> str:
+    """Quita tildes, diéresis y la virgulilla de la ñ; conserva la longitud de un texto NFC"""
+    return ''.join(
+        char for char in unicodedata.normalize('NFD', text)
+        if unicodedata.category(char) != 'Mn'
+    )
+
+
+def parse_number(number: str) -> float:
+    """
+    "18.500" y "18,500" son miles; "2.5" y "2,5" son decimales; con
+    ambos separadores el último es el decimal ("1.250,50")
+    """
+    separators = [char for char in number if char in ".,"]
+    if not separators:
+        return float(number)
+
+    last = max(number.rfind('.'), number.rfind(','))
+    decimals = number[last + 1:]
+    if len(set(separators)) == 1 and (len(separators) > 1 or len(decimals) == 3):
+        return float(re.sub(r"[.,]", "", number))
+
+    integer = re.sub(r"[.,]", "", number[:last])
+    return float(f"{integer}.{decimals}")
+
+
+# Verbo (sin tildes) -> (tipo, etiqueta para la descripción)
+VERBS: Tuple[Tuple[str, str, str], ...] = (
+    ("me pagaron", "ingreso", "Pago recibido"),
+    ("me depositaron", "ingreso", "Depósito recibido"),
+    ("me transfirieron", "ingreso", "Transferencia recibida"),
+    ("me dieron", "ingreso", "Ingreso"),
+    ("me costo", "gasto", "Gasto"),
+    ("gaste", "gasto", "Gasto"),
+    ("pague", "gasto", "Pago"),
+    ("compre", "gasto", "Compra"),
+    ("inverti", "gasto", "Inversión"),
+    ("cobre", "ingreso", "Cobro"),
+    ("recibi", "ingreso", "Ingreso"),
+    ("gane", "ingreso", "Ganancia"),
+)
+
+# Monto: ₡/$ opcional, número con miles por punto/coma o decimales,
+# multiplicador (mil, k, millones) y moneda opcional
+AMOUNT_PATTERN = re.compile(
+    r"(?P<prefix>₡|¢|\$|us\$)?\s*"
+    r"(?P<number>\d{1,3}(?:[.,]\d{3})+(?:[.,]\d{1,2})?|\d+(?:[.,]\d+)?)"
+    r"(?:\s*(?P<multiplier>mil(?:lones|lon)?\b|k\b))?"
+    r"(?:\s*(?P<currency>colones|colon|rojos|dolares|dolar|usd|crc)\b)?"
+)
+
+MULTIPLIERS = {"mil": 1_000, "k": 1_000, "millon": 1_000_000, "millones": 1_000_000}
+USD_MARKERS = {"$", "us$", "dolares", "dolar", "usd"}
+
+# Palabras que indican algo futuro, hipotético o negado: no es un movimiento ya hecho
+BLOCKERS = re.compile(
+    r"\b(no|nunca|tengo que|hay que|debo|voy a|recordar|recordame|recuerdame|"
+    r"manana|pasado manana|proximo|proxima|si)\b"
+)
+
+# Referencias de tiempo que el parser resuelve; cualquier otra va al LLM
+DAY_OFFSETS = {"hoy": 0, "ayer": -1, "anoche": -1, "antier": -2, "anteayer": -2}
+OTHER_TIME_WORDS = re.compile(
+    r"\b(lunes|martes|miercoles|jueves|viernes|sabado|domingo|semana|mes|"
+    r"a las|en la manana|en la tarde|en la noche|\d{1,2}:\d{2}|\d{1,2}/\d{1,2})\b"
+)
+
+LEADING_CONNECTORS = re.compile(r"^(?:en|de|por|para|del|el|la|los|las|un|una|unos|unas)\b\s*")
+# "compré un celular de 300 mil": al quitar el monto queda un conector al final
+TRAILING_CONNECTORS = re.compile(r"\s*\b(?:en|de|por|para|con|a|al|del|el|la|los|las|un|una|unos|unas)$")
+
+
+class ExpenseParser:
+    """
+    Reconoce mensajes de gasto/ingreso de un solo movimiento ("gasté 5000
+    en almuerzo", "me pagaron 250 mil", "pagué la luz 18.500") y construye
+    el mismo dict que `GeminiService.process_message`, con una confianza.
+    `MessageHandler.handle_text` omite el LLM cuando la confianza supera
+    `expense_parser_min_confidence`.
+
+    Lo que no entiende con certeza (varios montos, dólares, fechas
+    distintas de hoy/ayer, frases negadas o futuras) se deja al LLM.
+    """
+
+    def __init__(self, min_confidence: Optional[float] = None):
+        self.enabled = settings.expense_parser_enabled
+        self.min_confidence = min_confidence if min_confidence is not None else settings.expense_parser_min_confidence
+        self.tz = pytz.timezone(settings.timezone)
+        self.stats = {
+            "attempts": 0,
+            "bypassed": 0,
+            "low_confidence": 0,
+            "no_match": 0
+        }
+
+    def parse(self, message: str, current_time: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Interpreta el mensaje como un gasto/ingreso
+
+        Returns:
+            Dict con las claves de `process_message` más "confidence",
+            o None si el mensaje no es un movimiento simple
+        """
+        text = strip_accents(message.lower()).strip()
+        if not text or '?' in text or BLOCKERS.search(text):
+            return None
+
+        verb = self._find_verb(text)
+        if verb is None:
+            return None
+        verb_text, entry_type, label = verb
+
+        amounts = self._find_amounts(text)
+        if len(amounts) != 1:
+            # Sin monto o con varios ítems: que lo resuelva el LLM
+            return None
+        (amount, is_usd), span = amounts[0]
+        if amount <= 0:
+            return None
+
+        current_time = current_time or datetime.now(self.tz)
+        remainder, day_offset, extra_time = self._extract_description(message, text, verb_text, span)
+
+        # Un ingreso se entiende sin más detalle; un gasto necesita en qué
+        confidence = 0.6
+        if remainder:
+            confidence += 0.3
+            if len(remainder.split()) > 8:
+                confidence -= 0.2
+        elif entry_type == "ingreso":
+            confidence += 0.2
+        if is_usd:
+            # Sin soporte de moneda en entries: dejar que el LLM decida
+            confidence = min(confidence, 0.5)
+        if extra_time:
+            confidence = min(confidence, 0.5)
+
+        moment = current_time + timedelta(days=day_offset)
+        description = f"{label} {self._connector(label)} {remainder}" if remainder else label
+
+        return {
+            "type": entry_type,
+            "description": description[:200],
+            "amount": amount,
+            "datetime": moment.isoformat(),
+            "datetime_end": moment.isoformat(),
+            "priority": "media",
+            "recurrence": "none",
+            "task_category": None,
+            "status": "completed",
+            "confidence": round(confidence, 2)
+        }
+
+    def try_parse(self, message: str, current_time: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Resultado listo para guardar si el parser está seguro; None para
+        seguir con el LLM. Lleva la cuenta de la tasa de omisión del LLM.
+        """
+        if not self.enabled:
+            return None
+
+        self.stats["attempts"] += 1
+        try:
+            result = self.parse(message, current_time)
+        except Exception as e:
+            logger.warning(f"ExpenseParser: error interpretando '{message[:50]}': {e}")
+            result = None
+
+        if result is None:
+            self.stats["no_match"] += 1
+            return None
+
+        if result["confidence"] < self.min_confidence:
+            self.stats["low_confidence"] += 1
+            return None
+
+        self.stats["bypassed"] += 1
+        logger.info(f"ExpenseParser: {result['type']} de {result['amount']} sin LLM (confianza {result['confidence']})")
+        result.pop("confidence")
+        return result
+
+    def _find_verb(self, text: str) -> Optional[Tuple[str, str, str]]:
+        """Primer verbo conocido del mensaje (el más cercano al inicio)"""
+        found = []
+        for verb_text, entry_type, label in VERBS:
+            match = re.search(rf"\b{re.escape(verb_text)}\b", text)
+            if match:
+                found.append((match.start(), verb_text, entry_type, label))
+        if not found:
+            return None
+        _, verb_text, entry_type, label = min(found)
+        return verb_text, entry_type, label
+
+    def _find_amounts(self, text: str) -> List[Tuple[Tuple[float, bool], Tuple[int, int]]]:
+        """Montos del texto como ((monto, es_usd), (inicio, fin))"""
+        amounts = []
+        for match in AMOUNT_PATTERN.finditer(text):
+            value = parse_number(match.group("number"))
+            multiplier = match.group("multiplier")
+            if multiplier:
+                value *= MULTIPLIERS[multiplier]
+            markers = {match.group("prefix"), match.group("currency")}
+            amounts.append(((value, bool(markers & USD_MARKERS)), match.span()))
+        return amounts
+
+    def _extract_description(self, message: str, text: str, verb_text: str,
+                             amount_span: Tuple[int, int]) -> Tuple[str, int, bool]:
+        """
+        Texto restante sin verbo, monto ni referencias de día. Devuelve
+        (descripción, desplazamiento en días, hay otras referencias de tiempo)
+        """
+        # `text` no tiene tildes pero conserva las posiciones del mensaje original
+        original = unicodedata.normalize('NFC', message.strip())
+        if len(original) != len(text):
+            original = text
+
+        start, end = amount_span
+        remainder = original[:start] + " " + original[end:]
+        plain = text[:start] + " " + text[end:]
+
+        verb_match = re.search(rf"\b{re.escape(verb_text)}\b", plain)
+        if verb_match:
+            remainder = remainder[:verb_match.start()] + remainder[verb_match.end():]
+            plain = plain[:verb_match.start()] + plain[verb_match.end():]
+
+        day_offset = 0
+        for word, offset in DAY_OFFSETS.items():
+            word_match = re.search(rf"\b{word}\b", plain)
+            if word_match:
+                day_offset = offset
+                remainder = remainder[:word_match.start()] + remainder[word_match.end():]
+                plain = plain[:word_match.start()] + plain[word_match.end():]
+                break
+
+        extra_time = bool(OTHER_TIME_WORDS.search(plain))
+
+        remainder = re.sub(r"\s+", " ", remainder).strip(" .,;:!-")
+        connector = LEADING_CONNECTORS.match(strip_accents(remainder.lower()))
+        while connector and connector.end():
+            remainder = remainder[connector.end():]
+            connector = LEADING_CONNECTORS.match(strip_accents(remainder.lower()))
+        connector = TRAILING_CONNECTORS.search(strip_accents(remainder.lower()))
+        while connector and remainder:
+            remainder = remainder[:connector.start()].rstrip(" .,;:!-")
+            connector = TRAILING_CONNECTORS.search(strip_accents(remainder.lower()))
+        return remainder.strip(" .,;:!-"), day_offset, extra_time
+
+    def _connector(self, label: str) -> str:
+        return "en" if label == "Gasto" else "de"
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Intentos, omisiones del LLM y tasa de omisión"""
+        attempts = self.stats["attempts"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "min_confidence": self.min_confidence,
+            "bypass_rate": round(self.stats["bypassed"] / attempts, 4) if attempts else 0.0
+        }
+
+
+# Instancia singleton usada por MessageHandler.handle_text
+expense_parser = ExpenseParser()
@@ -1,7 +1,7 @@
 """
 Formatters para mensajes de WhatsApp
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 import pytz
 from app.config import settings
@@ -153,6 +153,41 @@ class MessageFormatter:
         
         return response.strip()
     
+    def format_album_response(self, results: List[Dict[str, Any]], failed: int = 0,
+                              outcomes: Optional[List[str]] = None) -> str:
+        """
+        Formatear una sola respuesta para un álbum de imágenes
+        
+        Args:
+            results: Entradas extraídas, una por imagen
+            failed: Imágenes que no se pudieron descargar
+            outcomes: Resultado del guardado de cada entry ("saved", "conflict",
+                "error" o "skipped"), en el mismo orden que `results`
+        
+        Returns:
+            Mensaje formateado para WhatsApp
+        """
+        notes = {
+            "conflict": "⚠️ No se creó: choca con otro evento de tu calendario",
+            "error": "❌ No se pudo guardar, envía esta imagen de nuevo"
+        }
+        outcomes = outcomes or []
+        
+        response = f"📷 **{len(results)} imágenes procesadas**\n\n"
+        items = []
+        for index, result in enumerate(results, 1):
+            item = f"{index}. {self.format_entry_response(result)}"
+            outcome = outcomes[index - 1] if index <= len(outcomes) else None
+            if outcome in notes:
+                item += f"\n{notes[outcome]}"
+            items.append(item)
+        response += "\n\n".join(items)
+        
+        if failed:
+            response += f"\n\n⚠️ {failed} imagen(es) no se pudieron descargar, envíalas de nuevo"
+        
+        return response.strip()
+    
     def format_error_message(self, error: str) -> str:
         """
         Formatear mensaje de error
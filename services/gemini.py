@@ -2,30 +2,97 @@
 Servicio Gemini que maneja TODO: texto, audio e imágenes
 """
 import google.generativeai as genai
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, timedelta
-import json
 import pytz
 from loguru import logger
 from app.config import settings
-import PIL.Image
-import io
 import asyncio
+import time
+import inspect
+import tempfile
 from functools import wraps
 
+from pydantic import ValidationError
+
+from core.cache import TTLCache
+from core.metrics import LatencyHistogram
+from core.schemas import (
+    GeminiAlbumResponse, GeminiAudioEntryResponse, GeminiEntryResponse, GeminiImageEntryResponse
+)
+from services.expense_parser import expense_parser
+from services.gemini_calls import gemini_calls
+from services.gemini_prompts import (
+    ALBUM_ATTACHED_MESSAGE, IMAGE_ATTACHED_MESSAGE, IMAGE_MARKER, PREFIX_TOKENS, VOICE_NOTE_MESSAGE, assemble_prompt, estimate_tokens
+)
+from services.gemini_quota import QuotaExhausted, gemini_quota
+from services.image_preprocessor import image_preprocessor
+from services.media_cache import content_digest, media_cache
+
+# Tokens estimados de la respuesta y de un adjunto, para reservar cuota
+RESPONSE_TOKENS = 150
+MEDIA_TOKENS = 1000  # Imagen (~258) o archivo subido
+AUDIO_BYTES_PER_TOKEN = 60  # Opus de WhatsApp ~2 KB/s y Gemini ~32 tokens por segundo
+
+# Campo inválido de GeminiEntryResponse -> motivo para el router
+DECODE_REASONS = {
+    "type": "invalid_type",
+    "description": "missing_description",
+    "amount": "invalid_amount",
+    "datetime": "invalid_datetime",
+    "confidence": "invalid_schema"
+}
+
+
+class StageTimer:
+    """Milisegundos por etapa de un pipeline de media"""
+    
+    def __init__(self):
+        self.started = self.mark = time.monotonic()
+        self.timings: Dict[str, float] = {}
+    
+    def lap(self, stage: str) -> None:
+        """Cierra la etapa que empezó en la marca anterior"""
+        now = time.monotonic()
+        self.timings[stage] = round((now - self.mark) * 1000, 1)
+        self.mark = now
+    
+    def skip(self) -> None:
+        """Descarta el tiempo desde la marca anterior (etapa que falló)"""
+        self.mark = time.monotonic()
+    
+    def finish(self) -> None:
+        self.timings["total"] = round((time.monotonic() - self.started) * 1000, 1)
+
+
+class GeminiDecodeError(ValueError):
+    """La respuesta de Gemini no es JSON válido o no cumple GeminiEntryResponse"""
+    
+    def __init__(self, reason: str, detail: str):
+        super().__init__(f"{reason}: {detail}")
+        self.reason = reason
+
+
+def json_generation_config() -> Optional[Dict[str, Any]]:
+    """
+    JSON mode de Gemini cuando el SDK lo soporta; con google-generativeai
+    0.3.2 no existe y se depende del prompt más el decoder tipado
+    """
+    if not settings.gemini_json_mode:
+        return None
+    if "response_mime_type" not in inspect.signature(genai.types.GenerationConfig).parameters:
+        return None
+    return {"response_mime_type": "application/json"}
+
+
 def with_timeout(timeout_seconds: int = 30):
     """Decorator para agregar timeout a métodos síncronos de Gemini"""
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
             try:
-                # Ejecutar función síncrona en thread pool con timeout
-                return await asyncio.wait_for(
-                    asyncio.get_event_loop().run_in_executor(
-                        None, lambda: func(*args, **kwargs)
-                    ),
-                    timeout=timeout_seconds
-                )
+                # Ejecutar función síncrona en el executor de Gemini con timeout
+                return await gemini_calls.run_sync(lambda: func(*args, **kwargs), timeout_seconds)
             except asyncio.TimeoutError:
                 logger.error(f"Timeout en {func.__name__} después de {timeout_seconds}s")
                 raise TimeoutError(f"Gemini tardó más de {timeout_seconds} segundos")
@@ -36,31 +103,107 @@ class GeminiService:
     def __init__(self):
         genai.configure(api_key=settings.gemini_api_key)
         
-        # Modelo para texto
-        self.model = genai.GenerativeModel('gemini-1.5-pro')
+        # Modelo para texto complejo y audio
+        self.model = genai.GenerativeModel(settings.gemini_pro_model)
         
         # Modelo para multimodal (imágenes + texto)
-        self.vision_model = genai.GenerativeModel('gemini-1.5-flash')
+        self.vision_model = genai.GenerativeModel(settings.gemini_fast_model)
+        
+        # Primer intento del router de texto: el mismo modelo rápido
+        self.fast_model = self.vision_model
+        
+        # Cupo de llamadas en vuelo, executor propio y métricas de cola
+        self.calls = gemini_calls
+        
+        # RPM/TPM por API key y pool de keys
+        self.quota = gemini_quota
         
         self.tz = pytz.timezone(settings.timezone)
         
+        # Bloques de contexto derivados de entries por usuario; se invalidan
+        # cuando SupabaseService escribe entries de ese usuario
+        self.prompt_context_cache = TTLCache(
+            max_size=settings.prompt_context_cache_size,
+            ttl_seconds=settings.prompt_context_ttl_seconds,
+            name="prompt_context"
+        )
+        self.stats = {
+            "context_builds": 0,
+            "context_build_ms": 0.0,
+            "context_errors": 0
+        }
+        
+        # Tokens estimados por prompt (prefijo fijo + sección del usuario)
+        self.prompt_stats = {
+            "prompts": 0,
+            "total_tokens": 0,
+            "dynamic_tokens": 0,
+            "dropped": {},
+            "last": None
+        }
+        
+        # Router de modelos: conteo por ruta, motivos y latencia por modelo
+        self.route_stats = {
+            "fast": 0,
+            "pro": 0,
+            "escalated": 0,
+            "degraded_to_fast": 0,
+            "degraded_to_rules": 0,
+            "reasons": {}
+        }
+        self.latency = {
+            "fast": LatencyHistogram(),
+            "pro": LatencyHistogram()
+        }
+        
+        # Hedging: llamadas elegibles, hedges lanzados y quién respondió primero
+        self.hedge_stats = {
+            "eligible": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "primary_wins": 0,
+            "skipped_no_budget": 0
+        }
+        
+        # Notas de voz e imágenes: conteos y latencia por etapa
+        self.media_stats = {
+            "audio": {"inline": 0, "upload": 0, "cache": 0},
+            "image": {"processed": 0, "direction_corrected": 0, "cache": 0},
+            "album": {"albums": 0, "images": 0, "unreadable": 0, "entries": 0}
+        }
+        self.media_stages: Dict[str, Dict[str, LatencyHistogram]] = {"audio": {}, "image": {}, "album": {}}
+        self.media_cache = media_cache
+        
+        # Decodificación de respuestas por modelo (ruta)
+        self.generation_config = json_generation_config()
+        self.decode_stats = {
+            route: {"model": model_name, "decoded": 0, "unwrapped": 0, "failures": 0, "reasons": {}}
+            for route, model_name in (("fast", settings.gemini_fast_model), ("pro", settings.gemini_pro_model))
+        }
+        
+        # Importar aquí para evitar circular imports
+        from core.supabase import supabase
+        supabase.on_entries_changed(self.prompt_context_cache.delete)
+        
     async def process_message(self, message: str, user_context: Dict[str, Any]) -> Dict[str, Any]:
-        """Procesa mensaje de texto"""
+        """
+        Procesa mensaje de texto. Primero intenta con el modelo rápido y
+        escala a pro si la respuesta no valida, trae baja confianza o el
+        mensaje es largo/complejo desde el inicio. Todo el recorrido
+        respeta `gemini_message_deadline`.
+        """
+        deadline = time.monotonic() + settings.gemini_message_deadline
         try:
             current_time = datetime.now(self.tz)
             
             prompt = await self._build_prompt(message, user_context, current_time)
             
-            # Aplicar timeout de 30 segundos
-            response = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None, lambda: self.model.generate_content(prompt)
-                ),
-                timeout=30.0
-            )
-            
-            return self._extract_json(response.text)
+            route, reason = self._choose_route(message)
+            result = await self._route_request(prompt, route, reason, deadline)
+            return self._finalize_result(result)
             
+        except QuotaExhausted:
+            return self._degraded_result(message)
         except asyncio.TimeoutError:
             logger.error("Timeout procesando mensaje con Gemini")
             return self._get_fallback_response(f"Timeout procesando: {message[:50]}...")
@@ -68,235 +211,613 @@ class GeminiService:
             logger.error(f"Error procesando mensaje: {e}")
             return self._get_fallback_response(message)
     
-    async def extract_audio_context(self, audio_path: str, user_context: Dict[str, Any] = None) -> str:
+    async def _route_request(self, contents: Any, route: str, reason: Optional[str], deadline: float,
+                             schema=GeminiEntryResponse, pinned: bool = False) -> Dict[str, Any]:
         """
-        Extrae contexto de un archivo de audio sin procesarlo directamente
+        Modelo rápido con escalamiento a pro (o pro directo) dentro de
+        `deadline`; sin cupo en pro se degrada al modelo rápido
+        
+        Raises:
+            QuotaExhausted: si no hay cupo en ningún modelo
         """
-        try:
-            logger.info(f"GEMINI-AUDIO: Iniciando transcripción de {audio_path}")
-            
-            # Verificar que el archivo existe
-            import pathlib
-            import os
-            if not os.path.exists(audio_path):
-                raise FileNotFoundError(f"Archivo de audio no encontrado: {audio_path}")
-            
-            # Verificar tamaño del archivo
-            file_size = os.path.getsize(audio_path)
-            logger.info(f"GEMINI-AUDIO: Tamaño del archivo: {file_size} bytes")
-            
-            if file_size == 0:
-                raise ValueError("Archivo de audio está vacío")
-            
-            # Cargar archivo de audio usando la API actualizada
-            logger.info(f"GEMINI-AUDIO: Subiendo archivo a Gemini...")
-            audio_file = genai.upload_file(pathlib.Path(audio_path))
-            logger.info(f"GEMINI-AUDIO: Archivo subido exitosamente. ID: {audio_file.name}")
-            
-            # También leer para debugging
-            with open(audio_path, 'rb') as f:
-                audio_data = f.read()
-            logger.info(f"GEMINI-AUDIO: Archivo leído para debug. Tamaño: {len(audio_data)} bytes")
-            
-            current_time = datetime.now(self.tz)
-            
-            prompt = f"""
-            TRANSCRIBE este audio con MÁXIMA PRECISIÓN. Este es un usuario de Costa Rica que habla ESPAÑOL.
-            
-            CONTEXTO DEL USUARIO:
-            - Nombre: {user_context.get('name', 'Usuario') if user_context else 'Usuario'}
-            - País: Costa Rica (español costarricense)
-            - Fecha/Hora actual: {current_time.strftime('%Y-%m-%d %H:%M:%S')} (Costa Rica, UTC-6)
-            
-            VOCABULARIO COMÚN ESPERADO (COSTA RICA):
-            - "gasto", "gasté", "gastó" = expense/spent money
-            - "colones" = Costa Rican currency
-            - "plata", "dinero" = money
-            - "pagué", "pago" = I paid/payment
-            - "almuerzo", "desayuno", "cena" = meals
-            - "compré", "compra" = I bought/purchase
-            - "trabajo", "reunión", "cita" = work/meeting/appointment
-            - "mañana", "hoy", "ayer" = tomorrow/today/yesterday
-            
-            INSTRUCCIONES DE TRANSCRIPCIÓN:
-            1. Transcribe EXACTAMENTE lo que se dice en ESPAÑOL
-            2. Presta especial atención a palabras de FINANZAS y DINERO
-            3. Si el audio menciona cantidades, números o montos, transcríbelos con precisión
-            4. Si menciona "gasté", "compré", "pagué" - esto es MUY IMPORTANTE
-            5. Si no entiendes una palabra, escribe [inaudible] pero continúa con el resto
-            6. Mantén el acento y expresiones costarricenses
-            
-            FORMATO DE RESPUESTA:
-            - Responde SOLO con la transcripción directa
-            - NO agregues explicaciones ni formato JSON
-            - NO categorices ni analices, solo transcribe
-            - Ejemplo: "Gasté veinticinco mil colones en almuerzo en el restaurante de la esquina ayer"
-            
-            TRANSCRIPCIÓN DEL AUDIO:
-            """
+        if route == "fast":
+            self.route_stats["fast"] += 1
+            try:
+                timeout = min(settings.gemini_fast_timeout, deadline - time.monotonic())
+                result = await self._generate_json(self.fast_model, contents, "fast", timeout, schema, pinned)
+                reason = self._check_fast_result(result)
+                if reason is None:
+                    return result
+            except GeminiDecodeError as e:
+                logger.warning(f"Respuesta inválida del modelo rápido, escalando a pro: {e}")
+                reason = e.reason
+            except QuotaExhausted:
+                raise
+            except asyncio.TimeoutError:
+                reason = "fast_timeout"
+            except Exception as e:
+                logger.warning(f"Modelo rápido falló, escalando a pro: {e}")
+                reason = "fast_error"
             
-            # Aplicar timeout de 45 segundos (audio tarda más)
-            logger.info(f"GEMINI-AUDIO: Enviando prompt a Gemini con timeout de 45s...")
-            response = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None, lambda: self.model.generate_content([prompt, audio_file])
-                ),
-                timeout=45.0
+            self.route_stats["escalated"] += 1
+            logger.info(f"Router Gemini: escalando a pro ({reason})")
+        
+        self.route_stats["pro"] += 1
+        self.route_stats["reasons"][reason] = self.route_stats["reasons"].get(reason, 0) + 1
+        
+        # Lo que quede del presupuesto del mensaje
+        remaining = deadline - time.monotonic()
+        if remaining < settings.gemini_min_call_budget:
+            raise asyncio.TimeoutError()
+        try:
+            return await self._generate_json(self.model, contents, "pro", remaining, schema, pinned)
+        except QuotaExhausted:
+            if route == "fast":
+                raise
+            # Sin cupo en pro: degradar al modelo rápido (y luego a reglas)
+            self.route_stats["degraded_to_fast"] += 1
+            return await self._generate_json(
+                self.fast_model, contents, "fast", deadline - time.monotonic(), schema, pinned
             )
-            
-            logger.info(f"GEMINI-AUDIO: Respuesta recibida de Gemini")
-            
-            # Limpiar archivo temporal de Gemini
+    
+    def _choose_route(self, message: str) -> Tuple[str, Optional[str]]:
+        """
+        Ruta inicial del mensaje: ("fast", None) o ("pro", motivo). Los
+        mensajes largos o con varios ítems/líneas van directo a pro.
+        """
+        if not settings.gemini_router_enabled:
+            return "pro", "router_disabled"
+        
+        if len(message) > settings.gemini_route_max_chars:
+            return "pro", "long_message"
+        
+        # Líneas (ráfagas agrupadas), frases e ítems separados por comas o "y"
+        lowered = f" {message.lower()} "
+        clauses = (
+            1 + message.count('\n') + message.count('. ') + message.count(';')
+            + message.count(',') + lowered.count(' y ') + lowered.count(' además ')
+        )
+        if clauses > settings.gemini_route_max_clauses:
+            return "pro", "complex_message"
+        
+        return "fast", None
+    
+    async def _generate_json(self, model, contents: Any, route: str, timeout: float,
+                             schema=GeminiEntryResponse, pinned: bool = False) -> Dict[str, Any]:
+        """Entry decodificada de la ruta, con hedge si está habilitado; registra la latencia"""
+        started = time.monotonic()
+        try:
+            hedge = self._hedge_plan(route, timeout)
+            if hedge is None:
+                return await self._call_and_decode(model, contents, route, timeout, schema, pinned)
+            return await self._generate_hedged(model, contents, route, timeout, *hedge, schema, pinned)
+        finally:
+            self.latency[route].observe((time.monotonic() - started) * 1000)
+    
+    async def generate(self, model, contents: Any, route: str, timeout: float,
+                       pinned: bool = False, **kwargs):
+        """
+        Una llamada al modelo: reserva cuota en la key menos cargada (o en
+        la key 0 si `pinned`) y llama con el tiempo que quede de `timeout`.
+        Toda llamada a Gemini (también las de comandos) pasa por aquí.
+        
+        Raises:
+            QuotaExhausted: si ninguna key tiene cupo a tiempo
+        """
+        started = time.monotonic()
+        slot = await self.quota.acquire(
+            route, self._estimate_tokens(contents) + RESPONSE_TOKENS, pinned=pinned,
+            max_wait=min(self.quota.max_wait, max(timeout - settings.gemini_min_call_budget, 0))
+        )
+        try:
+            return await self.calls.generate(
+                self.quota.bind(model, slot), contents, timeout - (time.monotonic() - started), **kwargs
+            )
+        except Exception as e:
+            self.quota.report_error(slot, route, e)
+            raise
+    
+    async def _call_and_decode(self, model, contents: Any, route: str, timeout: float,
+                               schema=GeminiEntryResponse, pinned: bool = False) -> Dict[str, Any]:
+        """
+        Una llamada con cuota (ver `generate`) decodificada con `schema`
+        
+        Raises:
+            QuotaExhausted: si ninguna key tiene cupo a tiempo
+        """
+        kwargs = {"generation_config": self.generation_config} if self.generation_config else {}
+        response = await self.generate(model, contents, route, timeout, pinned=pinned, **kwargs)
+        return self._decode_entry(response.text, route, schema)
+    
+    def _estimate_tokens(self, contents: Any) -> int:
+        """Tokens estimados del prompt más adjuntos (imagen o audio en línea)"""
+        if isinstance(contents, str):
+            return estimate_tokens(contents)
+        total = 0
+        for part in contents:
+            if isinstance(part, str):
+                total += estimate_tokens(part)
+            elif isinstance(part, dict) and part.get("mime_type", "").startswith("audio/"):
+                total += len(part["data"]) // AUDIO_BYTES_PER_TOKEN
+            else:
+                total += MEDIA_TOKENS
+        return total
+    
+    def _degraded_result(self, message: str) -> Dict[str, Any]:
+        """
+        Sin cuota en ningún modelo: interpretación por reglas aunque tenga
+        baja confianza, o la respuesta por defecto
+        """
+        self.route_stats["degraded_to_rules"] += 1
+        result = expense_parser.parse(message)
+        if result is None:
+            return self._get_fallback_response(message)
+        result.pop("confidence")
+        return result
+    
+    def _hedge_plan(self, route: str, timeout: float) -> Optional[Tuple[Any, str, float]]:
+        """
+        (modelo, ruta, espera en segundos) del hedge, o None si está
+        deshabilitado o el hedge no alcanzaría a responder dentro del plazo
+        """
+        if not settings.gemini_hedge_enabled:
+            return None
+        self.hedge_stats["eligible"] += 1
+        
+        histogram = self.latency[route]
+        delay = settings.gemini_hedge_default_delay
+        if histogram.count >= settings.gemini_hedge_min_samples:
+            delay = histogram.percentile(settings.gemini_hedge_percentile) / 1000
+        
+        if timeout - delay < settings.gemini_min_call_budget:
+            self.hedge_stats["skipped_no_budget"] += 1
+            return None
+        
+        if route == "fast" or settings.gemini_hedge_model == "fast":
+            return self.fast_model, "fast", delay
+        return self.model, route, delay
+    
+    async def _generate_hedged(self, model, contents: Any, route: str, timeout: float,
+                               hedge_model, hedge_route: str, delay: float,
+                               schema=GeminiEntryResponse, pinned: bool = False) -> Dict[str, Any]:
+        """
+        Lanza la llamada principal y, si no respondió en `delay`, una
+        segunda; gana la primera respuesta válida y la otra se cancela.
+        Ambas terminan antes de `timeout`.
+        """
+        deadline = time.monotonic() + timeout
+        primary = asyncio.ensure_future(self._call_and_decode(model, contents, route, timeout, schema, pinned))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+            
+            self.hedge_stats["hedged"] += 1
+            logger.info(f"GEMINI-HEDGE: {route} sin respuesta en {delay:.1f}s, lanzando hedge ({hedge_route})")
+            hedge = asyncio.ensure_future(
+                self._call_and_decode(hedge_model, contents, hedge_route, deadline - time.monotonic(), schema, pinned)
+            )
+            tasks.add(hedge)
+            
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(deadline - time.monotonic(), 0),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        self.hedge_stats["hedge_wins" if task is hedge else "primary_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            # Ninguna respuesta válida: se propaga el último error
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    def _decode_entry(self, text: str, route: str, schema=GeminiEntryResponse) -> Dict[str, Any]:
+        """
+        Valida la respuesta contra `schema` (GeminiEntryResponse) en un solo paso
+        (parser JSON de pydantic-core, sin json.loads intermedio)
+        
+        Raises:
+            GeminiDecodeError: con el motivo ("invalid_json", "invalid_type", ...)
+        """
+        stats = self.decode_stats[route]
+        payload = text.strip()
+        if payload.startswith("```"):
+            # Sin JSON mode el modelo a veces envuelve la respuesta en ```json
+            payload = payload.strip("`").removeprefix("json").strip()
+            stats["unwrapped"] += 1
+        
+        try:
+            entry = schema.model_validate_json(payload)
+        except ValidationError as e:
+            error = e.errors()[0]
+            if error["type"].startswith("json"):
+                reason = "invalid_json"
+            else:
+                reason = DECODE_REASONS.get(error["loc"][0] if error["loc"] else None, "invalid_schema")
+            stats["failures"] += 1
+            stats["reasons"][reason] = stats["reasons"].get(reason, 0) + 1
+            logger.warning(f"GEMINI-DECODE ({route}): {reason} en {payload[:80]!r}")
+            raise GeminiDecodeError(reason, error["msg"]) from None
+        
+        stats["decoded"] += 1
+        return entry.model_dump(mode="json", exclude_unset=True)
+    
+    def _check_fast_result(self, result: Dict[str, Any]) -> Optional[str]:
+        """
+        Motivo para escalar la respuesta del modelo rápido, o None si es
+        aceptable. Tipo, prioridad y estado ya vienen validados por el decoder.
+        """
+        if "entries" in result:
+            # Álbum: basta una entry dudosa para escalar la llamada completa
+            for entry in result["entries"]:
+                reason = self._check_fast_result(entry)
+                if reason:
+                    return reason
+            return None
+        
+        if not result["description"].strip():
+            return "missing_description"
+        
+        if result["type"] in ("gasto", "ingreso"):
             try:
-                genai.delete_file(audio_file.name)
-                logger.info(f"GEMINI-AUDIO: Archivo temporal limpiado")
-            except Exception as cleanup_error:
-                logger.warning(f"GEMINI-AUDIO: Error limpiando archivo temporal: {cleanup_error}")
-            
-            transcription = response.text.strip()
-            logger.info(f"GEMINI-AUDIO: Transcripción exitosa: {transcription[:100]}...")
-            return transcription
+                if float(result.get("amount")) <= 0:
+                    return "invalid_amount"
+            except (TypeError, ValueError):
+                return "invalid_amount"
+        
+        if result.get("datetime"):
+            try:
+                datetime.fromisoformat(str(result["datetime"]).replace('Z', '+00:00'))
+            except ValueError:
+                return "invalid_datetime"
+        
+        confidence = result.get("confidence")
+        if confidence is not None and confidence < settings.gemini_route_min_confidence:
+            return "low_confidence"
+        
+        return None
+    
+    def _finalize_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Quita los campos del router que no se guardan en entries"""
+        result.pop("confidence", None)
+        if result.get("datetime", "") is None:
+            result.pop("datetime")  # "datetime": null equivale a no traerlo
+        return result
+    
+    def cached_voice_note(self, user_context: Dict[str, Any], fingerprint: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Nota de voz ya procesada según el `sha256` del webhook, para no
+        descargarla de nuevo. Un fallo aquí no cuenta: process_voice_note
+        vuelve a consultar con el hash de los bytes.
+        """
+        cached = self.media_cache.lookup(user_context.get("id"), "audio", fingerprint=fingerprint, count_miss=False)
+        if cached is None:
+            return None
+        self.media_stats["audio"]["cache"] += 1
+        return {**cached, "mode": "cache", "timings_ms": {}}
+    
+    async def process_voice_note(self, audio_data: bytes, user_context: Dict[str, Any],
+                                 mime_type: str = "audio/ogg", fingerprint: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Procesa una nota de voz en una sola llamada: el modelo transcribe y
+        extrae la entry a la vez. Las notas cortas van como bytes en línea;
+        solo las mayores a `gemini_inline_audio_max_bytes` se suben como
+        archivo (si el SDK tiene `upload_file`). Sin disco ni rutas fijas.
+        Una nota reenviada por el mismo usuario sale de `media_cache`.
+        
+        Returns:
+            {"result": entry, "transcription": str, "mode": "inline"|"upload"|"cache",
+             "timings_ms": {etapa: ms}}
+        """
+        user_id = user_context.get("id")
+        digest = content_digest(audio_data)
+        cached = self.media_cache.lookup(user_id, "audio", digest=digest, fingerprint=fingerprint)
+        if cached is not None:
+            self.media_stats["audio"]["cache"] += 1
+            return {**cached, "mode": "cache", "timings_ms": {}}
+        
+        deadline = time.monotonic() + settings.gemini_message_deadline
+        timer = StageTimer()
+        mode = "inline"
+        uploaded = None
+        answered = False
+        
+        try:
+            prompt = await self._build_prompt(VOICE_NOTE_MESSAGE, user_context, datetime.now(self.tz))
+            timer.lap("prompt")
+            
+            if len(audio_data) > settings.gemini_inline_audio_max_bytes and hasattr(genai, "upload_file"):
+                mode = "upload"
+                uploaded = await self._upload_audio(audio_data, mime_type)
+                timer.lap("upload")
+                attachment = uploaded
+            else:
+                attachment = {"mime_type": mime_type, "data": audio_data}
+            
+            route, reason = ("fast", None) if settings.gemini_router_enabled else ("pro", "router_disabled")
+            result = await self._route_request(
+                [prompt, attachment], route, reason, deadline,
+                schema=GeminiAudioEntryResponse, pinned=uploaded is not None
+            )
+            timer.lap("model")
+            result = self._finalize_result(result)
+            answered = True
             
+        except QuotaExhausted:
+            self.route_stats["degraded_to_rules"] += 1
+            result = self._get_fallback_response("Audio recibido sin cupo para procesarlo")
         except asyncio.TimeoutError:
-            logger.error("Timeout extrayendo contexto de audio")
-            return "Audio recibido pero no se pudo procesar por timeout."
+            logger.error("GEMINI-AUDIO: timeout procesando nota de voz")
+            result = self._get_fallback_response("Audio recibido pero no se pudo procesar por timeout")
         except Exception as e:
-            logger.error(f"Error extrayendo contexto de audio: {e}")
-            return "Audio recibido pero no se pudo transcribir el contenido."
-
+            logger.error(f"GEMINI-AUDIO: error procesando nota de voz: {e}")
+            result = self._get_fallback_response("Audio recibido sin contenido claro")
+        finally:
+            if uploaded is not None:
+                timer.skip()
+                try:
+                    await self.calls.run_sync(lambda: genai.delete_file(uploaded.name), 15.0)
+                except Exception as cleanup_error:
+                    logger.warning(f"GEMINI-AUDIO: error borrando archivo temporal: {cleanup_error}")
+                timer.lap("delete")
+        
+        timer.finish()
+        self.media_stats["audio"][mode] += 1
+        for stage, elapsed_ms in timer.timings.items():
+            self.record_media_stage("audio", stage, elapsed_ms)
+        
+        transcription = result.pop("transcription", "")
+        if answered:
+            # Solo respuestas del modelo: un fallback no debe repetirse en el reenvío
+            self.media_cache.store(
+                user_id, "audio", {"result": result, "transcription": transcription},
+                digest=digest, fingerprint=fingerprint
+            )
+        logger.info(f"GEMINI-AUDIO: {mode}, {len(audio_data)} bytes, etapas(ms)={timer.timings}")
+        return {"result": result, "transcription": transcription, "mode": mode, "timings_ms": timer.timings}
+    
+    async def _upload_audio(self, audio_data: bytes, mime_type: str):
+        """Sube la nota de voz con un archivo temporal único (solo notas grandes)"""
+        def upload():
+            with tempfile.NamedTemporaryFile(suffix=".ogg") as temp_file:
+                temp_file.write(audio_data)
+                temp_file.flush()
+                return genai.upload_file(temp_file.name, mime_type=mime_type)
+        
+        # El archivo queda en el proyecto de la key global: la llamada va por la key 0
+        return await self.calls.run_sync(upload, 45.0)
+    
+    def record_media_stage(self, kind: str, stage: str, elapsed_ms: float) -> None:
+        """Latencia de una etapa del pipeline de audio o imagen (descarga, modelo...)"""
+        stages = self.media_stages[kind]
+        histogram = stages.get(stage)
+        if histogram is None:
+            histogram = stages[stage] = LatencyHistogram()
+        histogram.observe(elapsed_ms)
+    
     async def process_audio(self, audio_path: str, user_context: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Procesa audio usando el pipeline de dos pasos
+        Procesa un archivo de audio en disco (compatibilidad); ver process_voice_note
         """
-        try:
-            # Paso 1: Extraer contexto/transcripción del audio
-            audio_context = await self.extract_audio_context(audio_path, user_context)
-            
-            # Paso 2: Procesar el contexto extraído a través del pipeline normal
-            enhanced_message = f"Información extraída de audio: {audio_context}"
-            
-            # Usar el pipeline completo de procesamiento de mensajes
-            return await self.process_message(enhanced_message, user_context)
-            
-        except Exception as e:
-            logger.error(f"Error en pipeline de audio: {e}")
-            return self._get_fallback_response("Audio procesado")
+        with open(audio_path, 'rb') as f:
+            audio_data = f.read()
+        voice_note = await self.process_voice_note(audio_data, user_context)
+        return voice_note["result"]
+    
+    def cached_image(self, user_context: Dict[str, Any], fingerprint: Optional[str],
+                     context: str = "") -> Optional[Dict[str, Any]]:
+        """Imagen ya procesada según el `sha256` del webhook (ver cached_voice_note)"""
+        cached = self.media_cache.lookup(
+            user_context.get("id"), "image", context, fingerprint=fingerprint, count_miss=False
+        )
+        if cached is None:
+            return None
+        self.media_stats["image"]["cache"] += 1
+        return self._cached_image_result(cached, user_context)
+    
+    def _cached_image_result(self, cached: Dict[str, Any], user_context: Dict[str, Any]) -> Dict[str, Any]:
+        result = cached["result"]
+        self._apply_transaction_direction(result, cached["extracted_text"], user_context)
+        return result
     
-    async def extract_image_context(self, image_data: bytes, user_context: Dict[str, Any] = None) -> str:
+    async def process_image(self, image_data: bytes, context: str = "", 
+                          user_context: Dict[str, Any] = None, fingerprint: Optional[str] = None) -> Dict[str, Any]:
         """
-        Extrae contexto de una imagen sin procesarla directamente
+        Procesa imagen en una sola llamada multimodal: la imagen se prepara
+        fuera del event loop (ver ImagePreprocessor) y el modelo extrae el
+        contenido y clasifica la entry a la vez. El análisis de nombres
+        sobre el texto extraído corrige la dirección de transferencias.
+        Una imagen reenviada por el mismo usuario sale de `media_cache`
+        (por hash exacto, o perceptual si `media_cache_perceptual`).
         """
+        user_context = user_context or {}
+        user_id = user_context.get("id")
+        digest = content_digest(image_data)
+        cached = self.media_cache.lookup(user_id, "image", context, digest=digest, fingerprint=fingerprint,
+                                         count_miss=not self.media_cache.perceptual)
+        if cached is not None:
+            self.media_stats["image"]["cache"] += 1
+            return self._cached_image_result(cached, user_context)
+        
+        deadline = time.monotonic() + settings.gemini_message_deadline
+        timer = StageTimer()
+        
         try:
-            # Convertir bytes a imagen PIL
-            image = PIL.Image.open(io.BytesIO(image_data))
-            
-            current_time = datetime.now(self.tz)
-            
-            prompt = f"""
-            Analiza esta imagen y extrae ÚNICAMENTE el contexto/información visible.
-            NO proceses la información ni la estructures en JSON.
-            
-            CONTEXTO:
-            - Usuario: {user_context.get('name', 'Usuario') if user_context else 'Usuario'}
-            - Fecha/Hora actual: {current_time.strftime('%Y-%m-%d %H:%M:%S')} (Costa Rica, UTC-6)
-            
-            INSTRUCCIONES:
-            1. Describe QUÉ VES en la imagen de forma textual y natural
-            2. Si es un recibo/factura: extrae montos, establecimiento, fecha, productos
-            3. Si es una captura de pantalla: describe el contenido y texto visible
-            4. Si es un calendario/agenda: menciona fechas, eventos, horarios
-            5. Si es una lista de tareas: enumera las tareas visibles
-            6. Si es una conversación: resume el contenido principal
-            7. Si contiene texto: transcribe el texto importante
-            
-            IMPORTANTE:
-            - Responde en español natural
-            - NO uses formato JSON
-            - NO categorices como gasto/ingreso/evento aún
-            - Solo describe lo que ves de forma clara y completa
-            - Incluye todos los detalles relevantes (montos, fechas, nombres, etc.)
-            
-            Ejemplo de respuesta:
-            "Veo un recibo del restaurante La Fortuna por ₡15,000. El recibo incluye: 1 Casado completo ₡8,500, 1 Refresco natural ₡2,500, 1 Postre tres leches ₡4,000. La fecha es 15 de agosto 2025 a las 13:45. El método de pago fue efectivo."
-            
-            RESPUESTA:
-            """
-            
-            # Aplicar timeout de 30 segundos
-            response = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(
-                    None, lambda: self.vision_model.generate_content([prompt, image])
-                ),
-                timeout=30.0
+            prepared = await image_preprocessor.prepare(image_data)
+        except Exception as e:
+            # Bytes que no son imagen: solo queda el texto que vino con ella
+            logger.warning(f"GEMINI-IMAGE: imagen no legible ({e})")
+            if not context:
+                return self._get_fallback_response("Imagen procesada")
+            return await self.process_message(f"{IMAGE_MARKER} {context}", user_context)
+        timer.lap("preprocess")
+        
+        if self.media_cache.perceptual:
+            # La misma foto recomprimida (reenvío, captura) cambia los bytes pero no el dHash
+            cached = self.media_cache.lookup(user_id, "image", context, phash=prepared["phash"])
+            if cached is not None:
+                self.media_stats["image"]["cache"] += 1
+                return self._cached_image_result(cached, user_context)
+        
+        answered = False
+        try:
+            message = IMAGE_ATTACHED_MESSAGE
+            if context:
+                message += f"\nContexto adicional: {context}"
+            prompt = await self._build_prompt(message, user_context, datetime.now(self.tz))
+            timer.lap("prompt")
+            
+            attachment = {"mime_type": prepared["mime_type"], "data": prepared["data"]}
+            route, reason = ("fast", None) if settings.gemini_router_enabled else ("pro", "router_disabled")
+            result = await self._route_request(
+                [prompt, attachment], route, reason, deadline, schema=GeminiImageEntryResponse
             )
+            timer.lap("model")
+            result = self._finalize_result(result)
+            answered = True
             
-            return response.text.strip()
-            
+        except QuotaExhausted:
+            self.route_stats["degraded_to_rules"] += 1
+            result = self._get_fallback_response("Imagen recibida sin cupo para procesarla")
         except asyncio.TimeoutError:
-            logger.error("Timeout extrayendo contexto de imagen")
-            return "Imagen recibida pero no se pudo procesar por timeout."
+            logger.error("GEMINI-IMAGE: timeout procesando imagen")
+            result = self._get_fallback_response("Imagen recibida pero no se pudo procesar por timeout")
         except Exception as e:
-            logger.error(f"Error extrayendo contexto de imagen: {e}")
-            return "Imagen recibida pero no se pudo extraer el contexto."
-
-    async def process_image(self, image_data: bytes, context: str = "", 
-                          user_context: Dict[str, Any] = None) -> Dict[str, Any]:
+            logger.error(f"Error en pipeline de imagen: {e}")
+            result = self._get_fallback_response("Imagen procesada")
+        
+        extracted_text = result.pop("extracted_text", "")
+        if answered:
+            # Antes de corregir la dirección: se vuelve a aplicar en cada acierto
+            self.media_cache.store(
+                user_id, "image", {"result": result, "extracted_text": extracted_text}, context,
+                digest=digest, fingerprint=fingerprint, phash=prepared["phash"]
+            )
+        self._apply_transaction_direction(result, extracted_text, user_context)
+        
+        timer.finish()
+        self.media_stats["image"]["processed"] += 1
+        for stage, elapsed_ms in timer.timings.items():
+            self.record_media_stage("image", stage, elapsed_ms)
+        logger.info(
+            f"GEMINI-IMAGE: {prepared['bytes_in']} -> {prepared['bytes_out']} bytes, "
+            f"etapas(ms)={timer.timings}, tipo={result.get('type')}"
+        )
+        return result
+    
+    async def process_album(self, images: List[bytes], captions: List[str],
+                            user_context: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """
-        Procesa imagen con Gemini Vision usando el pipeline de dos pasos
+        Procesa un álbum (varias imágenes seguidas del mismo usuario) en una
+        sola llamada multimodal: las imágenes se preparan en paralelo y el
+        modelo devuelve una entry por imagen (ver GeminiAlbumResponse).
+        
+        Returns:
+            Entries en el orden de las imágenes legibles
         """
+        user_context = user_context or {}
+        deadline = time.monotonic() + settings.gemini_message_deadline
+        timer = StageTimer()
+        context = "\n".join(caption for caption in captions if caption)
+        
+        prepared = await asyncio.gather(
+            *(image_preprocessor.prepare(image_data) for image_data in images), return_exceptions=True
+        )
+        readable_indexes = [i for i, item in enumerate(prepared) if not isinstance(item, BaseException)]
+        readable = [prepared[i] for i in readable_indexes]
+        self.media_stats["album"]["unreadable"] += len(prepared) - len(readable)
+        timer.lap("preprocess")
+        
+        if len(readable) <= 1:
+            # Nada que agrupar: pipeline de una imagen (o solo los captions)
+            if readable:
+                return [await self.process_image(images[readable_indexes[0]], context, user_context)]
+            if not context:
+                return [self._get_fallback_response("Imágenes procesadas")]
+            return [await self.process_message(f"{IMAGE_MARKER} {context}", user_context)]
+        
         try:
-            # Paso 1: Extraer contexto de la imagen
-            image_context = await self.extract_image_context(image_data, user_context)
-            
-            # Paso 2: ANÁLISIS INTELIGENTE DE TRANSACCIONES
-            transaction_analysis = None
-            if user_context and user_context.get('name'):
-                from services.name_matcher import name_matcher
-                
-                logger.error(f"🔥 CRITICAL - USER NAME FOR ANALYSIS: '{user_context['name']}'")
-                logger.error(f"🔥 CRITICAL - IMAGE CONTEXT: '{image_context}'")
-                
-                # Analizar si es una transacción financiera
-                transaction_analysis = name_matcher.analyze_transaction_direction(
-                    image_context, 
-                    user_context['name']
-                )
-                
-                logger.error(f"🔥 CRITICAL - TRANSACTION_ANALYSIS: {transaction_analysis}")
-            
-            # Paso 3: Construir mensaje mejorado para Gemini
-            enhanced_message = f"Información extraída de imagen: {image_context}"
+            message = ALBUM_ATTACHED_MESSAGE.format(count=len(readable))
             if context:
-                enhanced_message += f"\nContexto adicional: {context}"
-            
-            # Agregar análisis inteligente si existe
-            if transaction_analysis and transaction_analysis.get('type'):
-                confidence = transaction_analysis.get('confidence', 0)
-                reasoning = transaction_analysis.get('reasoning', [])
-                
-                enhanced_message += f"\n\nANÁLISIS INTELIGENTE DE TRANSACCIÓN:"
-                enhanced_message += f"\n- Tipo detectado: {transaction_analysis['type'].upper()} (confianza: {confidence:.1%})"
-                enhanced_message += f"\n- Razonamiento: {', '.join(reasoning)}"
-                
-                if transaction_analysis.get('found_names'):
-                    enhanced_message += f"\n- Nombres encontrados: {transaction_analysis['found_names']}"
-            
-            # Usar el pipeline normal de procesamiento de mensajes
-            logger.error(f"🔥 CRITICAL - ENHANCED MESSAGE TO GEMINI: {enhanced_message}")
-            result = await self.process_message(enhanced_message, user_context)
-            logger.error(f"🔥 CRITICAL - GEMINI FINAL RESULT: {result}")
-            return result
+                message += f"\nContexto adicional: {context}"
+            prompt = await self._build_prompt(message, user_context, datetime.now(self.tz))
+            timer.lap("prompt")
+            
+            attachments = [{"mime_type": item["mime_type"], "data": item["data"]} for item in readable]
+            route, reason = ("fast", None) if settings.gemini_router_enabled else ("pro", "router_disabled")
+            album = await self._route_request(
+                [prompt, *attachments], route, reason, deadline, schema=GeminiAlbumResponse
+            )
+            timer.lap("model")
+            entries = sorted(album["entries"], key=lambda entry: entry.get("image", 1))
             
+        except QuotaExhausted:
+            self.route_stats["degraded_to_rules"] += 1
+            entries = [self._get_fallback_response("Imágenes recibidas sin cupo para procesarlas")]
+        except asyncio.TimeoutError:
+            logger.error("GEMINI-ALBUM: timeout procesando álbum")
+            entries = [self._get_fallback_response("Imágenes recibidas pero no se pudieron procesar por timeout")]
         except Exception as e:
-            logger.error(f"Error en pipeline de imagen: {e}")
-            return self._get_fallback_response("Imagen procesada")
+            logger.error(f"Error en pipeline de álbum: {e}")
+            entries = [self._get_fallback_response("Imágenes procesadas")]
+        
+        results = []
+        for entry in entries:
+            entry.pop("image", None)
+            extracted_text = entry.pop("extracted_text", "")
+            result = self._finalize_result(entry)
+            self._apply_transaction_direction(result, extracted_text, user_context)
+            results.append(result)
+        
+        timer.finish()
+        self.media_stats["album"]["albums"] += 1
+        self.media_stats["album"]["images"] += len(readable)
+        self.media_stats["album"]["entries"] += len(results)
+        for stage, elapsed_ms in timer.timings.items():
+            self.record_media_stage("album", stage, elapsed_ms)
+        logger.info(
+            f"GEMINI-ALBUM: {len(readable)} imágenes -> {len(results)} entries, etapas(ms)={timer.timings}"
+        )
+        return results
+    
+    def _apply_transaction_direction(self, result: Dict[str, Any], extracted_text: str,
+                                     user_context: Dict[str, Any]) -> None:
+        """
+        Si el usuario aparece claramente como emisor o receptor en el texto
+        de la imagen (name_matcher, confianza 0.9), ese análisis manda sobre
+        el tipo gasto/ingreso del modelo
+        """
+        if not extracted_text or not user_context.get('name') or result.get('type') not in ("gasto", "ingreso"):
+            return
+        
+        from services.name_matcher import name_matcher
+        analysis = name_matcher.analyze_transaction_direction(extracted_text, user_context['name'])
+        if analysis.get('confidence', 0) >= 0.9 and analysis.get('type') in ("gasto", "ingreso") \
+                and analysis['type'] != result['type']:
+            logger.info(f"GEMINI-IMAGE: dirección corregida a {analysis['type']} ({', '.join(analysis.get('reasoning', []))})")
+            result['type'] = analysis['type']
+            self.media_stats["image"]["direction_corrected"] += 1
     
     async def _build_prompt(self, message: str, user_context: Dict[str, Any], 
                            current_time: datetime) -> str:
-        """Construye prompt enriquecido para texto"""
+        """
+        Construye prompt enriquecido para texto: prefijo fijo (ver
+        services.gemini_prompts) + sección del usuario dentro de
+        `gemini_prompt_token_budget`
+        """
         
         # Extraer información del perfil
-        profile = user_context.get('profile', {})
+        profile = user_context.get('profile') or {}
         name = user_context.get('name', 'Usuario')
         user_id = user_context.get('id')
         occupation = profile.get('occupation', '')
@@ -304,258 +825,73 @@ class GeminiService:
         context_summary = profile.get('context_summary', '')
         preferences = profile.get('preferences', {})
         
+        user_info = f"INFORMACIÓN DEL USUARIO:\n- Nombre: {name}"
+        if user_context.get('whatsapp_number'):
+            user_info += f"\n- Teléfono: {user_context['whatsapp_number']}"
+        
+        temporal_context = (
+            "CONTEXTO TEMPORAL:\n"
+            f"- Fecha/Hora actual: {current_time.strftime('%Y-%m-%d %H:%M:%S')} (Costa Rica, UTC-6)\n"
+            f"- Día de la semana: {current_time.strftime('%A')}"
+        )
+        
         # Construir contexto personal
         personal_context = ""
         if occupation:
-            personal_context += f"- Ocupación: {occupation}\n        "
+            personal_context += f"- Ocupación: {occupation}\n"
         if hobbies:
-            personal_context += f"- Hobbies: {', '.join(hobbies)}\n        "
+            personal_context += f"- Hobbies: {', '.join(hobbies)}\n"
         if context_summary:
-            personal_context += f"- Contexto personal: {context_summary}\n        "
+            personal_context += f"- Contexto personal: {context_summary}\n"
+        if personal_context:
+            personal_context = "PERFIL DEL USUARIO:\n" + personal_context
         
-        # Obtener contexto enriquecido si hay user_id
-        financial_context = ""
-        upcoming_events = ""
-        spending_patterns = ""
         user_preferences = ""
+        if preferences:
+            user_preferences = (
+                "PREFERENCIAS DEL USUARIO:\n"
+                f"- Estilo de trabajo: {preferences.get('work_style', 'No especificado')}\n"
+                f"- Intereses principales: {', '.join(preferences.get('interests', []))}"
+            )
         
+        # Financiero (7 días), eventos próximos (3 días) y patrones (30 días)
+        blocks = {"financial_context": "", "upcoming_events": "", "spending_patterns": ""}
         if user_id:
             try:
-                # Importar aquí para evitar circular imports
-                from core.supabase import supabase
-                
-                # 1. Contexto financiero reciente (últimos 7 días)
-                financial_data = await self._get_recent_financial_context(supabase, user_id, current_time)
-                if financial_data:
-                    financial_context = f"""
-        CONTEXTO FINANCIERO RECIENTE (últimos 7 días):
-        - Gastos totales: ₡{financial_data.get('total_gastos', 0):,.0f}
-        - Promedio diario: ₡{financial_data.get('promedio_diario', 0):,.0f}
-        - Categorías principales: {', '.join(financial_data.get('categorias_principales', []))}
-        - Último gasto: {financial_data.get('ultimo_gasto', 'N/A')}
-        """
-                
-                # 2. Eventos próximos (próximos 3 días)
-                events_data = await self._get_upcoming_events_context(supabase, user_id, current_time)
-                if events_data:
-                    upcoming_events = f"""
-        EVENTOS PRÓXIMOS (próximos 3 días):
-        {chr(10).join([f"- {event}" for event in events_data[:5]])}
-        """
-                
-                # 3. Patrones de gasto (último mes)
-                patterns_data = await self._get_spending_patterns_context(supabase, user_id)
-                if patterns_data:
-                    spending_patterns = f"""
-        PATRONES DE GASTO (último mes):
-        - Días de mayor gasto: {', '.join(patterns_data.get('dias_frecuentes', []))}
-        - Horarios comunes: {', '.join(patterns_data.get('horarios_comunes', []))}
-        - Categorías frecuentes: {', '.join(patterns_data.get('categorias_frecuentes', []))}
-        """
-                
-                # 4. Preferencias del usuario
-                if preferences:
-                    user_preferences = f"""
-        PREFERENCIAS DEL USUARIO:
-        - Estilo de trabajo: {preferences.get('work_style', 'No especificado')}
-        - Intereses principales: {', '.join(preferences.get('interests', []))}
-        """
-                    
+                blocks = await self._get_prompt_context(user_id, current_time)
             except Exception as e:
                 logger.warning(f"Error obteniendo contexto enriquecido: {e}")
         
-        return f"""
-        Eres Korei, un asistente personal inteligente que conoce profundamente a {name} y se adapta a su estilo de vida y patrones.
-        
-        INFORMACIÓN DEL USUARIO:
-        - Nombre: {name}
-        {personal_context}{user_preferences}
-        
-        CONTEXTO TEMPORAL:
-        - Fecha/Hora actual: {current_time.strftime('%Y-%m-%d %H:%M:%S')} (Costa Rica, UTC-6)
-        - Día de la semana: {current_time.strftime('%A')}
-        {financial_context}{upcoming_events}{spending_patterns}
-        MENSAJE A PROCESAR:
-        "{message}"
-        
-        INSTRUCCIONES AVANZADAS:
-        - Usa TODOS los contextos para dar respuestas más precisas y personalizadas
-        - Si conoces patrones de gasto, sugiere categorías coherentes con su comportamiento
-        - Si hay eventos próximos, considera conflictos de horario al asignar fechas
-        - Ajusta las horas sugeridas según sus patrones temporales habituales
-        - Para gastos, considera si está dentro de sus patrones normales o es atípico
-        - Si conoces su trabajo remoto/presencial, ajusta sugerencias de ubicación
-        - Relaciona nuevos gastos/eventos con sus hobbies e intereses conocidos
-        - Mantén el tono personal y familiar, pero profesional
-        
-        INSTRUCCIONES ESPECIALES PARA AUDIO TRANSCRITO:
-        - Si el mensaje incluye "Información extraída de audio:", analiza el contenido transcrito cuidadosamente
-        - Presta atención especial a palabras clave financieras en español: "gasté", "pagué", "compré", "costó"
-        - Cuando veas transcripciones de audio, busca patrones de habla coloquial costarricense
-        - Si la transcripción menciona dinero o pagos, el tipo DEBE ser "gasto" o "ingreso"
-        - No categorices audio transcrito como "tarea" a menos que claramente se refiera a algo por hacer
-        
-        FILTROS ANTI-ERROR PARA AUDIO:
-        - Si la transcripción contiene "proceso archivo", "procesar audio", "audio del usuario" sin contexto real, clasifica como "recordatorio" con descripción "Audio recibido sin contenido claro"
-        - NUNCA categorices como "tarea" transcripciones que hablen de procesar archivos técnicos
-        - Si no hay contenido real en la transcripción, devuelve tipo "recordatorio" en lugar de "tarea"
-        
-        {self._get_base_instructions()}
-        
-        JSON:"""
-    
-    def _get_base_instructions(self) -> str:
-        """Instrucciones base para todos los prompts"""
-        return """
-        INSTRUCCIONES:
-        1. Analiza el contenido y determina el tipo correcto
-        2. Extrae TODA la información relevante
-        3. Genera fechas relativas correctamente (hoy, mañana, próximo lunes, etc.)
-        4. Para gastos/ingresos, extrae el monto numérico
-        5. INTELIGENCIA DE TIEMPO: Si no se especifica hora, analiza la complejidad y asigna duración inteligente
-        6. Devuelve ÚNICAMENTE un objeto JSON válido
-        
-        TIPOS DISPONIBLES:
-        - gasto: Compras, pagos, cualquier salida de dinero
-        - ingreso: Salario, cobros, entrada de dinero  
-        - evento: Citas, reuniones, actividades con hora específica
-        - tarea: Actividades por hacer, con o sin fecha límite
-        - recordatorio: Alertas simples para recordar algo
-        
-        PALABRAS CLAVE PARA IDENTIFICACIÓN DE TIPOS (ESPAÑOL COSTA RICA):
-        GASTO: "gasté", "pagué", "compré", "costó", "salió", "invertí", "gastó", "dinero", "colones", "plata", "caro", "barato", "precio", "debitaron", "se debita"
-        INGRESO: "gané", "cobré", "recibí", "me pagaron", "ingreso", "salario", "bono", "ganancia", "comisión", "pago", "sueldo", "depositaron", "se deposita", "transferencia recibida"
-        
-        LÓGICA INTELIGENTE PARA COMPROBANTES BANCARIOS/SINPE/FACTURAS:
-        - Usuario propietario: {user_context.get('name', '')} | Tel: {user_context.get('whatsapp_number', '')}
-        
-        **CONTEXTO DE ASISTENTE PERSONAL CRÍTICO:**
-        El usuario envía imágenes por WhatsApp para documentar SUS transacciones financieras.
-        Si el usuario envía una imagen de transferencia, está registrando una transacción que LE AFECTA:
-        
-        - Si la imagen muestra "Transferencia SINPE Móvil A [USUARIO]" → SIEMPRE es INGRESO para el usuario
-        - Si la imagen muestra "Transferencia SINPE Móvil DE [USUARIO]" → SIEMPRE es GASTO para el usuario  
-        - Si la imagen muestra "se debitaron de [OTRA PERSONA]" pero el destino es el USUARIO → es INGRESO para el usuario
-        - PRIORIDAD: El análisis inteligente previo tiene MÁXIMA PRIORIDAD sobre indicadores literales
-        
-        REGLAS CRÍTICAS PARA DETECTAR INGRESO vs GASTO:
-        
-        1. **ANÁLISIS DE NOMBRES (MUY IMPORTANTE)**:
-           - BUSCA nombres de personas en el texto de la imagen
-           - COMPARA con el nombre del usuario (ignorar mayúsculas/minúsculas y nombres medios)
-           - Ejemplos de matching fuzzy:
-             * "NOMBRE COMPLETO USUARIO" = "Nombre Usuario" ✅ MATCH
-             * "MARIA JOSE GONZALEZ RUIZ" = "Maria Gonzalez" ✅ MATCH  
-             * "JUAN CARLOS PEREZ MORA" = "Juan Perez" ✅ MATCH
-             * Ignore diferencias en mayúsculas, acentos y nombres medios
-        
-        2. **PATRONES ESPECÍFICOS DE SINPE MÓVIL**:
-           • "Transferencia SINPE Móvil A [NOMBRE]" = INGRESO si [NOMBRE] es el usuario
-           • "Transferencia SINPE Móvil DE [NOMBRE]" = GASTO si [NOMBRE] es el usuario
-           • "enviaste a [NOMBRE]" = GASTO (el usuario envió)
-           • "recibiste de [NOMBRE]" = INGRESO (el usuario recibió)
-           • "Ref: XXXX" = típico de SINPE, analizar dirección cuidadosamente
-        
-        3. **INDICADORES DE INGRESO (dinero que RECIBE el usuario)**:
-           • "se acreditó", "se depositó", "recibió transferencia"
-           • Usuario aparece como DESTINATARIO/RECEPTOR
-           • Su nombre en "PARA:", "A:", "DESTINATARIO:", "RECEPTOR:"
-           • "cobro", "ingreso", "pago recibido"
-        
-        4. **INDICADORES DE GASTO (dinero que ENVÍA el usuario)**:
-           • "se debitó", "se descontó", "envió transferencia" 
-           • Usuario aparece como EMISOR/REMITENTE
-           • Su nombre en "DE:", "DESDE:", "REMITENTE:", "EMISOR:"
-           • FACTURAS/RECIBOS/TICKETS = siempre GASTO
-           • "pago", "compra", "gasto"
-        
-        5. **EJEMPLOS ESPECÍFICOS**:
-           📥 INGRESO: "💸 Transferencia SINPE Móvil a [NOMBRE_USUARIO] por 10000.00 CRC"
-           📤 GASTO: "💸 Transferencia SINPE Móvil de [NOMBRE_USUARIO] por 5000.00 CRC"
-           📤 GASTO: "Factura Restaurant La Fortuna - Total: ₡15,000"
-           📥 INGRESO: "Depósito a cuenta - Salario Enero - ₡850,000"
-           📥 INGRESO: "Recibo SINPE: María Pérez te envió ₡25,000"
-           📤 GASTO: "Pago realizado a SuperMercado XYZ - Total: ₡12,500"
-        EVENTO: "reunión", "cita", "junta", "meeting", "evento", "conferencia", "visita", "llamada", "videollamada", "zoom", "teams"
-        TAREA: "tengo que", "debo", "necesito", "hay que", "pendiente", "hacer", "completar", "terminar", "acabar", "finalizar"
-        RECORDATORIO: "recordar", "no olvidar", "acordarme", "anotar", "apuntar", "nota mental", "recordatorio"
-        PLAN: "planear", "planifico", "voy a", "quiero", "me gustaría", "pensar", "considerar", "idea", "proyecto"
-        
-        LÓGICA INTELIGENTE DE TIEMPO:
-        Cuando NO se especifica hora exacta, analiza la complejidad y asigna duración:
-        
-        EVENTOS CORTOS (30 min - 1 hora):
-        • Llamadas telefónicas
-        • Citas médicas rápidas  
-        • Reuniones de check-in
-        • Compras rápidas
-        → datetime_end: +30 min a +1 hora
-        
-        EVENTOS MEDIANOS (1-3 horas):
-        • Reuniones de trabajo
-        • Citas con clientes
-        • Almuerzos de negocios
-        • Consultas médicas
-        • Clases/cursos
-        → datetime_end: +1 a +3 horas
-        
-        EVENTOS LARGOS (3-8 horas):
-        • Workshops/talleres
-        • Conferencias
-        • Viajes largos
-        • Jornadas de trabajo
-        • Eventos sociales grandes
-        → datetime_end: +3 a +8 horas
-        
-        EVENTOS TODO EL DÍA:
-        • Vacaciones
-        • Días libres
-        • Conferencias de múltiples días
-        • Mudanzas
-        • Eventos familiares grandes
-        → Usar formato de fecha completa sin hora específica
-        
-        HORAS PREDETERMINADAS INTELIGENTES:
-        Si solo menciona "mañana" o "hoy" sin hora:
-        • Reuniones de trabajo → 09:00 o 14:00
-        • Citas médicas → 10:00 o 15:00  
-        • Almuerzos → 12:00-13:00
-        • Llamadas → 10:00 o 16:00
-        • Eventos sociales → 19:00 o 20:00
-        
-        ESTRUCTURA JSON REQUERIDA:
-        {
-            "type": "string",
-            "description": "string",
-            "amount": number o null,
-            "datetime": "YYYY-MM-DDTHH:MM:SS-06:00",
-            "datetime_end": "YYYY-MM-DDTHH:MM:SS-06:00",
-            "priority": "alta|media|baja",
-            "recurrence": "none|daily|weekly|monthly|yearly",
-            "task_category": "Trabajo|Personal|Ocio" o null (NUNCA uses "Sin categoría"),
-            "status": "pending|completed|cancelled"
-        }
-        """
+        # Bloques opcionales en orden de prioridad; los que no quepan se omiten
+        prompt, report = assemble_prompt(
+            required=[user_info, temporal_context],
+            optional=[
+                ("upcoming_events", blocks["upcoming_events"]),
+                ("personal_context", personal_context.strip()),
+                ("financial_context", blocks["financial_context"]),
+                ("preferences", user_preferences),
+                ("spending_patterns", blocks["spending_patterns"])
+            ],
+            message=message,
+            budget=settings.gemini_prompt_token_budget
+        )
+        self._record_prompt(report)
+        return prompt
     
-    def _extract_json(self, text: str) -> Dict[str, Any]:
-        """Extrae JSON de la respuesta"""
-        try:
-            # Limpiar respuesta
-            text = text.strip()
-            
-            # Buscar JSON
-            start = text.find('{')
-            end = text.rfind('}') + 1
-            
-            if start != -1 and end > start:
-                json_str = text[start:end]
-                return json.loads(json_str)
-            
-            raise ValueError("No se encontró JSON válido")
-            
-        except Exception as e:
-            logger.error(f"Error extrayendo JSON: {e}")
-            raise
+    def _record_prompt(self, report: Dict[str, Any]) -> None:
+        """Acumula el reporte de tokens de cada prompt para /api/stats"""
+        logger.debug(
+            f"PROMPT-TOKENS: total≈{report['total_tokens']} (prefijo {report['prefix_tokens']}, "
+            f"media {report['media_tokens']}, usuario {report['dynamic_tokens']}/{report['budget']}) "
+            f"omitidos={report['dropped']}"
+        )
+        stats = self.prompt_stats
+        stats["prompts"] += 1
+        stats["total_tokens"] += report["total_tokens"]
+        stats["dynamic_tokens"] += report["dynamic_tokens"]
+        for name in report["dropped"]:
+            stats["dropped"][name] = stats["dropped"].get(name, 0) + 1
+        stats["last"] = report
     
     def _get_fallback_response(self, description: str) -> Dict[str, Any]:
         """Respuesta por defecto"""
@@ -573,147 +909,230 @@ class GeminiService:
             "task_category": None,
         }
     
-    async def _get_recent_financial_context(self, supabase, user_id: str, current_time: datetime) -> Dict[str, Any]:
-        """Obtiene contexto financiero de los últimos 7 días"""
+    async def _get_prompt_context(self, user_id: str, current_time: datetime) -> Dict[str, str]:
+        """
+        Bloques de contexto del prompt derivados de entries, cacheados por
+        usuario. En un fallo de cache se cargan con una sola consulta.
+        """
+        cached = self.prompt_context_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
+        # Importar aquí para evitar circular imports
+        from core.supabase import supabase
+        
+        started = time.monotonic()
         try:
-            seven_days_ago = current_time - timedelta(days=7)
-            
-            result = supabase._get_client().table("entries").select("*").eq(
-                "user_id", user_id
-            ).eq(
-                "type", "gasto"
-            ).gte(
-                "datetime", seven_days_ago.isoformat()
-            ).order("datetime", desc=True).execute()
-            
-            gastos = result.data
-            if not gastos:
-                return None
-            
-            total_gastos = sum(float(g.get('amount') or 0) for g in gastos)
-            promedio_diario = total_gastos / 7
-            
-            # Categorías más frecuentes
-            categorias = {}
-            for gasto in gastos:
-                cat = gasto.get('category', 'Sin categoría')
-                categorias[cat] = categorias.get(cat, 0) + 1
-            
-            categorias_principales = sorted(categorias.keys(), key=lambda x: categorias[x], reverse=True)[:3]
-            
-            # Último gasto
-            ultimo_gasto = f"₡{float(gastos[0].get('amount') or 0):,.0f} - {gastos[0].get('description', '')}" if gastos else "N/A"
-            
-            return {
-                "total_gastos": total_gastos,
-                "promedio_diario": promedio_diario,
-                "categorias_principales": categorias_principales,
-                "ultimo_gasto": ultimo_gasto
-            }
-            
+            entries = await self._get_context_window(supabase, user_id, current_time)
         except Exception as e:
-            logger.warning(f"Error obteniendo contexto financiero: {e}")
+            self.stats["context_errors"] += 1
+            logger.warning(f"Error obteniendo ventana de contexto: {e}")
+            return {"financial_context": "", "upcoming_events": "", "spending_patterns": ""}
+        
+        blocks = {"financial_context": "", "upcoming_events": "", "spending_patterns": ""}
+        
+        financial_data = self._get_recent_financial_context(entries, current_time)
+        if financial_data:
+            blocks["financial_context"] = (
+                "CONTEXTO FINANCIERO RECIENTE (últimos 7 días):\n"
+                f"- Gastos totales: ₡{financial_data.get('total_gastos', 0):,.0f}\n"
+                f"- Promedio diario: ₡{financial_data.get('promedio_diario', 0):,.0f}\n"
+                f"- Categorías principales: {', '.join(financial_data.get('categorias_principales', []))}\n"
+                f"- Último gasto: {financial_data.get('ultimo_gasto', 'N/A')}"
+            )
+        
+        events_data = self._get_upcoming_events_context(entries, current_time)
+        if events_data:
+            blocks["upcoming_events"] = "EVENTOS PRÓXIMOS (próximos 3 días):\n" + "\n".join(
+                f"- {event}" for event in events_data[:5]
+            )
+        
+        patterns_data = self._get_spending_patterns_context(entries, current_time)
+        if patterns_data:
+            blocks["spending_patterns"] = (
+                "PATRONES DE GASTO (último mes):\n"
+                f"- Días de mayor gasto: {', '.join(patterns_data.get('dias_frecuentes', []))}\n"
+                f"- Horarios comunes: {', '.join(patterns_data.get('horarios_comunes', []))}\n"
+                f"- Categorías frecuentes: {', '.join(patterns_data.get('categorias_frecuentes', []))}"
+            )
+        
+        self.prompt_context_cache.set(user_id, blocks)
+        self.stats["context_builds"] += 1
+        self.stats["context_build_ms"] += (time.monotonic() - started) * 1000
+        return blocks
+    
+    async def _get_context_window(self, supabase, user_id: str, current_time: datetime) -> List[Dict[str, Any]]:
+        """Una sola consulta: gastos de 30 días atrás y agenda de 3 días adelante"""
+        result = await supabase.execute(supabase.select("entries", "prompt_context").eq(
+            "user_id", user_id
+        ).in_(
+            "type", ["gasto", "evento", "tarea", "recordatorio"]
+        ).gte(
+            "datetime", (current_time - timedelta(days=30)).isoformat()
+        ).lte(
+            "datetime", (current_time + timedelta(days=3)).isoformat()
+        ).order("datetime"))
+        
+        entries = []
+        for entry in result.data or []:
+            if not entry.get('datetime'):
+                continue
+            entry_time = datetime.fromisoformat(entry['datetime'].replace('Z', '+00:00'))
+            if entry_time.tzinfo is None:
+                entry_time = self.tz.localize(entry_time)
+            entries.append({**entry, "_dt": entry_time})
+        return entries
+    
+    def _get_recent_financial_context(self, entries: List[Dict[str, Any]], current_time: datetime) -> Dict[str, Any]:
+        """Resume los gastos de los últimos 7 días"""
+        seven_days_ago = current_time - timedelta(days=7)
+        gastos = sorted(
+            [e for e in entries if e.get('type') == 'gasto' and e['_dt'] >= seven_days_ago],
+            key=lambda e: e['_dt'],
+            reverse=True
+        )
+        if not gastos:
             return None
+        
+        total_gastos = sum(float(g.get('amount') or 0) for g in gastos)
+        promedio_diario = total_gastos / 7
+        
+        # Categorías más frecuentes
+        categorias = {}
+        for gasto in gastos:
+            cat = gasto.get('category', 'Sin categoría')
+            categorias[cat] = categorias.get(cat, 0) + 1
+        
+        categorias_principales = sorted(categorias.keys(), key=lambda x: categorias[x], reverse=True)[:3]
+        
+        # Último gasto
+        ultimo_gasto = f"₡{float(gastos[0].get('amount') or 0):,.0f} - {gastos[0].get('description', '')}"
+        
+        return {
+            "total_gastos": total_gastos,
+            "promedio_diario": promedio_diario,
+            "categorias_principales": categorias_principales,
+            "ultimo_gasto": ultimo_gasto
+        }
     
-    async def _get_upcoming_events_context(self, supabase, user_id: str, current_time: datetime) -> List[str]:
-        """Obtiene eventos próximos (próximos 3 días)"""
-        try:
-            three_days_ahead = current_time + timedelta(days=3)
-            
-            result = supabase._get_client().table("entries").select("*").eq(
-                "user_id", user_id
-            ).in_(
-                "type", ["evento", "tarea", "recordatorio"]
-            ).gte(
-                "datetime", current_time.isoformat()
-            ).lte(
-                "datetime", three_days_ahead.isoformat()
-            ).order("datetime").execute()
-            
-            events = result.data
-            if not events:
-                return []
-            
-            formatted_events = []
-            for event in events[:5]:  # Máximo 5 eventos
-                event_time = datetime.fromisoformat(event['datetime'].replace('Z', '+00:00'))
-                day_name = event_time.strftime('%A')
-                time_str = event_time.strftime('%H:%M')
-                formatted_events.append(f"{day_name} {time_str}: {event['description']}")
-            
-            return formatted_events
-            
-        except Exception as e:
-            logger.warning(f"Error obteniendo eventos próximos: {e}")
-            return []
+    def _get_upcoming_events_context(self, entries: List[Dict[str, Any]], current_time: datetime) -> List[str]:
+        """Formatea eventos, tareas y recordatorios de los próximos 3 días"""
+        three_days_ahead = current_time + timedelta(days=3)
+        events = [
+            e for e in entries
+            if e.get('type') in ('evento', 'tarea', 'recordatorio') and current_time <= e['_dt'] <= three_days_ahead
+        ]
+        
+        formatted_events = []
+        for event in events[:5]:  # Máximo 5 eventos
+            event_time = event['_dt']
+            day_name = event_time.strftime('%A')
+            time_str = event_time.strftime('%H:%M')
+            formatted_events.append(f"{day_name} {time_str}: {event['description']}")
+        
+        return formatted_events
     
-    async def _get_spending_patterns_context(self, supabase, user_id: str) -> Dict[str, Any]:
+    def _get_spending_patterns_context(self, entries: List[Dict[str, Any]], current_time: datetime) -> Dict[str, Any]:
         """Obtiene patrones de gasto del último mes"""
-        try:
-            one_month_ago = datetime.now(self.tz) - timedelta(days=30)
-            
-            result = supabase._get_client().table("entries").select("*").eq(
-                "user_id", user_id
-            ).eq(
-                "type", "gasto"
-            ).gte(
-                "datetime", one_month_ago.isoformat()
-            ).execute()
-            
-            gastos = result.data
-            if not gastos:
-                return None
-            
-            # Análisis de días
-            dias_gasto = {}
-            horarios_gasto = {}
-            categorias_gasto = {}
-            
-            for gasto in gastos:
-                if gasto.get('datetime'):
-                    dt = datetime.fromisoformat(gasto['datetime'].replace('Z', '+00:00'))
-                    day_name = dt.strftime('%A')
-                    hour = dt.hour
-                    
-                    dias_gasto[day_name] = dias_gasto.get(day_name, 0) + 1
-                    
-                    # Agrupar horarios
-                    if 6 <= hour < 12:
-                        horario = "Mañana (6-12h)"
-                    elif 12 <= hour < 18:
-                        horario = "Tarde (12-18h)"
-                    elif 18 <= hour < 24:
-                        horario = "Noche (18-24h)"
-                    else:
-                        horario = "Madrugada (0-6h)"
-                    
-                    horarios_gasto[horario] = horarios_gasto.get(horario, 0) + 1
-                
-                # Categorías
-                cat = gasto.get('category', 'Sin categoría')
-                categorias_gasto[cat] = categorias_gasto.get(cat, 0) + 1
-            
-            # Top 3 de cada uno
-            dias_frecuentes = sorted(dias_gasto.keys(), key=lambda x: dias_gasto[x], reverse=True)[:3]
-            horarios_comunes = sorted(horarios_gasto.keys(), key=lambda x: horarios_gasto[x], reverse=True)[:2]
-            categorias_frecuentes = sorted(categorias_gasto.keys(), key=lambda x: categorias_gasto[x], reverse=True)[:3]
-            
-            # Traducir días al español
-            day_translation = {
-                'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-                'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-            }
-            dias_frecuentes = [day_translation.get(day, day) for day in dias_frecuentes]
-            
-            return {
-                "dias_frecuentes": dias_frecuentes,
-                "horarios_comunes": horarios_comunes,
-                "categorias_frecuentes": categorias_frecuentes
-            }
-            
-        except Exception as e:
-            logger.warning(f"Error obteniendo patrones de gasto: {e}")
+        one_month_ago = current_time - timedelta(days=30)
+        gastos = [e for e in entries if e.get('type') == 'gasto' and e['_dt'] >= one_month_ago]
+        if not gastos:
             return None
+        
+        # Análisis de días
+        dias_gasto = {}
+        horarios_gasto = {}
+        categorias_gasto = {}
+        
+        for gasto in gastos:
+            dt = gasto['_dt']
+            day_name = dt.strftime('%A')
+            hour = dt.hour
+            
+            dias_gasto[day_name] = dias_gasto.get(day_name, 0) + 1
+            
+            # Agrupar horarios
+            if 6 <= hour < 12:
+                horario = "Mañana (6-12h)"
+            elif 12 <= hour < 18:
+                horario = "Tarde (12-18h)"
+            elif 18 <= hour < 24:
+                horario = "Noche (18-24h)"
+            else:
+                horario = "Madrugada (0-6h)"
+            
+            horarios_gasto[horario] = horarios_gasto.get(horario, 0) + 1
+            
+            # Categorías
+            cat = gasto.get('category', 'Sin categoría')
+            categorias_gasto[cat] = categorias_gasto.get(cat, 0) + 1
+        
+        # Top 3 de cada uno
+        dias_frecuentes = sorted(dias_gasto.keys(), key=lambda x: dias_gasto[x], reverse=True)[:3]
+        horarios_comunes = sorted(horarios_gasto.keys(), key=lambda x: horarios_gasto[x], reverse=True)[:2]
+        categorias_frecuentes = sorted(categorias_gasto.keys(), key=lambda x: categorias_gasto[x], reverse=True)[:3]
+        
+        # Traducir días al español
+        day_translation = {
+            'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
+            'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
+        }
+        dias_frecuentes = [day_translation.get(day, day) for day in dias_frecuentes]
+        
+        return {
+            "dias_frecuentes": dias_frecuentes,
+            "horarios_comunes": horarios_comunes,
+            "categorias_frecuentes": categorias_frecuentes
+        }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas del servicio: contexto del prompt, router, hedging y decodificación"""
+        builds = self.stats["context_builds"]
+        prompts = self.prompt_stats["prompts"]
+        eligible, hedged = self.hedge_stats["eligible"], self.hedge_stats["hedged"]
+        return {
+            **self.stats,
+            "avg_context_build_ms": round(self.stats["context_build_ms"] / builds, 2) if builds else 0.0,
+            "prompt_context_cache": self.prompt_context_cache.get_stats(),
+            "router": {
+                **self.route_stats,
+                "enabled": settings.gemini_router_enabled,
+                "latency": {route: histogram.get_stats() for route, histogram in self.latency.items()}
+            },
+            "calls": self.calls.get_stats(),
+            "quota": self.quota.get_stats(),
+            "audio": {
+                **self.media_stats["audio"],
+                "inline_max_bytes": settings.gemini_inline_audio_max_bytes,
+                "stages": {stage: histogram.get_stats() for stage, histogram in self.media_stages["audio"].items()}
+            },
+            "image": {
+                **self.media_stats["image"],
+                "preprocess": image_preprocessor.get_stats(),
+                "stages": {stage: histogram.get_stats() for stage, histogram in self.media_stages["image"].items()}
+            },
+            "album": {
+                **self.media_stats["album"],
+                "stages": {stage: histogram.get_stats() for stage, histogram in self.media_stages["album"].items()}
+            },
+            "hedging": {
+                **self.hedge_stats,
+                "enabled": settings.gemini_hedge_enabled,
+                "hedge_rate": round(self.hedge_stats["hedged"] / eligible, 4) if eligible else 0.0,
+                "win_rate": round(self.hedge_stats["hedge_wins"] / hedged, 4) if hedged else 0.0
+            },
+            "decoding": {
+                **self.decode_stats,
+                "json_mode": self.generation_config is not None
+            },
+            "prompt_tokens": {
+                **self.prompt_stats,
+                "prefix_tokens": PREFIX_TOKENS,
+                "budget": settings.gemini_prompt_token_budget,
+                "avg_total_tokens": round(self.prompt_stats["total_tokens"] / prompts, 1) if prompts else 0.0,
+                "avg_dynamic_tokens": round(self.prompt_stats["dynamic_tokens"] / prompts, 1) if prompts else 0.0
+            }
+        }
 
 # Singleton
 gemini_service = GeminiService()
\ No newline at end of file
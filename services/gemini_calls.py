@@ -0,0 +1,163 @@
+"""
+Control de concurrencia para las llamadas a Gemini
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+from app.config import settings
+from core.metrics import LatencyHistogram
+
+
+class GeminiCallController:
+    """
+    Todas las llamadas a Gemini pasan por aquí:
+
+    - un semáforo limita las llamadas en vuelo (`gemini_max_in_flight`);
+      el resto espera en cola y ese tiempo se mide aparte
+    - `generate_content_async` del SDK se usa cuando existe, así un
+      timeout cancela la llamada gRPC en lugar de dejar un hilo colgado
+    - lo que solo existe en versión síncrona (subir/borrar archivos) corre
+      en un executor propio y acotado, no en el executor por defecto
+    - el timeout cubre la espera en cola más la llamada; si vence con un
+      hilo aún corriendo, su cupo se libera cuando el hilo termina, de modo
+      que los hilos abandonados siguen contando contra el límite
+    """
+
+    def __init__(self, max_in_flight: Optional[int] = None, max_workers: Optional[int] = None,
+                 native_async: Optional[bool] = None):
+        self.max_in_flight = max_in_flight or settings.gemini_max_in_flight
+        self.native_async = settings.gemini_native_async if native_async is None else native_async
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.gemini_executor_workers,
+            thread_name_prefix="gemini"
+        )
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.stats = {
+            "calls": 0,
+            "native": 0,
+            "threaded": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "cancelled": 0,
+            "abandoned_threads": 0,
+            "peak_in_flight": 0
+        }
+        self.queue_wait = LatencyHistogram(buckets_ms=(1, 5, 25, 100, 250, 1000, 5000, 15000))
+        self.latency = LatencyHistogram()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Semáforo del event loop actual (se recrea si cambia el loop, p.ej. en tests)"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._semaphore_loop = loop
+            self.in_flight = 0
+        return self._semaphore
+
+    async def generate(self, model, contents: Any, timeout: float, **kwargs) -> Any:
+        """`model.generate_content(contents)` con cupo y timeout, async nativo si el SDK lo soporta"""
+        generate_async = getattr(model, "generate_content_async", None)
+        if self.native_async and generate_async is not None:
+            return await self._run(lambda: generate_async(contents, **kwargs), timeout, native=True)
+        return await self.run_sync(lambda: model.generate_content(contents, **kwargs), timeout)
+
+    async def run_sync(self, func: Callable[[], Any], timeout: float) -> Any:
+        """Ejecuta una función bloqueante del SDK en el executor de Gemini"""
+        return await self._run(func, timeout, native=False)
+
+    async def _run(self, factory: Callable[[], Any], timeout: float, native: bool) -> Any:
+        """
+        Raises:
+            asyncio.TimeoutError: si la espera en cola más la llamada exceden `timeout`
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        semaphore = self._get_semaphore()
+
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.warning(f"Gemini: {timeout}s esperando cupo ({self.in_flight} llamadas en vuelo)")
+            raise
+        finally:
+            self.waiting -= 1
+            self.queue_wait.observe((time.monotonic() - queued_at) * 1000)
+
+        self.in_flight += 1
+        self.stats["calls"] += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+        remaining = max(deadline - loop.time(), 0.001)
+        started = time.monotonic()
+        release_now = True
+
+        try:
+            if native:
+                self.stats["native"] += 1
+                return await asyncio.wait_for(factory(), remaining)
+
+            self.stats["threaded"] += 1
+            future = loop.run_in_executor(self.executor, factory)
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), remaining)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                if not future.done():
+                    # Un hilo no se puede interrumpir: el cupo vuelve cuando termine
+                    release_now = False
+                    self.stats["abandoned_threads"] += 1
+                    future.add_done_callback(lambda done: self._release_abandoned(semaphore, done))
+                raise
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise
+        except asyncio.CancelledError:
+            self.stats["cancelled"] += 1
+            raise
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.latency.observe((time.monotonic() - started) * 1000)
+            if release_now:
+                self._release(semaphore)
+
+    def _release(self, semaphore: asyncio.Semaphore) -> None:
+        self.in_flight -= 1
+        semaphore.release()
+
+    def _release_abandoned(self, semaphore: asyncio.Semaphore, future: asyncio.Future) -> None:
+        """Libera el cupo de un hilo que terminó después de su timeout"""
+        if not future.cancelled():
+            future.exception()  # Evita "exception was never retrieved"
+        if semaphore is self._semaphore:
+            self._release(semaphore)
+
+    def shutdown(self) -> None:
+        """Libera el executor al apagar la aplicación"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Llamadas en vuelo, en cola, resultados y latencias (espera y llamada)"""
+        return {
+            **self.stats,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_in_flight": self.max_in_flight,
+            "native_async": self.native_async,
+            "workers": self.executor._max_workers,
+            "queue_wait": self.queue_wait.get_stats(),
+            "latency": self.latency.get_stats()
+        }
+
+
+# Instancia singleton compartida por GeminiService y los comandos que llaman a Gemini
+gemini_calls = GeminiCallController()
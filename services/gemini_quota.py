@@ -0,0 +1,210 @@
+"""
+Cuotas de Gemini (RPM/TPM) por API key con pool de keys
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+import google.generativeai as genai
+from loguru import logger
+
+from app.config import settings
+
+
+class QuotaExhausted(Exception):
+    """Ninguna key tiene cupo para la ruta dentro de la espera permitida"""
+
+
+class TokenBucket:
+    """Cubeta que se rellena de forma continua hasta `capacity` por minuto"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+    def seconds_until(self, amount: float) -> float:
+        """Segundos hasta tener `amount` disponibles"""
+        missing = amount - self.available()
+        return max(missing / self.rate, 0.0) if self.rate else float("inf")
+
+    def drain(self) -> None:
+        """Vacía la cubeta (la API respondió 429)"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class KeySlot:
+    """Una API key con sus cubetas de requests y tokens por ruta"""
+
+    def __init__(self, index: int, api_key: str, limits: Dict[str, Dict[str, int]]):
+        self.index = index
+        self.name = f"key{index}"
+        self.api_key = api_key
+        self.requests = {route: TokenBucket(limit["rpm"]) for route, limit in limits.items()}
+        self.tokens = {route: TokenBucket(limit["tpm"]) for route, limit in limits.items()}
+        self.models: Dict[str, Any] = {}
+        self.clients: Optional[Dict[str, Any]] = None
+
+    def load(self, route: str) -> float:
+        """Fracción usada de la cubeta más llena (0 = libre, 1 = agotada)"""
+        requests, tokens = self.requests[route], self.tokens[route]
+        return max(1 - requests.available() / requests.capacity, 1 - tokens.available() / tokens.capacity)
+
+    def fits(self, route: str, tokens: int, headroom: float) -> bool:
+        """Cabe la llamada dejando libre el (1 - headroom) de cada cubeta"""
+        requests, token_bucket = self.requests[route], self.tokens[route]
+        reserve = 1 - headroom
+        return (requests.available() - 1 >= requests.capacity * reserve
+                and token_bucket.available() - tokens >= token_bucket.capacity * reserve)
+
+    def seconds_until_fits(self, route: str, tokens: int, headroom: float) -> float:
+        reserve = 1 - headroom
+        requests, token_bucket = self.requests[route], self.tokens[route]
+        return max(
+            requests.seconds_until(1 + requests.capacity * reserve),
+            token_bucket.seconds_until(tokens + token_bucket.capacity * reserve)
+        )
+
+
+class GeminiQuotaManager:
+    """
+    Lleva requests y tokens por minuto de cada API key y ruta ("fast" o
+    "pro", cada modelo tiene su propio límite) con token buckets.
+
+    - `acquire` elige la key menos cargada que tenga cupo por debajo de
+      `gemini_quota_headroom`; si ninguna tiene, espera hasta
+      `gemini_quota_max_wait` y luego lanza QuotaExhausted para que el
+      llamador degrade (modelo más barato o reglas)
+    - `bind` devuelve el modelo apuntando a la key elegida; la key 0 es la
+      configurada globalmente con `genai.configure`
+    - un 429 vacía la cubeta de esa key para que las siguientes llamadas
+      vayan a otra
+    """
+
+    def __init__(self, api_keys: Optional[List[str]] = None):
+        keys = api_keys or [settings.gemini_api_key] + [
+            key.strip() for key in settings.gemini_extra_api_keys.split(",") if key.strip()
+        ]
+        limits = {
+            "fast": {"rpm": settings.gemini_fast_rpm, "tpm": settings.gemini_fast_tpm},
+            "pro": {"rpm": settings.gemini_pro_rpm, "tpm": settings.gemini_pro_tpm}
+        }
+        self.slots = [KeySlot(index, key, limits) for index, key in enumerate(dict.fromkeys(keys))]
+        self.headroom = settings.gemini_quota_headroom
+        self.max_wait = settings.gemini_quota_max_wait
+        self.stats = {
+            "acquired": 0,
+            "waited": 0,
+            "wait_ms": 0.0,
+            "exhausted": 0,
+            "rate_limited": 0,
+            "by_key": {slot.name: 0 for slot in self.slots}
+        }
+
+    async def acquire(self, route: str, tokens: int, pinned: bool = False,
+                      max_wait: Optional[float] = None) -> KeySlot:
+        """
+        Reserva una llamada de `tokens` estimados en la key menos cargada
+
+        Args:
+            pinned: solo la key 0 (p.ej. audio subido con el cliente global)
+            max_wait: segundos máximos en cola; por defecto `gemini_quota_max_wait`
+
+        Raises:
+            QuotaExhausted: si ninguna key libera cupo a tiempo
+        """
+        candidates = self.slots[:1] if pinned else self.slots
+        max_wait = self.max_wait if max_wait is None else max_wait
+        started = time.monotonic()
+        waited = False
+
+        while True:
+            fitting = [slot for slot in candidates if slot.fits(route, tokens, self.headroom)]
+            if fitting:
+                slot = min(fitting, key=lambda candidate: candidate.load(route))
+                slot.requests[route].consume(1)
+                slot.tokens[route].consume(tokens)
+                self.stats["acquired"] += 1
+                self.stats["by_key"][slot.name] += 1
+                if waited:
+                    self.stats["waited"] += 1
+                    self.stats["wait_ms"] += (time.monotonic() - started) * 1000
+                return slot
+
+            wait = min(slot.seconds_until_fits(route, tokens, self.headroom) for slot in candidates)
+            if time.monotonic() - started + wait > max_wait:
+                self.stats["exhausted"] += 1
+                logger.warning(f"GEMINI-QUOTA: sin cupo para {route} ({tokens} tokens), degradando")
+                raise QuotaExhausted(route)
+            waited = True
+            await asyncio.sleep(max(wait, 0.01))
+
+    def bind(self, model, slot: KeySlot):
+        """El mismo modelo con el cliente de la key del slot"""
+        if slot.index == 0:
+            return model
+
+        bound = slot.models.get(model.model_name)
+        if bound is None:
+            if slot.clients is None:
+                # Importar aquí: solo hace falta con más de una key
+                from google.ai import generativelanguage as glm
+                options = {"api_key": slot.api_key}
+                slot.clients = {
+                    "sync": glm.GenerativeServiceClient(client_options=options),
+                    "async": glm.GenerativeServiceAsyncClient(client_options=options)
+                }
+            bound = genai.GenerativeModel(model.model_name)
+            # google-generativeai 0.3.2 no acepta un cliente por modelo en el constructor
+            bound._client = slot.clients["sync"]
+            bound._async_client = slot.clients["async"]
+            slot.models[model.model_name] = bound
+        return bound
+
+    def report_error(self, slot: KeySlot, route: str, error: Exception) -> None:
+        """Ante un 429 la key deja de recibir llamadas hasta rellenarse"""
+        if "429" in str(error) or type(error).__name__ == "ResourceExhausted":
+            self.stats["rate_limited"] += 1
+            slot.requests[route].drain()
+            logger.warning(f"GEMINI-QUOTA: 429 en {slot.name}/{route}, cubeta vaciada")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cupo disponible en vivo por key y ruta, más esperas y degradaciones"""
+        headroom = {
+            slot.name: {
+                route: {
+                    "rpm_available": int(slot.requests[route].available()),
+                    "rpm_limit": int(slot.requests[route].capacity),
+                    "tpm_available": int(slot.tokens[route].available()),
+                    "tpm_limit": int(slot.tokens[route].capacity),
+                    "load": round(slot.load(route), 3)
+                }
+                for route in slot.requests
+            }
+            for slot in self.slots
+        }
+        return {
+            **self.stats,
+            "keys": len(self.slots),
+            "headroom_target": self.headroom,
+            "headroom": headroom
+        }
+
+
+# Instancia singleton usada por GeminiService
+gemini_quota = GeminiQuotaManager()
@@ -0,0 +1,157 @@
+"""
+Preprocesamiento de imágenes antes de enviarlas a Gemini
+"""
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import PIL.Image
+import PIL.ImageOps
+from loguru import logger
+
+from app.config import settings
+from core.metrics import LatencyHistogram
+
+FORMAT_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+class ImagePreprocessor:
+    """
+    Prepara las fotos de WhatsApp para el modelo de visión fuera del event
+    loop, en un executor propio:
+
+    - decodifica (con `draft` en JPEG para reducir ya al decodificar)
+    - aplica la rotación EXIF
+    - reduce el lado mayor a `image_max_edge`
+    - recodifica en `image_format` con `image_quality`
+
+    Si la imagen recodificada no es más pequeña que la original y no hubo
+    que rotarla ni reducirla, se envía la original.
+    """
+
+    def __init__(self, max_edge: Optional[int] = None, max_workers: Optional[int] = None):
+        self.max_edge = max_edge or settings.image_max_edge
+        self.format = settings.image_format.upper()
+        self.quality = settings.image_quality
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.image_workers,
+            thread_name_prefix="image"
+        )
+        self.stats = {
+            "processed": 0,
+            "passthrough": 0,
+            "failed": 0,
+            "bytes_in": 0,
+            "bytes_out": 0
+        }
+        self.latency = LatencyHistogram(buckets_ms=(5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+
+    async def prepare(self, image_data: bytes) -> Dict[str, Any]:
+        """
+        Imagen lista para enviar
+
+        Returns:
+            {"data", "mime_type", "width", "height", "bytes_in", "bytes_out", "phash", "elapsed_ms"}
+
+        Raises:
+            PIL.UnidentifiedImageError: si los bytes no son una imagen
+        """
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        try:
+            prepared = await loop.run_in_executor(self.executor, self._process, image_data)
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            elapsed_ms = (time.monotonic() - started) * 1000
+            self.latency.observe(elapsed_ms)
+
+        self.stats["processed"] += 1
+        self.stats["bytes_in"] += len(image_data)
+        self.stats["bytes_out"] += prepared["bytes_out"]
+        prepared["elapsed_ms"] = round(elapsed_ms, 1)
+        logger.info(
+            f"IMAGE-PREP: {prepared['bytes_in']} -> {prepared['bytes_out']} bytes, "
+            f"{prepared['width']}x{prepared['height']} en {prepared['elapsed_ms']}ms"
+        )
+        return prepared
+
+    def _process(self, image_data: bytes) -> Dict[str, Any]:
+        """Trabajo bloqueante de PIL (corre en el executor)"""
+        image = PIL.Image.open(io.BytesIO(image_data))
+        original_format = image.format
+        original_size = image.size
+        if original_format == "JPEG":
+            # Decodifica directamente a una escala cercana (1/2, 1/4, 1/8)
+            image.draft("RGB", (self.max_edge, self.max_edge))
+
+        # Orientación EXIF (0x0112); 1 = sin rotar
+        changed = image.getexif().get(0x0112, 1) != 1 or image.size != original_size
+        image = PIL.ImageOps.exif_transpose(image)
+
+        if max(image.size) > self.max_edge:
+            image.thumbnail((self.max_edge, self.max_edge), PIL.Image.LANCZOS)
+            changed = True
+
+        if image.mode not in ("RGB", "L"):
+            # Transparencias sobre fondo blanco (capturas PNG)
+            background = PIL.Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.convert("RGBA").getchannel("A"))
+            image = background
+
+        output = io.BytesIO()
+        image.save(output, format=self.format, quality=self.quality, optimize=True)
+        encoded = output.getvalue()
+
+        if not changed and len(encoded) >= len(image_data) and original_format in FORMAT_MIME_TYPES:
+            self.stats["passthrough"] += 1
+            encoded = image_data
+            mime_type = FORMAT_MIME_TYPES[original_format]
+        else:
+            mime_type = FORMAT_MIME_TYPES.get(self.format, "image/jpeg")
+
+        return {
+            "data": encoded,
+            "mime_type": mime_type,
+            "width": image.size[0],
+            "height": image.size[1],
+            "bytes_in": len(image_data),
+            "bytes_out": len(encoded),
+            "phash": self._dhash(image)
+        }
+
+    @staticmethod
+    def _dhash(image: PIL.Image.Image) -> int:
+        """
+        Hash perceptual de 256 bits (dHash): compara cada píxel con su vecino
+        en una versión 17x16 en grises; sobrevive a recompresión y escalado
+        """
+        pixels = image.convert("L").resize((17, 16), PIL.Image.BILINEAR).tobytes()
+        bits = 0
+        for row in range(16):
+            for col in range(16):
+                left, right = pixels[row * 17 + col], pixels[row * 17 + col + 1]
+                bits = (bits << 1) | (left > right)
+        return bits
+
+    def shutdown(self) -> None:
+        """Libera el executor al apagar la aplicación"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Imágenes procesadas, bytes antes/después y latencia"""
+        bytes_in = self.stats["bytes_in"]
+        return {
+            **self.stats,
+            "max_edge": self.max_edge,
+            "format": self.format,
+            "size_ratio": round(self.stats["bytes_out"] / bytes_in, 4) if bytes_in else 0.0,
+            "latency": self.latency.get_stats()
+        }
+
+
+# Instancia singleton usada por GeminiService.process_image
+image_preprocessor = ImagePreprocessor()
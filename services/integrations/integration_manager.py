@@ -222,7 +222,8 @@ class IntegrationManager:
         """Almacena integración en base de datos"""
         try:
             # Nota: Las credenciales deberían estar encriptadas antes de guardar
-            supabase._get_client().table("user_integrations").insert(integration_data).execute()
+            await supabase.execute(supabase.table("user_integrations").insert(integration_data))
+            supabase.invalidate_request_context(integration_data.get("user_id"))
         except Exception as e:
             logger.error(f"Error storing integration: {e}")
             raise
@@ -230,13 +231,13 @@ class IntegrationManager:
     async def _load_integration(self, user_id: str, service: str) -> Optional[Dict[str, Any]]:
         """Carga integración desde base de datos"""
         try:
-            result = supabase._get_client().table("user_integrations").select("*").eq(
+            result = await supabase.execute(supabase.table("user_integrations").select("*").eq(
                 "user_id", user_id
             ).eq(
                 "service", service
             ).eq(
                 "status", "active"
-            ).execute()
+            ))
             
             return result.data[0] if result.data else None
         except Exception as e:
@@ -246,11 +247,11 @@ class IntegrationManager:
     async def _load_user_integrations(self, user_id: str) -> List[Dict[str, Any]]:
         """Carga todas las integraciones del usuario"""
         try:
-            result = supabase._get_client().table("user_integrations").select("*").eq(
+            result = await supabase.execute(supabase.table("user_integrations").select("*").eq(
                 "user_id", user_id
             ).eq(
                 "status", "active"
-            ).execute()
+            ))
             
             return result.data
         except Exception as e:
@@ -260,13 +261,14 @@ class IntegrationManager:
     async def _delete_integration(self, user_id: str, service: str) -> None:
         """Elimina integración de base de datos"""
         try:
-            supabase._get_client().table("user_integrations").update({
+            await supabase.execute(supabase.table("user_integrations").update({
                 "status": "deleted"
             }).eq(
                 "user_id", user_id
             ).eq(
                 "service", service
-            ).execute()
+            ))
+            supabase.invalidate_request_context(user_id)
         except Exception as e:
             logger.error(f"Error deleting integration: {e}")
             raise
@@ -276,13 +278,13 @@ class IntegrationManager:
         try:
             cutoff = datetime.utcnow() - timedelta(hours=hours)
             
-            result = supabase._get_client().table("entries").select("*").eq(
+            result = await supabase.execute(supabase.table("entries").select("*").eq(
                 "user_id", user_id
             ).gte(
                 "created_at", cutoff.isoformat()
             ).is_(
                 "external_id", "null"  # Solo entradas que no han sido sincronizadas
-            ).execute()
+            ))
             
             return result.data
         except Exception as e:
@@ -308,11 +310,11 @@ class IntegrationManager:
         try:
             # Verificar que no existe ya
             if item.get('external_id'):
-                existing = supabase._get_client().table("entries").select("id").eq(
+                existing = await supabase.execute(supabase.table("entries").select("id").eq(
                     "external_id", item['external_id']
                 ).eq(
                     "user_id", user_id
-                ).execute()
+                ))
                 
                 if existing.data:
                     return  # Ya existe
@@ -330,7 +332,8 @@ class IntegrationManager:
                 'created_at': datetime.utcnow().isoformat()
             }
             
-            supabase._get_client().table("entries").insert(entry_data).execute()
+            await supabase.execute(supabase.table("entries").insert(entry_data))
+            supabase.notify_entries_changed(user_id)
             
         except Exception as e:
             logger.error(f"Error storing imported entry: {e}")
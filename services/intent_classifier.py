@@ -0,0 +1,179 @@
+"""
+Clasificador de intenciones conversacionales (saludos, gracias, comandos sin slash)
+"""
+import json
+import random
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from app.config import settings
+from services.expense_parser import strip_accents
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+_END = "$"
+
+# Tabla de traducción precalculada: tildes comunes y signos en una sola pasada
+_TRANSLATION = str.maketrans(
+    {**dict(zip("áéíóúüñàèìòù", "aeiouunaeiou")),
+     **{char: " " for char in "¿?¡!.,;:'\"()[]{}*_-~/\\@#$%&+=<>|^`"}}
+)
+_REPEATED = re.compile(r"(\w)\1{2,}")
+_SYMBOLS = re.compile(r"[^\w\s]")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas sin tildes ni signos; letras repetidas 3+ veces se reducen ("holaaa")"""
+    text = text.lower().translate(_TRANSLATION)
+    if not text.isascii():
+        # Emojis u otros acentos: camino lento solo cuando hace falta
+        text = _SYMBOLS.sub(" ", strip_accents(text))
+    if _REPEATED.search(text):
+        text = _REPEATED.sub(r"\1", text)
+    return " ".join(text.split())
+
+
+class IntentClassifier:
+    """
+    Reconoce mensajes que no son contenido (saludos, agradecimientos,
+    confirmaciones, preguntas de cortesía, pedidos de ayuda y comandos sin
+    slash) para responderlos sin Gemini ni crear entries.
+
+    Las frases se cargan de `config/intents.json` y se compilan una vez:
+    - intenciones "exact" en un dict (mensaje normalizado -> comando)
+    - intenciones "cover" en un trie de tokens; el mensaje se segmenta por
+      la frase más larga en cada posición y solo se clasifica si todo él
+      son frases conocidas o relleno ("ok gracias", "hola buenas tardes").
+      Así "gracias, mañana reunión a las 3" sigue siendo contenido real.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or settings.intents_path)
+        if not self.path.is_absolute():
+            self.path = _PROJECT_ROOT / self.path
+
+        self.commands: Dict[str, str] = {}
+        self.trie: Dict[str, Any] = {}
+        self.intents: Dict[str, Dict[str, Any]] = {}
+        self.priority: Dict[str, int] = {}
+        self.stats = {"classified": 0, "real_content": 0, "by_intent": {}}
+        self.load()
+
+    def load(self) -> int:
+        """Compila las intenciones del archivo; devuelve el número de frases"""
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        commands: Dict[str, str] = {}
+        trie: Dict[str, Any] = {}
+        intents: Dict[str, Dict[str, Any]] = {}
+        priority: Dict[str, int] = {}
+        phrase_count = 0
+
+        for phrase in data.get("filler", []):
+            self._insert(trie, normalize(phrase), None)
+            phrase_count += 1
+
+        for index, intent in enumerate(data["intents"]):
+            name = intent["name"]
+            intents[name] = intent
+            priority[name] = index
+
+            if intent["match"] == "exact":
+                for phrase, command in intent.get("commands", {}).items():
+                    commands[normalize(phrase)] = command
+                    phrase_count += 1
+            else:
+                for phrase in intent.get("phrases", []):
+                    self._insert(trie, normalize(phrase), name)
+                    phrase_count += 1
+
+        self.commands, self.trie, self.intents, self.priority = commands, trie, intents, priority
+        logger.info(f"IntentClassifier: {len(intents)} intenciones, {phrase_count} frases desde {self.path.name}")
+        return phrase_count
+
+    def _insert(self, trie: Dict[str, Any], phrase: str, intent: Optional[str]) -> None:
+        node = trie
+        for token in phrase.split():
+            node = node.setdefault(token, {})
+        # El relleno (None) no pisa una intención ya registrada para la misma frase
+        if node.get(_END) is None:
+            node[_END] = intent
+
+    def classify(self, message: str) -> Optional[Dict[str, Any]]:
+        """
+        Intención del mensaje o None si es contenido real
+
+        Returns:
+            {"intent", "summary", "command", "response"}; `command` es el
+            comando a ejecutar (comandos sin slash) y `response` el texto a
+            enviar en los demás casos
+        """
+        stripped = message.strip()
+        text = normalize(stripped)
+
+        if not text:
+            # Solo emojis/símbolos
+            if stripped and len(stripped) <= 10:
+                return self._result("emoji_only", "Emoji respondido", response="Entendido!")
+            return self._miss()
+
+        command = self.commands.get(text)
+        if command:
+            return self._result("command", self.intents["command"].get("summary", ""), command=command)
+
+        intent = self._cover(text.split())
+        if intent is None and len(text) <= 2:
+            intent = "ambiguous"
+        if intent is None:
+            return self._miss()
+
+        spec = self.intents[intent]
+        return self._result(intent, spec.get("summary", ""), response=random.choice(spec["responses"]))
+
+    def _cover(self, tokens: List[str]) -> Optional[str]:
+        """
+        Intención de mayor prioridad si todos los tokens son frases
+        conocidas (coincidencia más larga en cada posición); None si no
+        """
+        found: List[str] = []
+        position = 0
+        while position < len(tokens):
+            node = self.trie
+            match_end, match_intent = None, None
+            for index in range(position, len(tokens)):
+                node = node.get(tokens[index])
+                if node is None:
+                    break
+                if _END in node:
+                    match_end, match_intent = index + 1, node[_END]
+            if match_end is None:
+                return None
+            if match_intent:
+                found.append(match_intent)
+            position = match_end
+
+        if not found:
+            # Solo relleno ("jaja", "porfa"): se toma como confirmación
+            return "acknowledgement"
+        return min(found, key=self.priority.__getitem__)
+
+    def _result(self, intent: str, summary: str, command: Optional[str] = None,
+                response: Optional[str] = None) -> Dict[str, Any]:
+        self.stats["classified"] += 1
+        self.stats["by_intent"][intent] = self.stats["by_intent"].get(intent, 0) + 1
+        return {"intent": intent, "summary": summary, "command": command, "response": response}
+
+    def _miss(self) -> None:
+        self.stats["real_content"] += 1
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Mensajes resueltos sin Gemini por intención"""
+        return {**self.stats, "phrases_file": str(self.path)}
+
+
+# Instancia singleton usada por MessageHandler.detect_user_intent
+intent_classifier = IntentClassifier()
@@ -0,0 +1,184 @@
+"""
+Ventana de debounce por carril: base de la agrupación de textos y de álbumes
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from loguru import logger
+
+from app.config import settings
+from services.message_queue import MessageQueue, QueueFullError, message_queue
+
+
+class _Batch:
+    """Elementos acumulados de un carril y el handler que los procesará"""
+
+    def __init__(self, handler: Callable[..., Awaitable[Any]], args: tuple, kwargs: dict):
+        self.handler = handler
+        self.args = args
+        self.kwargs = kwargs
+        self.items: List[Any] = []
+        self.timer: Optional[asyncio.Task] = None
+        self.requeues = 0
+
+
+class LaneBuffer(ABC):
+    """
+    Acumula elementos por carril (`key`, normalmente el whatsapp_number) y,
+    cuando pasan `window_seconds` sin elementos nuevos o se llega a
+    `max_items`, los encola juntos en el carril con
+    `handler(*args, **self.merge(items), **kwargs)`, usando los argumentos
+    del primer elemento.
+
+    El llamador debe hacer `flush` del carril antes de encolar cualquier
+    otro mensaje para conservar el orden.
+
+    Un lote que la cola rechaza (QueueFullError) vuelve al buffer y se
+    reintenta en la siguiente ventana, hasta `requeue_limit` veces: sus
+    mensajes ya fueron confirmados a Meta y no se volverán a entregar.
+
+    Las subclases definen `name` (logs) y `merge` (cómo llegan los
+    elementos al handler).
+    """
+
+    name = "LaneBuffer"
+
+    def __init__(self, window_seconds: float, max_items: int, queue: Optional[MessageQueue] = None):
+        self.window_seconds = window_seconds
+        self.max_items = max_items
+        self.requeue_limit = settings.message_buffer_requeue_limit
+        self.queue = queue or message_queue
+        self.batches: Dict[str, _Batch] = {}
+        self.stats = {
+            "buffered": 0,
+            "flushed": 0,
+            "merged": 0,
+            "flushed_by_size": 0,
+            "max_batch": 0,
+            "requeued": 0,
+            "dropped": 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0
+
+    @abstractmethod
+    def merge(self, items: List[Any]) -> Dict[str, Any]:
+        """Argumentos con los que el handler recibe los elementos agrupados"""
+
+    async def add(self, key: str, item: Any, handler: Callable[..., Awaitable[Any]], *args, **kwargs) -> None:
+        """
+        Acumula un elemento en el carril `key`
+
+        Raises:
+            QueueFullError: si el lote se vacía por tamaño y la cola está llena
+        """
+        batch = self.batches.get(key)
+        if batch is None:
+            batch = self.batches[key] = _Batch(handler, args, kwargs)
+
+        batch.items.append(item)
+        self.stats["buffered"] += 1
+
+        if len(batch.items) >= self.max_items:
+            self.stats["flushed_by_size"] += 1
+            try:
+                await self.flush(key)
+            except QueueFullError:
+                # El elemento actual sale del lote: el llamador pide a Meta que lo reintente
+                retained = self.batches.get(key)
+                if retained and retained.items and retained.items[-1] is item:
+                    retained.items.pop()
+                    self.stats["buffered"] -= 1
+                    if not retained.items:
+                        retained.timer.cancel()
+                        del self.batches[key]
+                raise
+            return
+
+        self._restart_window(key, batch)
+
+    async def flush(self, key: str, requeue: bool = True) -> None:
+        """
+        Encola de inmediato el lote pendiente de `key`, si existe. Si la
+        cola lo rechaza y `requeue`, el lote vuelve al buffer para la
+        siguiente ventana (hasta `requeue_limit` veces)
+
+        Raises:
+            QueueFullError: si la cola no acepta el lote
+        """
+        batch = self.batches.pop(key, None)
+        if batch is None:
+            return
+
+        if batch.timer and batch.timer is not asyncio.current_task():
+            batch.timer.cancel()
+
+        try:
+            await self.queue.enqueue(key, batch.handler, *batch.args, **self.merge(batch.items), **batch.kwargs)
+        except QueueFullError as e:
+            if requeue and batch.requeues < self.requeue_limit:
+                self._requeue(key, batch)
+                logger.warning(f"{self.name}: cola saturada, lote de {key} ({len(batch.items)}) se reintenta: {e}")
+            else:
+                self.stats["dropped"] += 1
+                logger.error(f"{self.name}: lote de {key} ({len(batch.items)}) descartado, cola saturada: {e}")
+            raise
+
+        self.stats["flushed"] += 1
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch.items))
+        if len(batch.items) > 1:
+            self.stats["merged"] += 1
+            logger.info(f"{self.name}: {len(batch.items)} mensajes de {key} agrupados en uno")
+
+    async def flush_all(self) -> None:
+        """Encola todos los lotes pendientes (usado al apagar, sin reintentos)"""
+        for key in list(self.batches):
+            try:
+                await self.flush(key, requeue=False)
+            except QueueFullError:
+                pass
+
+    def _requeue(self, key: str, batch: _Batch) -> None:
+        """Devuelve un lote rechazado al buffer, delante de lo que haya llegado mientras tanto"""
+        batch.requeues += 1
+        self.stats["requeued"] += 1
+        newer = self.batches.pop(key, None)
+        if newer is not None:
+            if newer.timer:
+                newer.timer.cancel()
+            batch.items.extend(newer.items)
+        self.batches[key] = batch
+        self._restart_window(key, batch)
+
+    def _restart_window(self, key: str, batch: _Batch) -> None:
+        """Cada elemento nuevo (o reintento) reinicia la ventana"""
+        if batch.timer and batch.timer is not asyncio.current_task():
+            batch.timer.cancel()
+        batch.timer = asyncio.create_task(self._flush_after_window(key), name=f"{self.name}-{key}")
+
+    async def _flush_after_window(self, key: str):
+        """Vacía el lote cuando la ventana expira sin elementos nuevos"""
+        try:
+            await asyncio.sleep(self.window_seconds)
+        except asyncio.CancelledError:
+            return
+
+        try:
+            await self.flush(key)
+        except QueueFullError:
+            # Ya quedó reprogramado o descartado (y registrado) en flush
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas de agrupación: llamadas ahorradas = elementos - envíos"""
+        pending_items = sum(len(batch.items) for batch in self.batches.values())
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "window_seconds": self.window_seconds,
+            "max_items": self.max_items,
+            "pending": len(self.batches),
+            "calls_saved": self.stats["buffered"] - pending_items - self.stats["flushed"]
+        }
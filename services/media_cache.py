@@ -0,0 +1,128 @@
+"""
+Cache por contenido para imágenes y notas de voz repetidas
+"""
+import copy
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.config import settings
+from core.cache import TTLCache
+
+
+def content_digest(data: bytes) -> str:
+    """SHA-256 hexadecimal de los bytes del archivo"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class MediaCache:
+    """
+    Resultado ya interpretado (entry + transcripción o texto extraído) de
+    cada imagen/nota de voz, para que un reenvío no vuelva a llamar a Gemini.
+
+    Claves, todas por usuario (el tipo gasto/ingreso y las fechas relativas
+    dependen de quién envía) y por el texto que acompaña al archivo:
+    - SHA-256 de los bytes descargados
+    - `sha256` que WhatsApp envía en el webhook: permite omitir la descarga
+    - hash perceptual (dHash) de la imagen ya preprocesada, solo si
+      `media_cache_perceptual`: recompresiones de la misma foto coinciden,
+      pero dos comprobantes con el mismo diseño también pueden hacerlo
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.enabled = settings.media_cache_enabled
+        self.perceptual = settings.media_cache_perceptual
+        self.max_distance = settings.media_cache_phash_max_distance
+        self.entries = TTLCache(
+            max_size=max_size or settings.media_cache_size,
+            ttl_seconds=ttl_seconds or settings.media_cache_ttl_seconds,
+            name="media"
+        )
+        # (usuario, contexto) -> [(dhash, clave)] de sus imágenes recientes
+        self.recent_images = TTLCache(
+            max_size=max_size or settings.media_cache_size,
+            ttl_seconds=ttl_seconds or settings.media_cache_ttl_seconds,
+            name="media_phash"
+        )
+        self.stats = {
+            "lookups": 0,
+            "exact_hits": 0,
+            "fingerprint_hits": 0,
+            "perceptual_hits": 0,
+            "stores": 0
+        }
+
+    def lookup(self, user_id: Optional[str], kind: str, context: str = "", digest: Optional[str] = None,
+               fingerprint: Optional[str] = None, phash: Optional[int] = None,
+               count_miss: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Copia del valor guardado para alguna de las claves dadas, o None
+
+        Args:
+            count_miss: False en la consulta previa a la descarga, para que
+                cada mensaje cuente una sola vez en la tasa de acierto
+        """
+        if not self.enabled or not user_id:
+            return None
+
+        found, hit_type = None, None
+        if fingerprint:
+            found, hit_type = self.entries.peek((user_id, kind, "wa", fingerprint, context)), "fingerprint_hits"
+        if found is None and digest:
+            found, hit_type = self.entries.peek((user_id, kind, "sha256", digest, context)), "exact_hits"
+        if found is None and phash is not None and self.perceptual:
+            found, hit_type = self._similar(user_id, context, phash), "perceptual_hits"
+
+        if found is None:
+            if count_miss:
+                self.stats["lookups"] += 1
+            return None
+
+        self.stats["lookups"] += 1
+        self.stats[hit_type] += 1
+        logger.info(f"MEDIA-CACHE: {kind} repetido de {user_id} ({hit_type}), sin llamar a Gemini")
+        return copy.deepcopy(found)
+
+    def _similar(self, user_id: str, context: str, phash: int) -> Optional[Dict[str, Any]]:
+        for candidate, key in self.recent_images.peek((user_id, context), []):
+            if bin(candidate ^ phash).count("1") <= self.max_distance:
+                return self.entries.peek(key)
+        return None
+
+    def store(self, user_id: Optional[str], kind: str, value: Dict[str, Any], context: str = "",
+              digest: Optional[str] = None, fingerprint: Optional[str] = None,
+              phash: Optional[int] = None) -> None:
+        """Guarda el resultado bajo cada clave conocida del archivo"""
+        if not self.enabled or not user_id:
+            return
+
+        keys: List[Tuple] = []
+        if digest:
+            keys.append((user_id, kind, "sha256", digest, context))
+        if fingerprint:
+            keys.append((user_id, kind, "wa", fingerprint, context))
+        for key in keys:
+            self.entries.set(key, copy.deepcopy(value))
+        self.stats["stores"] += 1
+
+        if phash is not None and keys:
+            recent = self.recent_images.peek((user_id, context), [])
+            # Las más recientes primero; se revisan pocas por usuario
+            self.recent_images.set((user_id, context), [(phash, keys[0])] + recent[:19])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Consultas, aciertos por tipo de clave y tasa de acierto"""
+        lookups = self.stats["lookups"]
+        hits = self.stats["exact_hits"] + self.stats["fingerprint_hits"] + self.stats["perceptual_hits"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "perceptual": self.perceptual,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "entries": self.entries.get_stats()
+        }
+
+
+# Instancia singleton usada por GeminiService (imágenes y audio) y MessageHandler
+media_cache = MediaCache()
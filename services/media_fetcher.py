@@ -0,0 +1,188 @@
+"""
+Descarga de media de WhatsApp Cloud API con pool de conexiones compartido
+"""
+import asyncio
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+import aiohttp
+from loguru import logger
+
+from app.config import current_settings, settings
+from core.metrics import LatencyHistogram
+
+GRAPH_API_URL = "https://graph.facebook.com/v18.0"
+CHUNK_SIZE = 64 * 1024
+# Respuestas que vale la pena reintentar (límite de tasa o fallas del CDN)
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+
+class MediaFetchError(Exception):
+    """No se pudo obtener un archivo de media; `reason` resume la causa para las métricas"""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+
+class MediaFetcher:
+    """
+    Resuelve el `media_id` del webhook a su URL y descarga el archivo:
+
+    - una sola `aiohttp.ClientSession` (pool de `media_fetch_pool_size`
+      conexiones) reutilizada entre descargas
+    - el cuerpo se lee por bloques a un `SpooledTemporaryFile`: en memoria
+      hasta `media_spool_memory_bytes`, en disco por encima
+    - corta en `media_fetch_max_bytes` (Content-Length o bytes leídos)
+    - reintenta errores de conexión, timeouts y 429/5xx con backoff
+    """
+
+    def __init__(self, base_url: str = GRAPH_API_URL):
+        self.base_url = base_url
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.stats = {
+            "downloads": 0,
+            "bytes": 0,
+            "retries": 0,
+            "spooled_to_disk": 0,
+            "failures": 0,
+            "reasons": {},
+            "download_seconds": 0.0
+        }
+        self.latency = LatencyHistogram(buckets_ms=(50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000))
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Sesión compartida, creada en el primer uso (requiere event loop)"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=settings.media_fetch_pool_size, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(
+                    total=settings.media_fetch_timeout,
+                    connect=settings.media_fetch_connect_timeout
+                )
+            )
+        return self.session
+
+    @staticmethod
+    def _auth_headers() -> Dict[str, str]:
+        """Token del snapshot vigente: una rotación (reload_settings) aplica sin recrear el pool"""
+        return {"Authorization": f"Bearer {current_settings().whatsapp_access_token.strip()}"}
+
+    async def close(self) -> None:
+        """Cierra el pool de conexiones al apagar la aplicación"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def get_media_url(self, media_id: str) -> str:
+        """
+        URL temporal (unos minutos) del archivo
+
+        Raises:
+            MediaFetchError: si Graph API no devuelve la URL
+        """
+        async def attempt():
+            async with self._get_session().get(f"{self.base_url}/{media_id}", headers=self._auth_headers()) as response:
+                self._check_status(response)
+                data = await response.json()
+            if not data.get("url"):
+                raise MediaFetchError("missing_url", f"media {media_id}")
+            return data["url"]
+
+        return await self._with_retries(attempt)
+
+    async def fetch(self, media_url: str) -> tempfile.SpooledTemporaryFile:
+        """
+        Descarga el archivo a un buffer temporal posicionado al inicio;
+        el llamador debe cerrarlo
+
+        Raises:
+            MediaFetchError: si el archivo excede el tamaño, falla o agota los reintentos
+        """
+        started = time.monotonic()
+        buffer = await self._with_retries(lambda: self._stream(media_url))
+        elapsed = time.monotonic() - started
+
+        size = buffer.tell()
+        buffer.seek(0)
+        self.stats["downloads"] += 1
+        self.stats["bytes"] += size
+        self.stats["download_seconds"] += elapsed
+        self.latency.observe(elapsed * 1000)
+        if size > settings.media_spool_memory_bytes:
+            self.stats["spooled_to_disk"] += 1
+        logger.info(f"MEDIA-FETCH: {size} bytes en {elapsed * 1000:.0f}ms")
+        return buffer
+
+    async def download(self, media_url: str) -> bytes:
+        """Contenido completo del archivo (los modelos lo reciben en línea)"""
+        with (await self.fetch(media_url)) as buffer:
+            return buffer.read()
+
+    async def fetch_media(self, media_id: str) -> bytes:
+        """`get_media_url` + `download` del archivo de un mensaje"""
+        return await self.download(await self.get_media_url(media_id))
+
+    async def _stream(self, media_url: str) -> tempfile.SpooledTemporaryFile:
+        """Un intento de descarga por bloques, respetando el tamaño máximo"""
+        max_bytes = settings.media_fetch_max_bytes
+        buffer = tempfile.SpooledTemporaryFile(max_size=settings.media_spool_memory_bytes)
+        try:
+            async with self._get_session().get(media_url, headers=self._auth_headers()) as response:
+                self._check_status(response)
+                if response.content_length and response.content_length > max_bytes:
+                    raise MediaFetchError("too_large", f"{response.content_length} bytes")
+
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    buffer.write(chunk)
+                    if buffer.tell() > max_bytes:
+                        raise MediaFetchError("too_large", f"más de {max_bytes} bytes")
+            return buffer
+        except BaseException:
+            buffer.close()
+            raise
+
+    @staticmethod
+    def _check_status(response: aiohttp.ClientResponse) -> None:
+        if response.status in TRANSIENT_STATUSES:
+            raise MediaFetchError("transient_status", str(response.status))
+        if response.status != 200:
+            raise MediaFetchError(f"http_{response.status}", str(response.url))
+
+    async def _with_retries(self, attempt):
+        """Ejecuta `attempt` reintentando solo las fallas transitorias"""
+        retries = settings.media_fetch_retries
+        for retry in range(retries + 1):
+            try:
+                return await attempt()
+            except MediaFetchError as e:
+                error = e
+                transient = e.reason == "transient_status"
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                error = MediaFetchError("timeout" if isinstance(e, asyncio.TimeoutError) else "connection",
+                                        str(e) or type(e).__name__)
+                transient = True
+
+            if not transient or retry == retries:
+                self.stats["failures"] += 1
+                self.stats["reasons"][error.reason] = self.stats["reasons"].get(error.reason, 0) + 1
+                logger.warning(f"MEDIA-FETCH: falló tras {retry + 1} intento(s): {error}")
+                raise error
+
+            self.stats["retries"] += 1
+            await asyncio.sleep(settings.media_fetch_backoff * (2 ** retry))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Descargas, fallas por causa y throughput promedio"""
+        seconds = self.stats["download_seconds"]
+        return {
+            **{key: value for key, value in self.stats.items() if key != "download_seconds"},
+            "pool_size": settings.media_fetch_pool_size,
+            "max_bytes": settings.media_fetch_max_bytes,
+            "throughput_kbps": round(self.stats["bytes"] / 1024 / seconds, 1) if seconds else 0.0,
+            "latency": self.latency.get_stats()
+        }
+
+
+# Instancia singleton usada por MessageHandler para audio e imágenes
+media_fetcher = MediaFetcher()
@@ -0,0 +1,44 @@
+"""
+Agrupación de ráfagas de mensajes de texto de un mismo usuario
+"""
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from services.lane_buffer import LaneBuffer
+from services.message_queue import MessageQueue
+
+
+class MessageCoalescer(LaneBuffer):
+    """
+    Ventana de debounce por usuario: los mensajes de texto consecutivos
+    ("gasté 5000", "en almuerzo") se acumulan y, cuando pasan
+    `window_seconds` sin mensajes nuevos o se llega a `max_messages`, se
+    encolan como un solo texto en el carril del usuario. Así una idea
+    partida en varios mensajes genera una sola llamada a Gemini.
+
+    Los comandos `/` no se agrupan; el llamador debe hacer `flush` del
+    carril antes de encolarlos (o cualquier mensaje no textual) para
+    conservar el orden.
+    """
+
+    name = "MessageCoalescer"
+
+    def __init__(self, window_seconds: Optional[float] = None, max_messages: Optional[int] = None,
+                 queue: Optional[MessageQueue] = None):
+        super().__init__(
+            window_seconds if window_seconds is not None else settings.message_coalesce_window_seconds,
+            max_messages or settings.message_coalesce_max_messages,
+            queue
+        )
+
+    def accepts(self, message_text: Optional[str]) -> bool:
+        """Indica si el texto debe pasar por la ventana (no aplica a comandos)"""
+        return self.enabled and bool(message_text) and not message_text.strip().startswith('/')
+
+    def merge(self, items: List[str]) -> Dict[str, Any]:
+        """El handler recibe `message_text` con los textos unidos por saltos de línea"""
+        return {"message_text": "\n".join(items)}
+
+
+# Instancia singleton usada por el webhook de WhatsApp Cloud
+message_coalescer = MessageCoalescer()
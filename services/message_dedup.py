@@ -0,0 +1,148 @@
+"""
+Idempotencia de mensajes entrantes: cache de IDs ya vistos
+"""
+import asyncio
+import json
+import os
+from typing import Any, Dict, Optional
+from loguru import logger
+
+from app.config import settings
+from core.cache import TTLCache
+
+
+class MessageDeduplicator:
+    """
+    Recuerda los `message.id` recibidos durante la ventana de reintentos de
+    Meta/WAHA para descartar entregas duplicadas antes de hacer cualquier
+    trabajo. Opcionalmente persiste el cache en un snapshot JSON para que un
+    reinicio no vuelva a procesar los reintentos pendientes; con
+    `start_autosave` el snapshot se guarda también cada
+    `message_dedup_snapshot_interval_seconds`, así un cierre abrupto pierde
+    a lo sumo ese intervalo.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 snapshot_path: Optional[str] = None):
+        self.seen = TTLCache(
+            max_size=max_size or settings.message_dedup_max_size,
+            ttl_seconds=ttl_seconds or settings.message_dedup_ttl_seconds,
+            name="message_dedup"
+        )
+        self.snapshot_path = snapshot_path if snapshot_path is not None else settings.message_dedup_snapshot_path
+        self.unsaved_changes = 0
+        self.autosave_task: Optional[asyncio.Task] = None
+        self.snapshot_stats = {"saves": 0, "failures": 0}
+
+    def is_duplicate(self, message_id: Optional[str]) -> bool:
+        """
+        Verifica y marca el ID en una sola operación
+
+        Returns:
+            True si el mensaje ya se había recibido (debe ignorarse)
+        """
+        if not message_id:
+            return False
+
+        if self.seen.get(message_id) is not None:
+            logger.info(f"⚠️ Mensaje duplicado ignorado: {message_id}")
+            return True
+
+        self.seen.set(message_id, True)
+        self.unsaved_changes += 1
+        return False
+
+    def forget(self, message_id: Optional[str]) -> None:
+        """Desmarca un ID (p.ej. si no se pudo encolar y debe aceptarse el reintento)"""
+        if message_id:
+            self.seen.delete(message_id)
+            self.unsaved_changes += 1
+
+    def load_snapshot(self) -> int:
+        """Restaura IDs vigentes desde el snapshot; devuelve cuántos se cargaron"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            for message_id, expires_at in data.items():
+                self.seen.set_until(message_id, True, float(expires_at))
+
+            logger.info(f"MessageDeduplicator: {len(self.seen)} IDs restaurados desde {self.snapshot_path}")
+            return len(self.seen)
+
+        except Exception as e:
+            logger.warning(f"MessageDeduplicator: no se pudo leer snapshot {self.snapshot_path}: {e}")
+            return 0
+
+    def save_snapshot(self) -> int:
+        """Guarda los IDs vigentes en el snapshot; devuelve cuántos se guardaron"""
+        if not self.snapshot_path:
+            return 0
+        return self._write_snapshot(self._snapshot_data())
+
+    def _snapshot_data(self) -> Dict[str, float]:
+        """Copia de los IDs vigentes (en el event loop, antes de escribir en otro hilo)"""
+        self.unsaved_changes = 0
+        return {message_id: expires_at for message_id, _, expires_at in self.seen.items()}
+
+    def _write_snapshot(self, data: Dict[str, float]) -> int:
+        try:
+            directory = os.path.dirname(self.snapshot_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            # Escritura atómica para no dejar un snapshot corrupto
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.snapshot_path)
+
+            self.snapshot_stats["saves"] += 1
+            logger.debug(f"MessageDeduplicator: {len(data)} IDs guardados en {self.snapshot_path}")
+            return len(data)
+
+        except Exception as e:
+            self.snapshot_stats["failures"] += 1
+            self.unsaved_changes += 1  # Reintentar en el siguiente intervalo
+            logger.warning(f"MessageDeduplicator: no se pudo guardar snapshot {self.snapshot_path}: {e}")
+            return 0
+
+    def start_autosave(self, interval: Optional[float] = None) -> None:
+        """Guarda el snapshot periódicamente (solo si hubo cambios); requiere event loop"""
+        interval = interval if interval is not None else settings.message_dedup_snapshot_interval_seconds
+        if not self.snapshot_path or interval <= 0 or self.autosave_task is not None:
+            return
+        self.autosave_task = asyncio.create_task(self._autosave(interval), name="message-dedup-autosave")
+
+    async def stop_autosave(self) -> None:
+        """Detiene el guardado periódico (el llamador hace el save_snapshot final)"""
+        task, self.autosave_task = self.autosave_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _autosave(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            if self.unsaved_changes:
+                # La escritura a disco no bloquea el event loop
+                await asyncio.to_thread(self._write_snapshot, self._snapshot_data())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores: hits = duplicados descartados, misses = mensajes nuevos"""
+        return {
+            **self.seen.get_stats(),
+            "persistent": bool(self.snapshot_path),
+            "unsaved_changes": self.unsaved_changes,
+            "snapshot": self.snapshot_stats
+        }
+
+
+# Instancia singleton compartida por todas las rutas de entrada
+message_dedup = MessageDeduplicator()
@@ -0,0 +1,208 @@
+"""
+Cola de procesamiento de mensajes entrantes con pool acotado de workers
+y carriles ordenados por usuario
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from loguru import logger
+
+from app.config import settings
+
+
+class QueueFullError(Exception):
+    """La cola alcanzó su capacidad máxima y no acepta más mensajes"""
+
+
+class MessageQueue:
+    """
+    Desacopla el webhook del procesamiento: el webhook encola y responde 200
+    de inmediato, y un pool de workers asyncio ejecuta el pipeline
+    (Gemini + Supabase + envío) en segundo plano.
+
+    Los mensajes se agrupan en carriles por clave (whatsapp_number): cada
+    carril se procesa estrictamente en orden, uno a la vez, mientras que
+    carriles distintos corren en paralelo. Los workers toman un mensaje por
+    turno y devuelven el carril al final de la fila, así un usuario con
+    ráfagas no acapara el pool.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_size: Optional[int] = None,
+                 max_lanes: Optional[int] = None, lane_max_backlog: Optional[int] = None):
+        self.worker_count = workers or settings.message_workers
+        self.max_size = max_size or settings.message_queue_max_size
+        self.max_lanes = max_lanes or settings.message_max_lanes
+        self.lane_max_backlog = lane_max_backlog or settings.message_lane_max_backlog
+
+        # Mensajes pendientes por carril y carriles listos para un worker
+        self.lanes: Dict[str, Deque[Tuple[float, Callable[..., Awaitable[Any]], tuple, dict]]] = {}
+        self.ready: Optional[asyncio.Queue] = None
+        # Carriles en la fila de listos o siendo procesados
+        self.scheduled: Set[str] = set()
+        self.active: Set[str] = set()
+
+        self.pending = 0  # Encolados + en proceso
+        self.idle: Optional[asyncio.Event] = None
+        self.workers: List[asyncio.Task] = []
+        self.is_running = False
+        self.accepting = False
+        self.stats = {
+            "enqueued": 0,
+            "processed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "rejected_lane_backlog": 0,
+            "rejected_lane_limit": 0,
+            "max_depth": 0,
+            "max_lanes_seen": 0,
+            "total_wait_ms": 0.0
+        }
+
+    async def start(self):
+        """Crea la fila de carriles y lanza los workers"""
+        if self.is_running:
+            return
+
+        self.ready = asyncio.Queue()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.workers = [
+            asyncio.create_task(self._worker(i), name=f"message-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+        self.is_running = True
+        self.accepting = True
+        logger.info(
+            f"✅ MessageQueue iniciada: {self.worker_count} workers, capacidad {self.max_size}, "
+            f"{self.max_lanes} carriles x {self.lane_max_backlog} mensajes"
+        )
+
+    async def stop(self, drain_timeout: Optional[float] = None):
+        """Deja de aceptar mensajes, drena lo pendiente y detiene los workers"""
+        if not self.is_running:
+            return
+
+        self.accepting = False
+        timeout = drain_timeout if drain_timeout is not None else settings.message_queue_drain_timeout
+
+        if self.pending:
+            logger.info(f"MessageQueue: drenando {self.pending} mensajes pendientes (timeout {timeout}s)")
+
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"MessageQueue: timeout drenando cola, se descartan {self.pending} mensajes")
+
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+        self.workers = []
+        self.lanes.clear()
+        self.scheduled.clear()
+        self.active.clear()
+        self.pending = 0
+        self.is_running = False
+        logger.info("⏹️ MessageQueue detenida")
+
+    async def enqueue(self, key: str, handler: Callable[..., Awaitable[Any]], *args, **kwargs) -> None:
+        """
+        Encola una corrutina en el carril de `key` (normalmente el whatsapp_number)
+
+        Raises:
+            QueueFullError: si la cola, el carril o el número de carriles están al límite
+        """
+        if not self.is_running:
+            await self.start()
+
+        handler_name = getattr(handler, '__name__', handler)
+
+        if not self.accepting:
+            self.stats["rejected"] += 1
+            raise QueueFullError("MessageQueue se está apagando")
+
+        if self.pending >= self.max_size:
+            self.stats["rejected"] += 1
+            logger.warning(f"MessageQueue llena ({self.max_size}), rechazando {handler_name}")
+            raise QueueFullError(f"Cola llena ({self.max_size} mensajes)")
+
+        lane = self.lanes.get(key)
+        if lane is None:
+            if len(self.lanes) >= self.max_lanes:
+                self.stats["rejected"] += 1
+                self.stats["rejected_lane_limit"] += 1
+                logger.warning(f"MessageQueue: límite de {self.max_lanes} carriles alcanzado, rechazando {key}")
+                raise QueueFullError(f"Límite de carriles alcanzado ({self.max_lanes})")
+            lane = self.lanes[key] = deque()
+        elif len(lane) >= self.lane_max_backlog:
+            self.stats["rejected"] += 1
+            self.stats["rejected_lane_backlog"] += 1
+            logger.warning(f"MessageQueue: carril {key} con {len(lane)} mensajes en espera, rechazando {handler_name}")
+            raise QueueFullError(f"Carril {key} lleno ({self.lane_max_backlog} mensajes)")
+
+        lane.append((time.monotonic(), handler, args, kwargs))
+        self.pending += 1
+        self.idle.clear()
+
+        # Un carril solo entra a la fila si no está ya esperando o en proceso
+        if key not in self.scheduled:
+            self.scheduled.add(key)
+            self.ready.put_nowait(key)
+
+        self.stats["enqueued"] += 1
+        self.stats["max_depth"] = max(self.stats["max_depth"], self.pending)
+        self.stats["max_lanes_seen"] = max(self.stats["max_lanes_seen"], len(self.lanes))
+
+    async def _worker(self, worker_id: int):
+        """Toma un carril listo, procesa su siguiente mensaje y lo devuelve a la fila"""
+        while True:
+            key = await self.ready.get()
+            lane = self.lanes[key]
+            enqueued_at, handler, args, kwargs = lane.popleft()
+            self.active.add(key)
+            self.stats["total_wait_ms"] += (time.monotonic() - enqueued_at) * 1000
+
+            try:
+                await handler(*args, **kwargs)
+                self.stats["processed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"MessageQueue worker {worker_id}: error en {getattr(handler, '__name__', handler)} ({key}): {e}")
+            finally:
+                self.active.discard(key)
+                if lane:
+                    # Quedan mensajes: el carril vuelve al final de la fila (equidad entre usuarios)
+                    self.ready.put_nowait(key)
+                else:
+                    del self.lanes[key]
+                    self.scheduled.discard(key)
+
+                self.pending -= 1
+                if self.pending == 0:
+                    self.idle.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas actuales de la cola"""
+        completed = self.stats["processed"] + self.stats["failed"]
+        return {
+            **self.stats,
+            "running": self.is_running,
+            "workers": self.worker_count,
+            "capacity": self.max_size,
+            "max_lanes": self.max_lanes,
+            "lane_max_backlog": self.lane_max_backlog,
+            "depth": self.pending,
+            "lanes": len(self.lanes),
+            "active_lanes": len(self.active),
+            "avg_wait_ms": round(self.stats["total_wait_ms"] / completed, 2) if completed else 0.0
+        }
+
+
+def lane_key(phone: Optional[str]) -> str:
+    """Clave de carril a partir del número (limpia formato legacy @c.us)"""
+    return ''.join(filter(str.isdigit, phone or "")) or "unknown"
+
+
+# Instancia singleton
+message_queue = MessageQueue()
@@ -210,9 +210,9 @@ Para completar tu upgrade a ADHD Premium:
     async def _get_plan_info(self, plan_name: str) -> Optional[Dict[str, Any]]:
         """Obtiene información del plan desde la BD"""
         try:
-            result = supabase._get_client().table("premium_plans").select("*").eq(
+            result = await supabase.execute(supabase.table("premium_plans").select("*").eq(
                 "plan_name", plan_name
-            ).eq("active", True).single().execute()
+            ).eq("active", True).single())
             
             return result.data
             
@@ -235,9 +235,9 @@ Para completar tu upgrade a ADHD Premium:
                 'created_at': datetime.now().isoformat()
             }
             
-            result = supabase._get_client().table("payment_transactions").insert(
+            result = await supabase.execute(supabase.table("payment_transactions").insert(
                 transaction_data
-            ).execute()
+            ))
             
             logger.info(f"Transacción guardada: {transaction_id}")
             return result.data[0] if result.data else None
@@ -249,9 +249,9 @@ Para completar tu upgrade a ADHD Premium:
     async def _get_transaction(self, transaction_id: str, payment_provider: str) -> Optional[Dict]:
         """Obtiene transacción por ID y proveedor"""
         try:
-            result = supabase._get_client().table("payment_transactions").select("*").eq(
+            result = await supabase.execute(supabase.table("payment_transactions").select("*").eq(
                 "transaction_id", transaction_id
-            ).eq("payment_provider", payment_provider).single().execute()
+            ).eq("payment_provider", payment_provider).single())
             
             return result.data
             
@@ -268,11 +268,12 @@ Para completar tu upgrade a ADHD Premium:
                 return {'success': False, 'error': 'Plan no encontrado'}
             
             # Usar función de BD para upgrade de plan
-            result = supabase._get_client().rpc('upgrade_user_plan', {
+            result = await supabase.execute(supabase.rpc('upgrade_user_plan', {
                 'user_uuid': user_id,
                 'new_plan_name': plan['plan_name'],
                 'transaction_uuid': transaction_id
-            }).execute()
+            }))
+            supabase.invalidate_user(user_id)
             
             if result.data and result.data.get('success'):
                 duration_months = 12 if plan['plan_type'] == 'yearly' else 1
@@ -299,9 +300,9 @@ Para completar tu upgrade a ADHD Premium:
     async def _get_plan_info_by_id(self, plan_id: str) -> Optional[Dict]:
         """Obtiene plan por ID"""
         try:
-            result = supabase._get_client().table("premium_plans").select("*").eq(
+            result = await supabase.execute(supabase.table("premium_plans").select("*").eq(
                 "id", plan_id
-            ).single().execute()
+            ).single())
             
             return result.data
             
@@ -312,10 +313,10 @@ Para completar tu upgrade a ADHD Premium:
     async def _update_transaction_status(self, transaction_id: str, status: str):
         """Actualiza estado de transacción"""
         try:
-            supabase._get_client().table("payment_transactions").update({
+            await supabase.execute(supabase.table("payment_transactions").update({
                 'status': status,
                 'updated_at': datetime.now().isoformat()
-            }).eq('id', transaction_id).execute()
+            }).eq('id', transaction_id))
             
         except Exception as e:
             logger.error(f"Error actualizando transacción {transaction_id}: {e}")
@@ -54,10 +54,10 @@ class PremiumService:
         """
         try:
             # Usar función de BD para verificación completa
-            result = supabase._get_client().rpc('check_feature_access', {
+            result = await supabase.execute(supabase.rpc('check_feature_access', {
                 'user_uuid': user_id,
                 'feature_name': feature
-            }).execute()
+            }))
             
             if result.data:
                 access_info = result.data
@@ -93,9 +93,10 @@ class PremiumService:
         """Activa trial gratuito de 3 días para plan básico"""
         try:
             # Activar trial usando función de base de datos
-            result = supabase._get_client().rpc('activate_basic_trial', {
+            result = await supabase.execute(supabase.rpc('activate_basic_trial', {
                 'user_uuid': user_id
-            }).execute()
+            }))
+            supabase.invalidate_user(user_id)
             
             if result.data:
                 trial_expires = datetime.now() + timedelta(days=3)
@@ -135,9 +136,10 @@ class PremiumService:
                 }
             
             # Activar trial usando función de base de datos
-            result = supabase._get_client().rpc('activate_adhd_trial', {
+            result = await supabase.execute(supabase.rpc('activate_adhd_trial', {
                 'user_uuid': user_id
-            }).execute()
+            }))
+            supabase.invalidate_user(user_id)
             
             if result.data:
                 trial_expires = datetime.now() + timedelta(days=7)
@@ -213,9 +215,9 @@ class PremiumService:
     async def get_available_plans(self) -> List[Dict[str, Any]]:
         """Obtiene los planes premium disponibles"""
         try:
-            result = supabase._get_client().table("premium_plans").select("*").eq(
+            result = await supabase.execute(supabase.table("premium_plans").select("*").eq(
                 "active", True
-            ).execute()
+            ))
             
             plans = []
             for plan in result.data:
@@ -238,9 +240,9 @@ class PremiumService:
     async def count_adhd_plans_used(self, user_id: str) -> int:
         """Cuenta cuántos planes ADHD ha creado el usuario"""
         try:
-            result = supabase._get_client().table("adhd_plans").select(
+            result = await supabase.execute(supabase.table("adhd_plans").select(
                 "id", count="exact"
-            ).eq("user_id", user_id).execute()
+            ).eq("user_id", user_id))
             
             return result.count or 0
             
@@ -305,9 +307,9 @@ class PremiumService:
     async def _get_user_premium_info(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Obtiene información premium del usuario"""
         try:
-            result = supabase._get_client().table("users").select(
+            result = await supabase.execute(supabase.table("users").select(
                 "plan_type, premium_active, premium_expires_at, trial_used, trial_expires_at, adhd_language_preference"
-            ).eq("id", user_id).single().execute()
+            ).eq("id", user_id).single())
             
             return result.data
             
@@ -318,9 +320,10 @@ class PremiumService:
     async def _deactivate_expired_premium(self, user_id: str):
         """Desactiva premium expirado"""
         try:
-            await supabase._get_client().table("users").update({
+            await supabase.execute(supabase.table("users").update({
                 "premium_active": False
-            }).eq("id", user_id).execute()
+            }).eq("id", user_id))
+            supabase.invalidate_user(user_id)
             
             logger.info(f"Premium expirado desactivado para usuario {user_id}")
             
@@ -331,14 +334,14 @@ class PremiumService:
         """Obtiene estadísticas de uso de funciones ADHD"""
         try:
             # Contar planes ADHD
-            plans_result = supabase._get_client().table("adhd_plans").select(
+            plans_result = await supabase.execute(supabase.table("adhd_plans").select(
                 "status", count="exact"
-            ).eq("user_id", user_id).execute()
+            ).eq("user_id", user_id))
             
             # Contar tareas ADHD
-            tasks_result = supabase._get_client().table("entries").select(
+            tasks_result = await supabase.execute(supabase.table("entries").select(
                 "status", count="exact"
-            ).eq("user_id", user_id).eq("adhd_specific", True).execute()
+            ).eq("user_id", user_id).eq("adhd_specific", True))
             
             return {
                 'total_adhd_plans': plans_result.count or 0,
@@ -314,11 +314,11 @@ class ReminderScheduler:
             # Obtener usuarios que han sido activos en los últimos 7 días
             seven_days_ago = datetime.now(self.tz) - timedelta(days=7)
             
-            result = supabase._get_client().table("entries").select(
+            result = await supabase.execute(supabase.table("entries").select(
                 "user_id"
             ).gte(
                 "created_at", seven_days_ago.isoformat()
-            ).execute()
+            ))
             
             # Obtener IDs únicos de usuarios
             active_user_ids = list(set(entry['user_id'] for entry in result.data))
@@ -327,9 +327,9 @@ class ReminderScheduler:
             if not active_user_ids:
                 return []
             
-            users_result = supabase._get_client().table("users").select("*").in_(
+            users_result = await supabase.execute(supabase.table("users").select("*").in_(
                 "id", active_user_ids
-            ).execute()
+            ))
             
             return users_result.data
             
@@ -379,13 +379,13 @@ class ReminderScheduler:
             # Obtener actividad reciente del usuario
             thirty_days_ago = datetime.now(self.tz) - timedelta(days=30)
             
-            result = supabase._get_client().table("entries").select(
+            result = await supabase.execute(supabase.table("entries").select(
                 "created_at"
             ).eq(
                 "user_id", user['id']
             ).gte(
                 "created_at", thirty_days_ago.isoformat()
-            ).execute()
+            ))
             
             if not result.data:
                 # Sin datos, usar hora por defecto (8:30 AM)
@@ -476,9 +476,7 @@ class ReminderScheduler:
             tomorrow = today + timedelta(days=1)
             
             # Obtener eventos/tareas de hoy
-            today_entries = supabase._get_client().table("entries").select(
-                "type, description, datetime, priority"
-            ).eq(
+            today_entries = await supabase.execute(supabase.select("entries", "reminder").eq(
                 "user_id", user['id']
             ).gte(
                 "datetime", today.isoformat()
@@ -486,7 +484,7 @@ class ReminderScheduler:
                 "datetime", tomorrow.isoformat()
             ).eq(
                 "status", "pending"
-            ).execute()
+            ))
             
             if not today_entries.data:
                 return "📅 No tienes eventos programados para hoy\n🆓 ¡Día libre para nuevas oportunidades!"
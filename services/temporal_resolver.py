@@ -0,0 +1,455 @@
+"""
+Resolución determinística de expresiones de tiempo en español
+"""
+import re
+import unicodedata
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytz
+from loguru import logger
+
+from app.config import settings
+from services.expense_parser import strip_accents
+
+WEEKDAYS = {
+    "lunes": 0, "martes": 1, "miercoles": 2, "jueves": 3,
+    "viernes": 4, "sabado": 5, "domingo": 6
+}
+
+MONTHS = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6,
+    "julio": 7, "agosto": 8, "septiembre": 9, "setiembre": 9,
+    "octubre": 10, "noviembre": 11, "diciembre": 12
+}
+
+NUMBER_WORDS = {
+    "un": 1, "una": 1, "uno": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5,
+    "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "once": 11,
+    "doce": 12, "quince": 15, "veinte": 20, "treinta": 30, "cuarenta": 40
+}
+
+# Hora por defecto de cada parte del día cuando no se dice la hora exacta
+DAYPARTS = {"madrugada": 5, "manana": 9, "mediodia": 12, "tarde": 15, "noche": 19}
+
+DAY_WORDS = {"pasado manana": 2, "manana": 1, "hoy": 0, "ayer": -1, "antier": -2, "anteayer": -2}
+
+_NUMBER = r"\d{1,3}|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True))
+_PART = r"madrugada|manana|tarde|noche"
+
+RELATIVE_PATTERN = re.compile(
+    rf"\b(?:en|dentro de)\s+(?:(?P<half>media)\s+hora|(?P<n>{_NUMBER})\s+"
+    r"(?P<unit>minutos?|mins?|horas?|hrs?|dias?|semanas?)(?P<and_half>\s+y\s+media)?)\b"
+)
+TIME_PATTERN = re.compile(
+    rf"\b(?:a|para|tipo)\s+(?:las|la)\s+(?P<h>{_NUMBER})\b"
+    r"(?::(?P<m>\d{2})|\s+y\s+(?P<frac>media|cuarto|\d{1,2}))?"
+    r"(?:\s*(?P<ampm>am|pm|a\.\s?m\.|p\.\s?m\.)(?=\W|$))?"
+    rf"(?:\s+(?:de|en|por)\s+la\s+(?P<part>{_PART}))?"
+)
+BARE_TIME_PATTERN = re.compile(
+    r"\b(?P<h>\d{1,2})(?::(?P<m>\d{2}))?\s*(?P<ampm>am|pm|a\.\s?m\.|p\.\s?m\.)(?=\W|$)"
+    r"|\b(?P<h24>\d{1,2}):(?P<m24>\d{2})\b"
+)
+NOON_PATTERN = re.compile(r"\b(?:al|a)\s+(?P<which>mediodia|medianoche)\b")
+DAYPART_PATTERN = re.compile(rf"\b(?:(?:en|por|de)\s+la|esta|este)\s+(?P<part>{_PART})\b")
+DATE_WORDS_PATTERN = re.compile(
+    r"\b(?:el\s+)?(?P<d>\d{1,2})\s+de\s+(?P<m>" + "|".join(MONTHS) + r")\b"
+    r"(?:\s+(?:de|del)?\s*(?P<y>\d{4}))?"
+)
+DATE_NUMERIC_PATTERN = re.compile(r"\b(?:el\s+)?(?P<d>\d{1,2})/(?P<m>\d{1,2})(?:/(?P<y>\d{2,4}))?\b")
+DAY_OF_MONTH_PATTERN = re.compile(r"\bel\s+dia\s+(?P<d>\d{1,2})\b")
+DAY_WORD_PATTERN = re.compile(r"\b(?P<word>pasado\s+manana|manana|hoy|ayer|antier|anteayer)\b")
+WEEKDAY_PATTERN = re.compile(
+    r"\b(?:(?:el|este|esta)\s+)?(?:(?:proximo|proxima)\s+)?(?P<day>" + "|".join(WEEKDAYS) + r")\b"
+    r"(?:\s+(?:proximo|que\s+viene))?"
+)
+
+# Restos que indican una expresión que el resolver no entendió por completo
+UNRESOLVED_PATTERN = re.compile(
+    r"\b(cada|todos\s+los|todas\s+las|semana|mes|ano|quincena|fin\s+de|despues\s+de|antes\s+de|"
+    r"horas?|minutos?|\d{1,2}:\d{2}|manana|tarde|noche|" + "|".join(WEEKDAYS) + r")\b"
+)
+# Una segunda expresión completa ("mañana a las 3 y a las 5") también deja la resolución en duda
+SECOND_EXPRESSION_PATTERNS = (
+    RELATIVE_PATTERN, TIME_PATTERN, BARE_TIME_PATTERN, NOON_PATTERN,
+    DATE_WORDS_PATTERN, DATE_NUMERIC_PATTERN, DAY_OF_MONTH_PATTERN, DAY_WORD_PATTERN
+)
+RECURRENCE_PATTERN = re.compile(r"\b(cada|todos\s+los|todas\s+las|diario|diariamente|semanal|mensual)\b")
+
+REMINDER_TRIGGER = re.compile(
+    r"^(?:porfa\s+|por\s+favor\s+)?(?:recordame|recuerdame|recordarme|recordar|avisame|no\s+olvidar|acordarme)"
+    r"(?:\s+(?:de|que))?\b\s*"
+)
+
+
+class TemporalMatch:
+    """
+    Fecha/hora resuelta y los tramos del texto que la expresan
+
+    `alternative` es la lectura de la tarde cuando la hora es ambigua
+    ("a las 8" sin am/pm ni parte del día): `datetime` la toma de la
+    mañana y no se puede saber cuál quiso decir el usuario.
+    """
+
+    def __init__(self, when: datetime, has_time: bool, spans: List[Tuple[int, int]], confidence: float,
+                 alternative: Optional[datetime] = None):
+        self.datetime = when
+        self.has_time = has_time
+        self.spans = spans
+        self.confidence = confidence
+        self.alternative = alternative
+
+
+class TemporalResolver:
+    """
+    Convierte "mañana a las 3", "el viernes en la tarde" o "en 20 minutos"
+    en datetimes de America/Costa_Rica sin llamar al LLM.
+
+    Se usa en dos puntos de `MessageHandler.handle_text`:
+    - antes del LLM: recordatorios simples ("recordame llamar a mamá
+      mañana a las 3") se construyen localmente (`try_reminder`)
+    - después del LLM: el datetime devuelto se valida contra la expresión
+      del mensaje y se corrige si no coincide o quedó en el pasado
+      (`correct`)
+    """
+
+    def __init__(self, min_confidence: float = 0.9):
+        self.enabled = settings.temporal_resolver_enabled
+        self.min_confidence = min_confidence
+        self.tz = pytz.timezone(settings.timezone)
+        self.stats = {
+            "reminders_resolved": 0,
+            "checked": 0,
+            "corrected": 0,
+            "past_unresolved": 0
+        }
+
+    def resolve(self, message: str, now: Optional[datetime] = None) -> Optional[TemporalMatch]:
+        """
+        Resuelve la expresión de tiempo del mensaje
+
+        Returns:
+            TemporalMatch o None si el mensaje no tiene una expresión reconocible
+        """
+        now = (now or datetime.now(self.tz)).astimezone(self.tz).replace(second=0, microsecond=0)
+        text = strip_accents(unicodedata.normalize('NFC', message).lower())
+        spans: List[Tuple[int, int]] = []
+
+        def consume(match: re.Match) -> None:
+            nonlocal text
+            start, end = match.span()
+            spans.append((start, end))
+            text = text[:start] + " " * (end - start) + text[end:]
+
+        def timed(day: Optional[date], time_of_day: Tuple[int, int, bool]) -> TemporalMatch:
+            hour, minute, ambiguous = time_of_day
+            when = self._on(day, now, hour, minute)
+            alternative = self._on(day, now, hour + 12, minute) if ambiguous else None
+            return TemporalMatch(when, True, spans, self._confidence(text, spans), alternative)
+
+        # 1. Relativo: "en 20 minutos", "dentro de 2 horas", "en media hora"
+        match = RELATIVE_PATTERN.search(text)
+        if match:
+            consume(match)
+            delta, has_time = self._relative_delta(match)
+            when = now + delta
+            if not has_time:
+                time_of_day = self._find_time(text, consume)
+                if time_of_day:
+                    return timed(when.date(), time_of_day)
+            return TemporalMatch(when, has_time, spans, self._confidence(text, spans))
+
+        # 2. Hora: "a las 3", "a las 3:30 pm", "15:00", "a mediodía", "en la tarde"
+        time_of_day = self._find_time(text, consume)
+
+        # 3. Fecha: "15 de agosto", "15/08", "el día 20", "mañana", "el viernes"
+        day = self._find_date(text, now, consume)
+
+        if day is None and time_of_day is None:
+            return None
+
+        if time_of_day is None:
+            return TemporalMatch(self._at(day, now.hour, now.minute), False, spans, self._confidence(text, spans))
+
+        return timed(day, time_of_day)
+
+    def try_reminder(self, message: str, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Recordatorio listo para guardar si el mensaje es "recordame <qué>
+        <cuándo>" con fecha y hora claras y futuras; None para seguir con el LLM
+        """
+        if not self.enabled:
+            return None
+
+        now = now or datetime.now(self.tz)
+        original = unicodedata.normalize('NFC', message.strip())
+        text = strip_accents(original.lower())
+
+        trigger = REMINDER_TRIGGER.match(text)
+        if not trigger or RECURRENCE_PATTERN.search(text) or '?' in text:
+            return None
+
+        match = self.resolve(original, now)
+        if not match or not match.has_time or match.confidence < self.min_confidence or match.datetime <= now:
+            return None
+        if match.alternative:
+            # "a las 8" puede ser de la mañana o de la noche: decide el LLM
+            return None
+
+        # Descripción: el mensaje sin el disparador ni las expresiones de tiempo
+        chars = list(original)
+        for start, end in [(0, trigger.end())] + match.spans:
+            chars[start:end] = [" "] * (end - start)
+        description = re.sub(r"\s+", " ", "".join(chars)).strip(" ,.;:-")
+        description = re.sub(r"\s+(?:a|de|el|para)$", "", description)
+        if not description:
+            return None
+
+        self.stats["reminders_resolved"] += 1
+        logger.info(f"TemporalResolver: recordatorio para {match.datetime.isoformat()} sin LLM")
+        return {
+            "type": "recordatorio",
+            "description": description[0].upper() + description[1:],
+            "amount": None,
+            "datetime": match.datetime.isoformat(),
+            "datetime_end": (match.datetime + timedelta(minutes=30)).isoformat(),
+            "priority": "media",
+            "recurrence": "none",
+            "task_category": None,
+            "status": "pending"
+        }
+
+    def correct(self, result: Dict[str, Any], message: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Valida el datetime que devolvió el LLM para eventos, tareas y
+        recordatorios. Si el mensaje tiene una expresión clara y el LLM no
+        coincide (o devolvió una fecha pasada), se usa la resuelta aquí y
+        se desplaza `datetime_end` para conservar la duración.
+        """
+        if not self.enabled or result.get("type") not in ("evento", "tarea", "recordatorio"):
+            return result
+
+        try:
+            llm_time = self._parse_iso(result.get("datetime"))
+        except ValueError:
+            llm_time = None
+
+        now = now or datetime.now(self.tz)
+        self.stats["checked"] += 1
+        match = self.resolve(message, now)
+
+        resolved = match.datetime if match and match.confidence >= self.min_confidence else None
+        if resolved and match.alternative:
+            resolved = self._reading(match, llm_time)
+
+        if resolved is None:
+            if llm_time and llm_time <= now and result.get("recurrence", "none") == "none":
+                self.stats["past_unresolved"] += 1
+                logger.warning(f"TemporalResolver: datetime del LLM en el pasado sin expresión resoluble: {llm_time}")
+            return result
+
+        if not match.has_time and llm_time:
+            # Solo se corrige el día; la hora la eligió el LLM según el contenido
+            resolved = self._at(match.datetime.date(), llm_time.hour, llm_time.minute)
+
+        if llm_time and llm_time.replace(second=0, microsecond=0) == resolved:
+            return result
+
+        logger.info(f"TemporalResolver: corrigiendo datetime {result.get('datetime')} -> {resolved.isoformat()}")
+        self.stats["corrected"] += 1
+        result["datetime"] = resolved.isoformat()
+
+        try:
+            end_time = self._parse_iso(result.get("datetime_end"))
+            duration = end_time - llm_time if llm_time and end_time > llm_time else timedelta(minutes=30)
+        except (TypeError, ValueError):
+            duration = timedelta(minutes=30)
+        result["datetime_end"] = (resolved + duration).isoformat()
+        return result
+
+    def _reading(self, match: TemporalMatch, llm_time: Optional[datetime]) -> Optional[datetime]:
+        """
+        Con una hora ambigua se respeta la lectura (mañana/tarde) que eligió
+        el LLM; si su hora no es ninguna de las dos no se puede corregir
+        """
+        if not llm_time or llm_time.minute != match.datetime.minute:
+            return None
+        if llm_time.hour == match.alternative.hour:
+            return match.alternative
+        if llm_time.hour == match.datetime.hour:
+            return match.datetime
+        return None
+
+    def _relative_delta(self, match: re.Match) -> Tuple[timedelta, bool]:
+        """Desplazamiento de "en N <unidad>" y si incluye hora"""
+        if match.group("half"):
+            return timedelta(minutes=30), True
+
+        amount = self._number(match.group("n"))
+        unit = match.group("unit")
+        if unit.startswith("min"):
+            return timedelta(minutes=amount), True
+        if unit.startswith("h"):
+            extra = timedelta(minutes=30) if match.group("and_half") else timedelta()
+            return timedelta(hours=amount) + extra, True
+        if unit.startswith("dia"):
+            return timedelta(days=amount), False
+        return timedelta(weeks=amount), False
+
+    def _find_time(self, text: str, consume) -> Optional[Tuple[int, int, bool]]:
+        """Hora del día (hora, minuto, ¿ambigua?) del texto, consumiendo la expresión"""
+        match = NOON_PATTERN.search(text)
+        if match:
+            consume(match)
+            return (12, 0, False) if match.group("which") == "mediodia" else (0, 0, False)
+
+        match = TIME_PATTERN.search(text)
+        if match:
+            part = match.group("part")
+            if not part:
+                # "a las 3 ... en la tarde" con palabras en medio
+                part_match = DAYPART_PATTERN.search(text, match.end())
+                if part_match:
+                    part = part_match.group("part")
+                    consume(part_match)
+            consume(match)
+            hour = self._number(match.group("h"))
+            minute = int(match.group("m") or 0)
+            fraction = match.group("frac")
+            if fraction == "media":
+                minute = 30
+            elif fraction == "cuarto":
+                minute = 15
+            elif fraction:
+                minute = int(fraction)
+            time_of_day = self._to_24h(hour, minute, match.group("ampm"), part)
+            if time_of_day is None:
+                return None
+            # "a las 8" sin am/pm ni parte del día: puede ser 8:00 o 20:00
+            ambiguous = not match.group("ampm") and not part and 7 <= hour <= 11
+            return (*time_of_day, ambiguous)
+
+        match = BARE_TIME_PATTERN.search(text)
+        if match:
+            consume(match)
+            if match.group("h24"):
+                time_of_day = self._to_24h(int(match.group("h24")), int(match.group("m24")), None, None)
+            else:
+                time_of_day = self._to_24h(int(match.group("h")), int(match.group("m") or 0), match.group("ampm"), None)
+            return (*time_of_day, False) if time_of_day else None
+
+        match = DAYPART_PATTERN.search(text)
+        if match:
+            consume(match)
+            return DAYPARTS[match.group("part")], 0, False
+
+        return None
+
+    def _find_date(self, text: str, now: datetime, consume) -> Optional[date]:
+        """Día referido por el texto, consumiendo la expresión"""
+        today = now.date()
+
+        match = DATE_WORDS_PATTERN.search(text)
+        if match:
+            consume(match)
+            return self._calendar_date(int(match.group("d")), MONTHS[match.group("m")], match.group("y"), today)
+
+        match = DATE_NUMERIC_PATTERN.search(text)
+        if match:
+            consume(match)
+            return self._calendar_date(int(match.group("d")), int(match.group("m")), match.group("y"), today)
+
+        match = DAY_OF_MONTH_PATTERN.search(text)
+        if match:
+            consume(match)
+            day_number = int(match.group("d"))
+            month, year = today.month, today.year
+            if day_number < today.day:
+                month, year = (1, year + 1) if month == 12 else (month + 1, year)
+            try:
+                return date(year, month, day_number)
+            except ValueError:
+                return None
+
+        match = DAY_WORD_PATTERN.search(text)
+        if match:
+            consume(match)
+            return today + timedelta(days=DAY_WORDS[re.sub(r"\s+", " ", match.group("word"))])
+
+        match = WEEKDAY_PATTERN.search(text)
+        if match:
+            consume(match)
+            days_ahead = (WEEKDAYS[match.group("day")] - today.weekday()) % 7
+            # "el viernes" dicho un viernes es el de la próxima semana
+            return today + timedelta(days=days_ahead or 7)
+
+        return None
+
+    def _calendar_date(self, day_number: int, month: int, year: Optional[str], today: date) -> Optional[date]:
+        """Fecha explícita; sin año se toma la próxima ocurrencia"""
+        try:
+            if year:
+                full_year = int(year) + (2000 if len(year) == 2 else 0)
+                return date(full_year, month, day_number)
+            candidate = date(today.year, month, day_number)
+            return candidate if candidate >= today else date(today.year + 1, month, day_number)
+        except ValueError:
+            return None
+
+    def _to_24h(self, hour: int, minute: int, ampm: Optional[str], part: Optional[str]) -> Optional[Tuple[int, int]]:
+        """
+        Normaliza a 24 h: pm/tarde/noche suman 12; 1-6 sin indicación se
+        asumen de la tarde y 7-11 de la mañana (ver `TemporalMatch.alternative`)
+        """
+        if hour > 23 or minute > 59:
+            return None
+        if ampm:
+            is_pm = ampm.startswith("p")
+            if is_pm and hour < 12:
+                hour += 12
+            elif not is_pm and hour == 12:
+                hour = 0
+        elif part == "noche" and hour == 12:
+            hour = 0
+        elif part in ("tarde", "noche") and hour < 12:
+            hour += 12
+        elif part is None and 1 <= hour <= 6:
+            hour += 12
+        return hour, minute
+
+    def _confidence(self, text: str, spans: List[Tuple[int, int]]) -> float:
+        """1.0 si no quedan restos temporales sin resolver ni otra expresión en el texto"""
+        if not spans:
+            return 0.0
+        if UNRESOLVED_PATTERN.search(text) or any(pattern.search(text) for pattern in SECOND_EXPRESSION_PATTERNS):
+            return 0.5
+        return 1.0
+
+    def _number(self, value: str) -> int:
+        return int(value) if value.isdigit() else NUMBER_WORDS[value]
+
+    def _at(self, day: date, hour: int, minute: int) -> datetime:
+        return self.tz.localize(datetime(day.year, day.month, day.day, hour, minute))
+
+    def _on(self, day: Optional[date], now: datetime, hour: int, minute: int) -> datetime:
+        """Hora en el día dado; sin día, hoy o mañana si esa hora ya pasó"""
+        if day is not None:
+            return self._at(day, hour, minute)
+        when = self._at(now.date(), hour, minute)
+        return when if when > now else self._at(now.date() + timedelta(days=1), hour, minute)
+
+    def _parse_iso(self, value: Optional[str]) -> datetime:
+        """ISO del LLM a datetime de Costa Rica (sin zona se asume local)"""
+        if not value:
+            raise ValueError("datetime vacío")
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        return self.tz.localize(parsed) if parsed.tzinfo is None else parsed.astimezone(self.tz)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Recordatorios resueltos sin LLM y correcciones aplicadas"""
+        return {**self.stats, "enabled": self.enabled}
+
+
+# Instancia singleton usada por MessageHandler.handle_text
+temporal_resolver = TemporalResolver()
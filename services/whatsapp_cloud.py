@@ -3,32 +3,43 @@ Servicio para WhatsApp Cloud API
 """
 import httpx
 import json
-from typing import Optional, Dict, Any
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Mapping, Tuple
 from loguru import logger
-from app.config import settings
+from app.config import Settings, current_settings, settings
 
 
 class WhatsAppCloudService:
     """Servicio para interactuar con WhatsApp Cloud API"""
     
     def __init__(self):
-        pass  # Initialize empty, get fresh settings each time
+        # (snapshot, URL base, headers) derivados del snapshot de configuración vigente
+        self._endpoint: Optional[Tuple[Settings, str, Mapping[str, str]]] = None
     
-    def _get_headers(self):
-        """Get fresh headers with current token"""
-        from app.config import get_settings
-        current_settings = get_settings()
-        clean_token = current_settings.whatsapp_cloud_token.strip()
-        return {
-            "Authorization": f"Bearer {clean_token}",
-            "Content-Type": "application/json"
-        }
+    def _get_endpoint(self) -> Tuple[str, Mapping[str, str]]:
+        """
+        URL base y headers del snapshot vigente. Se recalculan solo cuando
+        reload_settings() cambia el snapshot (rotación de token), no en cada envío.
+        """
+        snapshot = current_settings()
+        endpoint = self._endpoint
+        if endpoint is None or endpoint[0] is not snapshot:
+            headers = MappingProxyType({
+                "Authorization": f"Bearer {snapshot.whatsapp_access_token.strip()}",
+                "Content-Type": "application/json"
+            })
+            endpoint = (snapshot, f"https://graph.facebook.com/v18.0/{snapshot.whatsapp_phone_number_id}", headers)
+            # Una sola asignación: un envío concurrente ve el par anterior o el nuevo, nunca uno mezclado
+            self._endpoint = endpoint
+        return endpoint[1], endpoint[2]
+    
+    def _get_headers(self) -> Mapping[str, str]:
+        """Headers con el token del snapshot vigente"""
+        return self._get_endpoint()[1]
     
-    def _get_base_url(self):
-        """Get fresh base URL with current settings"""
-        from app.config import get_settings
-        current_settings = get_settings()
-        return f"https://graph.facebook.com/v18.0/{current_settings.whatsapp_phone_number_id}"
+    def _get_base_url(self) -> str:
+        """URL base con el phone number ID del snapshot vigente"""
+        return self._get_endpoint()[0]
     
     async def send_text_message(self, to: str, message: str) -> Dict[str, Any]:
         """
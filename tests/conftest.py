@@ -3,7 +3,9 @@ Pytest configuration and fixtures for Korei Assistant tests
 """
 import pytest
 import asyncio
+import json
 from typing import AsyncGenerator
+from unittest.mock import AsyncMock, MagicMock
 import os
 import sys
 
@@ -56,4 +58,30 @@ def mock_gemini_response():
         "recurrence": "none",
         "calendary": False,
         "task_category": "personal"
-    }
\ No newline at end of file
+    }
+
+def _fake_gemini_model(payload, delay: float = 0):
+    """Modelo de Gemini simulado: generate_content_async responde `payload` (dict o texto) tras `delay` segundos"""
+    model = MagicMock()
+    response = MagicMock()
+    response.text = json.dumps(payload) if isinstance(payload, dict) else payload
+
+    async def generate(*args, **kwargs):
+        await asyncio.sleep(delay)
+        return response
+
+    model.generate_content_async = AsyncMock(side_effect=generate)
+    return model
+
+@pytest.fixture
+def fake_model():
+    """Fábrica de modelos de Gemini simulados: fake_model(payload, delay=0)"""
+    return _fake_gemini_model
+
+@pytest.fixture
+def gemini_service():
+    """GeminiService sin Supabase: el prompt se reemplaza por un texto fijo"""
+    from services.gemini import GeminiService
+    service = GeminiService()
+    service._build_prompt = AsyncMock(return_value="prompt")
+    return service
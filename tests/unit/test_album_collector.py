@@ -0,0 +1,189 @@
+"""
+Tests para la agrupación de imágenes en álbumes y su procesamiento en una sola llamada
+"""
+import asyncio
+import io
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import PIL.Image
+import pytest
+
+from handlers.message_handler import MessageHandler
+from services.album_collector import AlbumCollector
+from services.gemini import GeminiService
+from services.gemini_prompts import ALBUM_ATTACHED_INSTRUCTIONS, ALBUM_ATTACHED_MESSAGE, media_instructions
+from services.message_queue import MessageQueue, QueueFullError
+
+
+async def _collect(received, phone_number, contact_name, messages):
+    received.append((phone_number, [message["id"] for message in messages], contact_name))
+
+
+@pytest.mark.asyncio
+async def test_images_within_window_become_one_album():
+    queue = MessageQueue(workers=1, max_size=10)
+    collector = AlbumCollector(window_seconds=0.05, max_images=10, queue=queue)
+    received = []
+
+    await collector.add("506", {"id": "img1"}, _collect, received, "506", contact_name="Ana")
+    await asyncio.sleep(0.01)
+    await collector.add("506", {"id": "img2"}, _collect, received, "506", contact_name="Ana")
+    assert received == []
+
+    await asyncio.sleep(0.1)
+    await queue.stop(drain_timeout=1)
+
+    assert received == [("506", ["img1", "img2"], "Ana")]
+    stats = collector.get_stats()
+    assert stats["merged"] == 1
+    assert stats["calls_saved"] == 1
+
+
+@pytest.mark.asyncio
+async def test_flush_keeps_album_before_next_message():
+    queue = MessageQueue(workers=1, max_size=10)
+    collector = AlbumCollector(window_seconds=10, max_images=10, queue=queue)
+    received = []
+
+    await collector.add("506", {"id": "img1"}, _collect, received, "506", contact_name="Ana")
+    await collector.flush("506")
+    await queue.enqueue("506", _collect, received, "506", "Ana", [{"id": "text"}])
+    await queue.stop(drain_timeout=1)
+
+    assert [ids for _, ids, _ in received] == [["img1"], ["text"]]
+    assert collector.get_stats()["pending"] == 0
+
+
+def _jpeg(color):
+    output = io.BytesIO()
+    PIL.Image.new("RGB", (800, 600), color).save(output, format="JPEG")
+    return output.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_album_is_classified_in_one_call():
+    """Todas las imágenes van en la misma llamada y vuelve una entry por imagen"""
+    service = GeminiService()
+    service._build_prompt = AsyncMock(side_effect=lambda message, *args: message)
+    response = MagicMock()
+    response.text = json.dumps({"entries": [
+        {"image": 2, "type": "gasto", "description": "Supermercado", "amount": 12000,
+         "datetime": "2025-08-15T10:00:00-06:00", "extracted_text": "TOTAL 12000"},
+        {"image": 1, "type": "gasto", "description": "Farmacia", "amount": 3500,
+         "datetime": "2025-08-15T09:00:00-06:00", "extracted_text": "TOTAL 3500"}
+    ]})
+    service.fast_model = MagicMock()
+    service.fast_model.generate_content_async = AsyncMock(return_value=response)
+    service.model = MagicMock()
+
+    results = await service.process_album([_jpeg("red"), _jpeg("blue"), b"no es imagen"], ["", ""], {})
+
+    service.fast_model.generate_content_async.assert_called_once()
+    contents = service.fast_model.generate_content_async.call_args.args[0]
+    assert len(contents) == 3
+    assert "álbum de 2 imágenes" in contents[0]
+    assert [result["description"] for result in results] == ["Farmacia", "Supermercado"]
+    assert "extracted_text" not in results[0] and "image" not in results[0]
+    assert service.media_stats["album"] == {"albums": 1, "images": 2, "unreadable": 1, "entries": 2}
+
+
+def test_album_prompt_includes_album_rules():
+    assert ALBUM_ATTACHED_INSTRUCTIONS in media_instructions(ALBUM_ATTACHED_MESSAGE.format(count=3))
+
+
+@pytest.mark.asyncio
+async def test_album_entries_share_image_save_path_and_report_partial_success():
+    """Cada entry se guarda como una imagen suelta (calendario incluido); un fallo no tumba el resto"""
+    handler = MessageHandler()
+    handler.get_request_context = AsyncMock(return_value={})
+    handler.verify_user_and_payment = AsyncMock(return_value={"is_valid": True})
+    handler.download_image = AsyncMock(return_value=b"jpeg")
+    calendar = MagicMock()
+    calendar.sync_to_external = AsyncMock(return_value="google-1")
+    handler.get_integration = AsyncMock(return_value=calendar)
+    handler.check_calendar_availability = AsyncMock(return_value={"has_conflict": False, "conflicts": []})
+    results = [
+        {"type": "gasto", "description": "Farmacia", "amount": 3500},
+        {"type": "evento", "description": "Cita médica", "datetime": "2025-08-20T09:00:00-06:00"},
+        {"type": "gasto", "description": "Supermercado", "amount": 12000}
+    ]
+    user = {"id": "u1", "whatsapp_number": "50612345678"}
+
+    with patch("handlers.message_handler.gemini_service.process_album", AsyncMock(return_value=results)), \
+         patch("handlers.message_handler.supabase") as supabase, \
+         patch("handlers.message_handler.whatsapp_cloud_service.send_text_message", AsyncMock()) as send:
+        supabase.create_entry = AsyncMock(side_effect=[{"id": "e1"}, {"id": "e2"}, RuntimeError("timeout")])
+        supabase.update_entry = AsyncMock()
+
+        outcome = await handler.handle_album([{"media": {"id": f"m{i}"}} for i in range(3)], user)
+
+    assert outcome["status"] == "partial"
+    assert outcome["outcomes"] == ["saved", "saved", "error"]
+    assert [entry["id"] for entry in outcome["entries"]] == ["e1", "e2"]
+    handler.check_calendar_availability.assert_awaited_once_with(calendar, results[1])
+    calendar.sync_to_external.assert_awaited_once_with(results[1])
+    supabase.update_entry.assert_awaited_once_with("e2", {"external_service": "google_calendar", "external_id": "google-1"})
+    message = send.call_args.kwargs["message"]
+    assert "3 imágenes procesadas" in message
+    assert message.count("No se pudo guardar") == 1
+
+
+class _FullQueue:
+    """Cola que rechaza los primeros `rejections` enqueue y luego ejecuta el handler"""
+
+    def __init__(self, rejections):
+        self.rejections = rejections
+
+    async def enqueue(self, key, handler, *args, **kwargs):
+        if self.rejections:
+            self.rejections -= 1
+            raise QueueFullError("Cola llena")
+        await handler(*args, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_rejected_album_is_rebuffered_and_retried():
+    """Si la cola rechaza el álbum al hacer flush, no se pierde: se reintenta en la siguiente ventana"""
+    collector = AlbumCollector(window_seconds=0.05, max_images=10, queue=_FullQueue(rejections=1))
+    received = []
+
+    await collector.add("506", {"id": "img1"}, _collect, received, "506", contact_name="Ana")
+    await collector.add("506", {"id": "img2"}, _collect, received, "506", contact_name="Ana")
+    with pytest.raises(QueueFullError):
+        await collector.flush("506")
+
+    assert collector.get_stats()["pending"] == 1
+    await asyncio.sleep(0.1)
+
+    assert received == [("506", ["img1", "img2"], "Ana")]
+    assert collector.get_stats()["requeued"] == 1
+    assert collector.get_stats()["dropped"] == 0
+
+
+@pytest.mark.asyncio
+async def test_size_flush_rejection_leaves_current_image_to_meta_retry():
+    """Al llenarse por tamaño con la cola saturada, la imagen actual queda fuera para el reintento de Meta"""
+    collector = AlbumCollector(window_seconds=0.05, max_images=2, queue=_FullQueue(rejections=1))
+    received = []
+
+    await collector.add("506", {"id": "img1"}, _collect, received, "506", contact_name="Ana")
+    with pytest.raises(QueueFullError):
+        await collector.add("506", {"id": "img2"}, _collect, received, "506", contact_name="Ana")
+    await collector.add("506", {"id": "img2"}, _collect, received, "506", contact_name="Ana")
+
+    assert received == [("506", ["img1", "img2"], "Ana")]
+
+
+@pytest.mark.asyncio
+async def test_album_is_dropped_after_requeue_limit():
+    collector = AlbumCollector(window_seconds=0.01, max_images=10, queue=_FullQueue(rejections=10))
+    collector.requeue_limit = 2
+    received = []
+
+    await collector.add("506", {"id": "img1"}, _collect, received, "506", contact_name="Ana")
+    await asyncio.sleep(0.1)
+
+    stats = collector.get_stats()
+    assert (stats["requeued"], stats["dropped"], stats["pending"]) == (2, 1, 0)
+    assert received == []
@@ -0,0 +1,74 @@
+"""
+Tests para el parser determinístico de gastos e ingresos
+"""
+from datetime import datetime
+
+import pytest
+import pytz
+
+from services.expense_parser import ExpenseParser
+
+NOW = pytz.timezone("America/Costa_Rica").localize(datetime(2025, 8, 15, 12, 0))
+
+
+@pytest.fixture
+def parser():
+    return ExpenseParser(min_confidence=0.8)
+
+
+@pytest.mark.parametrize("message, entry_type, amount, description", [
+    ("gasté 5000 en almuerzo", "gasto", 5000, "Gasto en almuerzo"),
+    ("Gaste 5k en uber", "gasto", 5000, "Gasto en uber"),
+    ("pagué la luz 18.500", "gasto", 18500, "Pago de luz"),
+    ("compré pan 1.250,50", "gasto", 1250.5, "Compra de pan"),
+    ("gasté 2.5 mil en el súper", "gasto", 2500, "Gasto en súper"),
+    ("me pagaron 250 mil", "ingreso", 250000, "Pago recibido"),
+    ("cobré ₡45.000 colones por el logo", "ingreso", 45000, "Cobro de logo"),
+    ("compre un celular de 300 mil", "gasto", 300000, "Compra de celular"),
+    ("pagué la cuenta con 30 mil", "gasto", 30000, "Pago de cuenta"),
+])
+def test_simple_messages_skip_llm(parser, message, entry_type, amount, description):
+    """Los patrones comunes producen el dict de process_message sin LLM"""
+    result = parser.try_parse(message, NOW)
+
+    assert result["type"] == entry_type
+    assert result["amount"] == amount
+    assert result["description"] == description
+    assert result["datetime"].startswith("2025-08-15")
+    assert "confidence" not in result
+
+
+def test_yesterday_moves_the_date(parser):
+    """'ayer' se resuelve localmente"""
+    result = parser.try_parse("gasté 3000 en café ayer", NOW)
+    assert result["datetime"].startswith("2025-08-14")
+    assert result["description"] == "Gasto en café"
+
+
+@pytest.mark.parametrize("message", [
+    "tengo que pagar la luz 18500",     # futuro
+    "no gasté 5000 en almuerzo",        # negación
+    "gasté 5000 en café y 3000 en pan", # varios montos
+    "gasté 20 dólares en amazon",       # otra moneda
+    "gasté 5000 el lunes en gasolina",  # fecha que no resuelve
+    "gasté 5000",                       # sin descripción
+    "¿cuánto gasté en comida?",         # pregunta
+    "reunión con Ana a las 3",          # no es financiero
+])
+def test_ambiguous_messages_go_to_llm(parser, message):
+    """Lo que el parser no entiende con certeza se deja a Gemini"""
+    assert parser.try_parse(message, NOW) is None
+
+
+def test_bypass_rate(parser):
+    """La tasa de omisión cuenta solo los mensajes resueltos sin LLM"""
+    parser.try_parse("gasté 5000 en almuerzo", NOW)
+    parser.try_parse("gasté 5000", NOW)
+    parser.try_parse("hola", NOW)
+    parser.try_parse("me pagaron 250 mil", NOW)
+
+    stats = parser.get_stats()
+    assert stats["bypassed"] == 2
+    assert stats["low_confidence"] == 1
+    assert stats["no_match"] == 1
+    assert stats["bypass_rate"] == 0.5
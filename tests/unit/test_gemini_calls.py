@@ -0,0 +1,98 @@
+"""
+Tests para el control de concurrencia de llamadas a Gemini
+"""
+import asyncio
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from services.gemini_calls import GeminiCallController
+
+
+@pytest.fixture
+def controller():
+    controller = GeminiCallController(max_in_flight=2, max_workers=2, native_async=True)
+    yield controller
+    controller.shutdown()
+
+
+def _async_model(delay: float, seen: list):
+    model = MagicMock()
+
+    async def generate_content_async(contents, **kwargs):
+        seen.append(contents)
+        await asyncio.sleep(delay)
+        return f"ok:{contents}"
+
+    model.generate_content_async = generate_content_async
+    return model
+
+
+@pytest.mark.asyncio
+async def test_in_flight_cap_and_queue_wait(controller):
+    """Nunca hay más llamadas en vuelo que el cupo; el resto espera en cola"""
+    model = _async_model(0.05, [])
+
+    results = await asyncio.gather(*(controller.generate(model, n, timeout=2) for n in range(5)))
+
+    stats = controller.get_stats()
+    assert results == [f"ok:{n}" for n in range(5)]
+    assert stats["peak_in_flight"] == 2
+    assert stats["native"] == 5
+    assert stats["in_flight"] == 0
+    assert stats["queue_wait"]["max_ms"] >= 40
+
+
+@pytest.mark.asyncio
+async def test_native_timeout_cancels_the_call(controller):
+    """Con async nativo el timeout cancela la llamada y libera el cupo"""
+    cancelled = asyncio.Event()
+    model = MagicMock()
+
+    async def generate_content_async(contents, **kwargs):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    model.generate_content_async = generate_content_async
+
+    with pytest.raises(asyncio.TimeoutError):
+        await controller.generate(model, "lento", timeout=0.05)
+
+    assert cancelled.is_set()
+    assert controller.in_flight == 0
+    assert controller.get_stats()["timeouts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_abandoned_thread_keeps_its_slot_until_done(controller):
+    """Un hilo que vence su timeout sigue ocupando cupo hasta terminar"""
+    release = threading.Event()
+
+    with pytest.raises(asyncio.TimeoutError):
+        await controller.run_sync(lambda: release.wait(2), timeout=0.05)
+
+    assert controller.in_flight == 1
+    assert controller.get_stats()["abandoned_threads"] == 1
+
+    release.set()
+    for _ in range(50):
+        if controller.in_flight == 0:
+            break
+        await asyncio.sleep(0.01)
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_sync_sdk_falls_back_to_private_executor(controller):
+    """Sin generate_content_async se usa el executor propio, no el por defecto"""
+    model = MagicMock(spec=["generate_content"])
+    model.generate_content.side_effect = lambda contents: threading.current_thread().name
+
+    thread_name = await controller.generate(model, "x", timeout=1)
+
+    assert thread_name.startswith("gemini")
+    assert controller.get_stats()["threaded"] == 1
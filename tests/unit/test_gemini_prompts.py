@@ -0,0 +1,77 @@
+"""
+Tests para el prefijo fijo y el presupuesto de tokens del prompt
+"""
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from services.gemini import gemini_service
+from services.gemini_prompts import (
+    AUDIO_INSTRUCTIONS, AUDIO_MARKER, IMAGE_MARKER, PROMPT_PREFIX, PREFIX_TOKENS,
+    RECEIPT_INSTRUCTIONS, assemble_prompt, estimate_tokens
+)
+
+
+def test_prefix_is_identical_and_first():
+    """El prefijo no cambia entre usuarios ni mensajes (reutilizable por caché del proveedor)"""
+    first, _ = assemble_prompt(["INFORMACIÓN DEL USUARIO:\n- Nombre: Ana"], [], "gasté 5000", 600)
+    second, _ = assemble_prompt(["INFORMACIÓN DEL USUARIO:\n- Nombre: Luis"], [], "mañana reunión", 600)
+
+    assert first.startswith(PROMPT_PREFIX)
+    assert second.startswith(PROMPT_PREFIX)
+    assert "Nombre: Ana" not in PROMPT_PREFIX and "user_context" not in PROMPT_PREFIX
+
+
+def test_media_rules_only_for_media_messages():
+    text, report = assemble_prompt([], [], "almuerzo 5000", 600)
+    audio, _ = assemble_prompt([], [], f"{AUDIO_MARKER} pagué la luz", 600)
+    image, _ = assemble_prompt([], [], f"{IMAGE_MARKER} comprobante SINPE", 600)
+
+    assert AUDIO_INSTRUCTIONS not in text and RECEIPT_INSTRUCTIONS not in text
+    assert report["media_tokens"] == 0
+    assert AUDIO_INSTRUCTIONS in audio and RECEIPT_INSTRUCTIONS not in audio
+    assert RECEIPT_INSTRUCTIONS in image
+
+
+def test_optional_blocks_dropped_in_priority_order():
+    """Los bloques que no caben se omiten; los obligatorios y el mensaje siempre van"""
+    required = ["INFORMACIÓN DEL USUARIO:\n- Nombre: Ana"]
+    optional = [("upcoming_events", "E" * 200), ("financial_context", "F" * 400), ("spending_patterns", "P" * 40)]
+    prompt, report = assemble_prompt(required, optional, "hola", 100)
+
+    assert report["included"] == ["upcoming_events", "spending_patterns"]
+    assert report["dropped"] == ["financial_context"]
+    assert "F" * 400 not in prompt
+    assert required[0] in prompt and '"hola"' in prompt
+    assert report["dynamic_tokens"] <= report["budget"]
+
+
+def test_report_totals():
+    required = ["CONTEXTO TEMPORAL:\n- Fecha/Hora actual: 2025-08-15 10:00:00"]
+    _, report = assemble_prompt(required, [("preferences", "x" * 20)], f"{AUDIO_MARKER} hola", 600)
+
+    message_block = f'MENSAJE A PROCESAR:\n"{AUDIO_MARKER} hola"'
+    assert report["prefix_tokens"] == PREFIX_TOKENS == estimate_tokens(PROMPT_PREFIX)
+    assert report["media_tokens"] == estimate_tokens(AUDIO_INSTRUCTIONS)
+    assert report["dynamic_tokens"] == (
+        estimate_tokens(required[0]) + estimate_tokens("x" * 20) + estimate_tokens(message_block)
+    )
+    assert report["total_tokens"] == report["prefix_tokens"] + report["media_tokens"] + report["dynamic_tokens"]
+
+
+@pytest.mark.asyncio
+async def test_build_prompt_records_token_stats():
+    blocks = {"financial_context": "", "upcoming_events": "EVENTOS PRÓXIMOS (próximos 3 días):\n- reunión",
+              "spending_patterns": ""}
+    before = gemini_service.prompt_stats["prompts"]
+    with patch.object(gemini_service, "_get_prompt_context", AsyncMock(return_value=blocks)):
+        prompt = await gemini_service._build_prompt(
+            "gasté 5000", {"id": "u1", "name": "Ana", "whatsapp_number": "50688887777"},
+            datetime(2025, 8, 15, 10, 0)
+        )
+
+    assert prompt.startswith(PROMPT_PREFIX)
+    assert "- Nombre: Ana" in prompt and "- reunión" in prompt
+    assert gemini_service.prompt_stats["prompts"] == before + 1
+    assert gemini_service.get_stats()["prompt_tokens"]["last"]["included"] == ["upcoming_events"]
@@ -0,0 +1,127 @@
+"""
+Tests para el control de cuotas de Gemini por API key
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from services.gemini_quota import GeminiQuotaManager, QuotaExhausted
+
+
+@pytest.fixture
+def limits():
+    with patch.multiple("services.gemini_quota.settings", gemini_fast_rpm=60, gemini_fast_tpm=6000,
+                        gemini_pro_rpm=6, gemini_pro_tpm=6000, gemini_quota_headroom=1.0,
+                        gemini_quota_max_wait=0.0):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_least_loaded_key_is_chosen(limits):
+    """Las llamadas se reparten entre las keys del pool"""
+    quota = GeminiQuotaManager(["key-a", "key-b"])
+
+    slots = [await quota.acquire("fast", 1000) for _ in range(4)]
+
+    assert [slot.name for slot in slots] == ["key0", "key1", "key0", "key1"]
+    assert quota.get_stats()["by_key"] == {"key0": 2, "key1": 2}
+
+
+@pytest.mark.asyncio
+async def test_tokens_per_minute_limit(limits):
+    """El límite de tokens corta antes que el de requests"""
+    quota = GeminiQuotaManager(["key-a"])
+    await quota.acquire("fast", 5000)
+
+    with pytest.raises(QuotaExhausted):
+        await quota.acquire("fast", 2000)
+    assert quota.stats["exhausted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_waits_for_refill_within_max_wait(limits):
+    """Con espera permitida, la llamada se encola hasta que la cubeta se rellena"""
+    quota = GeminiQuotaManager(["key-a"])
+    for _ in range(60):
+        await quota.acquire("fast", 10)
+
+    slot = await quota.acquire("fast", 10, max_wait=2.0)
+
+    assert slot.name == "key0"
+    assert quota.stats["waited"] == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_error_moves_traffic_to_other_key(limits):
+    quota = GeminiQuotaManager(["key-a", "key-b"])
+    slot = await quota.acquire("pro", 100)
+
+    quota.report_error(slot, "pro", Exception("429 Resource has been exhausted"))
+    following = [await quota.acquire("pro", 100) for _ in range(3)]
+
+    assert {s.name for s in following} == {"key1"}
+    assert quota.stats["rate_limited"] == 1
+
+
+def test_headroom_is_reported(limits):
+    stats = GeminiQuotaManager(["key-a"]).get_stats()
+
+    assert stats["keys"] == 1
+    assert stats["headroom"]["key0"]["pro"]["rpm_limit"] == 6
+    assert stats["headroom"]["key0"]["fast"]["tpm_available"] == 6000
+
+
+@pytest.fixture
+def service(gemini_service):
+    service = gemini_service
+    service.quota = MagicMock()
+    service.quota.max_wait = 0.0
+    service.quota.bind = lambda model, slot: model
+    return service
+
+
+@pytest.mark.asyncio
+async def test_pro_without_quota_degrades_to_fast_model(service, fake_model):
+    entry = {"type": "tarea", "description": "informe", "datetime": "2025-08-15T10:00:00-06:00"}
+    service.fast_model = fake_model(entry)
+    service.model = fake_model(entry)
+    service.quota.acquire = AsyncMock(side_effect=[QuotaExhausted("pro"), MagicMock()])
+
+    with patch("services.gemini.settings.gemini_router_enabled", False):
+        result = await service.process_message("preparar el informe", {"id": "u1"})
+
+    assert result["description"] == "informe"
+    service.model.generate_content_async.assert_not_called()
+    assert service.route_stats["degraded_to_fast"] == 1
+
+
+@pytest.mark.asyncio
+async def test_no_quota_anywhere_uses_rules(service, fake_model):
+    service.fast_model = fake_model({})
+    service.quota.acquire = AsyncMock(side_effect=QuotaExhausted("fast"))
+
+    result = await service.process_message("gasté 5000 en almuerzo", {"id": "u1"})
+
+    assert result["type"] == "gasto"
+    assert result["amount"] == 5000
+    assert service.route_stats["degraded_to_rules"] == 1
+
+
+@pytest.mark.asyncio
+async def test_free_text_calls_reserve_quota(service, fake_model):
+    """Las llamadas de comandos (registro, tips) también reservan cupo y reportan 429"""
+    model = fake_model("Ahorra el 10% de tu ingreso")
+    slot = MagicMock()
+    service.quota.acquire = AsyncMock(return_value=slot)
+    service.quota.report_error = MagicMock()
+
+    response = await service.generate(model, "tips financieros", "pro", 30.0)
+
+    assert response.text == "Ahorra el 10% de tu ingreso"
+    assert service.quota.acquire.call_args.args[0] == "pro"
+    assert "generation_config" not in model.generate_content_async.call_args.kwargs
+
+    model.generate_content_async.side_effect = Exception("429 Resource has been exhausted")
+    with pytest.raises(Exception):
+        await service.generate(model, "tips financieros", "pro", 30.0)
+    service.quota.report_error.assert_called_once()
@@ -0,0 +1,97 @@
+"""
+Tests para el preprocesamiento de imágenes y el pipeline de imagen en una sola llamada
+"""
+import io
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import PIL.Image
+import pytest
+
+from services.gemini import GeminiService
+from services.gemini_prompts import IMAGE_ATTACHED_INSTRUCTIONS
+from services.image_preprocessor import ImagePreprocessor
+
+
+def _jpeg(size, orientation=None, quality=95):
+    image = PIL.Image.effect_noise(size, 64).convert("RGB")
+    output = io.BytesIO()
+    exif = PIL.Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(output, format="JPEG", quality=quality, exif=exif.tobytes())
+    return output.getvalue()
+
+
+@pytest.fixture
+def preprocessor():
+    with patch.multiple("services.image_preprocessor.settings", image_format="JPEG", image_quality=80):
+        yield ImagePreprocessor(max_edge=512, max_workers=1)
+
+
+@pytest.mark.asyncio
+async def test_large_photo_is_downscaled_and_smaller(preprocessor):
+    original = _jpeg((2000, 1500))
+
+    prepared = await preprocessor.prepare(original)
+
+    assert max(prepared["width"], prepared["height"]) <= 512
+    assert prepared["bytes_out"] < prepared["bytes_in"] == len(original)
+    assert prepared["mime_type"] == "image/jpeg"
+    assert PIL.Image.open(io.BytesIO(prepared["data"])).size == (prepared["width"], prepared["height"])
+    assert preprocessor.get_stats()["size_ratio"] < 1
+
+
+@pytest.mark.asyncio
+async def test_exif_rotation_is_applied(preprocessor):
+    """Orientación 6 (foto vertical de celular): el ancho pasa a ser el alto"""
+    prepared = await preprocessor.prepare(_jpeg((400, 300), orientation=6))
+
+    assert (prepared["width"], prepared["height"]) == (300, 400)
+
+
+@pytest.mark.asyncio
+async def test_small_compact_image_passes_through(preprocessor):
+    original = _jpeg((200, 100), quality=30)
+
+    prepared = await preprocessor.prepare(original)
+
+    assert prepared["data"] == original
+    assert preprocessor.stats["passthrough"] == 1
+
+
+@pytest.mark.asyncio
+async def test_png_with_alpha_is_flattened(preprocessor):
+    output = io.BytesIO()
+    PIL.Image.new("RGBA", (800, 600), (255, 0, 0, 0)).save(output, format="PNG")
+
+    prepared = await preprocessor.prepare(output.getvalue())
+
+    assert prepared["mime_type"] == "image/jpeg"
+    assert PIL.Image.open(io.BytesIO(prepared["data"])).mode == "RGB"
+
+
+@pytest.mark.asyncio
+async def test_image_is_extracted_and_classified_in_one_call():
+    """Una sola llamada multimodal; el análisis de nombres corrige la dirección"""
+    service = GeminiService()
+    response = MagicMock()
+    response.text = json.dumps({
+        "type": "gasto", "description": "Transferencia SINPE", "amount": 5000,
+        "datetime": "2025-08-15T10:00:00-06:00", "confidence": 0.9,
+        "extracted_text": "Transferencia SINPE Móvil a Ana Mora por 5000.00 CRC"
+    })
+    service.fast_model = MagicMock()
+    service.fast_model.generate_content_async = AsyncMock(return_value=response)
+    service.model = MagicMock()
+
+    result = await service.process_image(_jpeg((1200, 900)), "", {"name": "Ana Mora"})
+
+    service.fast_model.generate_content_async.assert_called_once()
+    prompt, attachment = service.fast_model.generate_content_async.call_args.args[0]
+    assert IMAGE_ATTACHED_INSTRUCTIONS in prompt
+    assert attachment["mime_type"] == "image/jpeg"
+    assert result["type"] == "ingreso"
+    assert "extracted_text" not in result
+    assert service.media_stats["image"]["direction_corrected"] == 1
+    assert {"preprocess", "prompt", "model", "total"} <= set(service.media_stages["image"])
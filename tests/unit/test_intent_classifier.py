@@ -0,0 +1,88 @@
+"""
+Tests para el clasificador de intenciones conversacionales
+"""
+import json
+
+import pytest
+
+from services.intent_classifier import IntentClassifier, normalize
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return IntentClassifier()
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("hola", "greeting"),
+    ("Hola!!", "greeting"),
+    ("holaaaa", "greeting"),
+    ("Buenos días", "greeting"),
+    ("hola buenas tardes", "greeting"),
+    ("pura vida mae", "greeting"),
+    ("gracias", "thanks"),
+    ("Muchas gracias Korei!", "thanks"),
+    ("ok gracias", "thanks"),
+    ("hola, gracias", "thanks"),
+    ("¿Qué tal?", "simple_question"),
+    ("hola como estás", "simple_question"),
+    ("perfecto", "acknowledgement"),
+    ("dale, listo", "acknowledgement"),
+    ("jaja", "acknowledgement"),
+    ("mmm", "ambiguous"),
+    ("sí", "ambiguous"),
+    ("👍", "emoji_only"),
+])
+def test_conversational_messages(classifier, message, intent):
+    result = classifier.classify(message)
+    assert result["intent"] == intent
+    assert result["response"]
+    assert result["command"] is None
+
+
+@pytest.mark.parametrize("message, command", [
+    ("ayuda", "/help"),
+    ("¿Qué puedes hacer?", "/help"),
+    ("Mis tareas", "/tareas"),
+    ("mañana", "/mañana"),
+    ("estadísticas", "/stats"),
+])
+def test_command_synonyms(classifier, message, command):
+    result = classifier.classify(message)
+    assert result["intent"] == "command"
+    assert result["command"] == command
+
+
+@pytest.mark.parametrize("message", [
+    "gasté 5000 en almuerzo",
+    "gracias, mañana tengo cita con el dentista a las 10",
+    "hola, recordame llamar a mamá a las 3",
+    "reunión mañana",
+    "no olvidar comprar leche",
+])
+def test_real_content_goes_to_gemini(classifier, message):
+    """Mensajes con contenido no se clasifican aunque incluyan un saludo"""
+    assert classifier.classify(message) is None
+
+
+def test_normalize():
+    assert normalize("¡¡Holaaa, CÓMO estás!!") == "hola como estas"
+    assert normalize("Mañana 👍") == "manana"
+
+
+def test_intents_load_from_data_file(tmp_path):
+    """Las intenciones y respuestas vienen del archivo configurado"""
+    path = tmp_path / "intents.json"
+    path.write_text(json.dumps({
+        "filler": ["porfa"],
+        "intents": [
+            {"name": "command", "match": "exact", "commands": {"resumen": "/stats"}},
+            {"name": "greeting", "match": "cover", "summary": "Saludo", "phrases": ["upe"], "responses": ["Upe!"]}
+        ]
+    }), encoding="utf-8")
+
+    classifier = IntentClassifier(str(path))
+
+    assert classifier.classify("upe porfa")["response"] == "Upe!"
+    assert classifier.classify("resumen")["command"] == "/stats"
+    assert classifier.classify("hola") is None
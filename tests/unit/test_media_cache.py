@@ -0,0 +1,118 @@
+"""
+Tests para el cache por contenido de imágenes y notas de voz
+"""
+import io
+
+import PIL.Image
+import pytest
+
+from services.image_preprocessor import ImagePreprocessor
+from services.media_cache import MediaCache, content_digest
+
+USER = {"id": "u1", "name": "Ana Mora"}
+
+
+def _jpeg(image, quality=90):
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+@pytest.fixture
+def service(gemini_service):
+    service = gemini_service
+    service.media_cache = MediaCache(max_size=10, ttl_seconds=60)
+    return service
+
+
+def test_keys_are_per_user_and_context():
+    cache = MediaCache(max_size=10, ttl_seconds=60)
+    digest = content_digest(b"audio")
+    cache.store("u1", "audio", {"result": {"amount": 1}}, digest=digest)
+
+    assert cache.lookup("u2", "audio", digest=digest) is None
+    assert cache.lookup("u1", "audio", "otro texto", digest=digest) is None
+    assert cache.lookup("u1", "audio", digest=digest) == {"result": {"amount": 1}}
+    assert cache.lookup(None, "audio", digest=digest) is None
+    assert cache.get_stats()["hit_rate"] == round(1 / 3, 4)
+
+
+def test_cached_value_is_a_copy():
+    cache = MediaCache(max_size=10, ttl_seconds=60)
+    cache.store("u1", "image", {"result": {"type": "gasto"}}, digest="d")
+
+    cache.lookup("u1", "image", digest="d")["result"]["type"] = "ingreso"
+
+    assert cache.lookup("u1", "image", digest="d")["result"]["type"] == "gasto"
+
+
+@pytest.mark.asyncio
+async def test_repeated_voice_note_skips_the_model(service, fake_model):
+    service.fast_model = fake_model({
+        "type": "gasto", "description": "almuerzo", "amount": 5000,
+        "datetime": "2025-08-15T12:00:00-06:00", "transcription": "cinco mil en almuerzo"
+    })
+
+    first = await service.process_voice_note(b"OggS" * 10, USER, fingerprint="wa-hash")
+    by_bytes = await service.process_voice_note(b"OggS" * 10, USER)
+    by_fingerprint = service.cached_voice_note(USER, "wa-hash")
+
+    service.fast_model.generate_content_async.assert_called_once()
+    assert first["mode"] == "inline"
+    assert by_bytes["mode"] == by_fingerprint["mode"] == "cache"
+    assert by_bytes["result"] == first["result"]
+    assert by_fingerprint["transcription"] == "cinco mil en almuerzo"
+    assert service.media_stats["audio"]["cache"] == 2
+
+
+@pytest.mark.asyncio
+async def test_fallback_is_not_cached(service, fake_model):
+    service.fast_model = fake_model({})
+    service.fast_model.generate_content_async.side_effect = RuntimeError("503")
+    service.model = service.fast_model
+
+    await service.process_voice_note(b"OggS", USER)
+
+    assert len(service.media_cache.entries) == 0
+
+
+@pytest.mark.asyncio
+async def test_repeated_image_reapplies_direction(service, fake_model):
+    service.fast_model = fake_model({
+        "type": "gasto", "description": "Transferencia SINPE", "amount": 5000,
+        "datetime": "2025-08-15T10:00:00-06:00",
+        "extracted_text": "Transferencia SINPE Móvil a Ana Mora por 5000.00 CRC"
+    })
+    image = _jpeg(PIL.Image.effect_noise((600, 400), 64).convert("RGB"))
+
+    first = await service.process_image(image, "", USER)
+    second = await service.process_image(image, "", USER)
+
+    service.fast_model.generate_content_async.assert_called_once()
+    assert first["type"] == second["type"] == "ingreso"
+    assert service.media_cache.get_stats()["exact_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_recompressed_image_hits_perceptual_hash(service, fake_model):
+    service.fast_model = fake_model({
+        "type": "gasto", "description": "supermercado", "amount": 12000,
+        "datetime": "2025-08-15T10:00:00-06:00", "extracted_text": "TOTAL 12000"
+    })
+    gradient = PIL.Image.linear_gradient("L").resize((600, 400)).convert("RGB")
+    service.media_cache.perceptual = True
+
+    await service.process_image(_jpeg(gradient, quality=95), "", USER)
+    result = await service.process_image(_jpeg(gradient, quality=40), "", USER)
+
+    service.fast_model.generate_content_async.assert_called_once()
+    assert result["amount"] == 12000
+    assert service.media_cache.get_stats()["perceptual_hits"] == 1
+
+
+def test_dhash_is_stable_across_scaling():
+    gradient = PIL.Image.linear_gradient("L").rotate(30).convert("RGB")
+    small = ImagePreprocessor._dhash(gradient.resize((128, 128)))
+    large = ImagePreprocessor._dhash(gradient)
+
+    assert bin(small ^ large).count("1") <= 6
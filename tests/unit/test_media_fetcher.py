@@ -0,0 +1,94 @@
+"""
+Tests para la descarga de media con pool compartido, límites y reintentos
+"""
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from services.media_fetcher import MediaFetcher, MediaFetchError
+
+
+@pytest_asyncio.fixture
+async def server():
+    calls = {"flaky": 0}
+    urls = {}
+
+    async def media_info(request):
+        return web.json_response({"url": urls["file"]})
+
+    async def file(request):
+        assert request.headers["Authorization"].startswith("Bearer ")
+        return web.Response(body=b"x" * 300_000)
+
+    async def flaky(request):
+        calls["flaky"] += 1
+        if calls["flaky"] == 1:
+            return web.Response(status=503)
+        return web.Response(body=b"ok")
+
+    async def missing(request):
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_get("/media-1", media_info)
+    app.router.add_get("/file", file)
+    app.router.add_get("/flaky", flaky)
+    app.router.add_get("/missing", missing)
+    server = TestServer(app)
+    await server.start_server()
+    urls["file"] = str(server.make_url("/file"))
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def fetcher(server):
+    with patch.multiple("services.media_fetcher.settings", whatsapp_access_token="token",
+                        media_spool_memory_bytes=100_000, media_fetch_max_bytes=1_000_000,
+                        media_fetch_backoff=0.0, media_fetch_retries=2):
+        fetcher = MediaFetcher(base_url=str(server.make_url("")))
+        yield fetcher
+        await fetcher.close()
+
+
+@pytest.mark.asyncio
+async def test_media_id_is_resolved_and_streamed_to_disk(fetcher):
+    """Archivos sobre el umbral del spool pasan a disco; la sesión se reutiliza"""
+    data = await fetcher.fetch_media("media-1")
+    session = fetcher.session
+    await fetcher.fetch_media("media-1")
+
+    assert data == b"x" * 300_000
+    assert fetcher.session is session
+    stats = fetcher.get_stats()
+    assert stats["downloads"] == 2
+    assert stats["spooled_to_disk"] == 2
+    assert stats["throughput_kbps"] > 0
+
+
+@pytest.mark.asyncio
+async def test_transient_status_is_retried(fetcher, server):
+    assert await fetcher.download(str(server.make_url("/flaky"))) == b"ok"
+    assert fetcher.stats["retries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried(fetcher, server):
+    with pytest.raises(MediaFetchError) as error:
+        await fetcher.download(str(server.make_url("/missing")))
+
+    assert error.value.reason == "http_404"
+    assert fetcher.stats["retries"] == 0
+    assert fetcher.stats["reasons"] == {"http_404": 1}
+
+
+@pytest.mark.asyncio
+async def test_oversized_file_is_rejected(fetcher, server):
+    with patch("services.media_fetcher.settings.media_fetch_max_bytes", 200_000):
+        with pytest.raises(MediaFetchError) as error:
+            await fetcher.download(str(server.make_url("/file")))
+
+    assert error.value.reason == "too_large"
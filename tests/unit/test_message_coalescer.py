@@ -0,0 +1,84 @@
+"""
+Tests para la agrupación de ráfagas de texto por usuario
+"""
+import pytest
+import asyncio
+
+from services.lane_buffer import LaneBuffer
+from services.message_coalescer import MessageCoalescer
+from services.message_queue import MessageQueue
+
+
+async def _collect(received, phone_number, message_text, contact_name):
+    received.append((phone_number, message_text, contact_name))
+
+
+@pytest.mark.asyncio
+async def test_burst_is_merged_into_single_call():
+    """Mensajes dentro de la ventana llegan juntos en una sola ejecución"""
+    queue = MessageQueue(workers=1, max_size=10)
+    coalescer = MessageCoalescer(window_seconds=0.05, max_messages=5, queue=queue)
+    received = []
+
+    await coalescer.add("506", "gasté 5000", _collect, received, "506", contact_name="Ana")
+    await asyncio.sleep(0.01)
+    await coalescer.add("506", "en almuerzo", _collect, received, "506", contact_name="Ana")
+    assert received == []
+
+    await asyncio.sleep(0.1)
+    await queue.stop(drain_timeout=1)
+
+    assert received == [("506", "gasté 5000\nen almuerzo", "Ana")]
+    stats = coalescer.get_stats()
+    assert stats["flushed"] == 1
+    assert stats["calls_saved"] == 1
+
+
+@pytest.mark.asyncio
+async def test_max_messages_flushes_without_waiting():
+    """Al llegar al tamaño máximo la ráfaga sale sin esperar la ventana"""
+    queue = MessageQueue(workers=1, max_size=10)
+    coalescer = MessageCoalescer(window_seconds=10, max_messages=2, queue=queue)
+    received = []
+
+    await coalescer.add("506", "a", _collect, received, "506", contact_name="Ana")
+    await coalescer.add("506", "b", _collect, received, "506", contact_name="Ana")
+    await queue.stop(drain_timeout=1)
+
+    assert received == [("506", "a\nb", "Ana")]
+    assert coalescer.get_stats()["flushed_by_size"] == 1
+
+
+@pytest.mark.asyncio
+async def test_flush_keeps_order_before_command():
+    """Un flush explícito encola la ráfaga antes del comando que sigue"""
+    queue = MessageQueue(workers=1, max_size=10)
+    coalescer = MessageCoalescer(window_seconds=10, max_messages=5, queue=queue)
+    received = []
+
+    await coalescer.add("506", "hola", _collect, received, "506", contact_name="Ana")
+    await coalescer.flush("506")
+    await queue.enqueue("506", _collect, received, "506", "/tareas", "Ana")
+    await queue.stop(drain_timeout=1)
+
+    assert [text for _, text, _ in received] == ["hola", "/tareas"]
+    assert coalescer.get_stats()["pending"] == 0
+
+
+def test_accepts_only_text_when_enabled():
+    """Desactivado por defecto y nunca agrupa comandos"""
+    assert MessageCoalescer(window_seconds=0).accepts("hola") is False
+
+    coalescer = MessageCoalescer(window_seconds=1)
+    assert coalescer.accepts("hola") is True
+    assert coalescer.accepts("/help") is False
+    assert coalescer.accepts(None) is False
+
+
+def test_lane_buffer_subclass_must_define_merge():
+    """Una subclase sin `merge` falla al instanciarse, no al primer flush"""
+    class Incomplete(LaneBuffer):
+        name = "Incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete(window_seconds=1, max_items=2)
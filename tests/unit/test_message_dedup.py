@@ -0,0 +1,90 @@
+"""
+Tests para el cache TTL y la idempotencia de mensajes entrantes
+"""
+import asyncio
+import time
+
+import pytest
+
+from core.cache import TTLCache
+from services.message_dedup import MessageDeduplicator
+
+
+def test_ttl_cache_expires_and_counts():
+    """Las entradas expiran y se cuentan aciertos/fallos"""
+    cache = TTLCache(max_size=10, ttl_seconds=0.05)
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Al exceder el tamaño se desaloja la entrada menos usada"""
+    cache = TTLCache(max_size=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_duplicate_detection():
+    """El segundo mensaje con el mismo ID es duplicado"""
+    dedup = MessageDeduplicator(max_size=100, ttl_seconds=60, snapshot_path="")
+
+    assert dedup.is_duplicate("wamid.1") is False
+    assert dedup.is_duplicate("wamid.1") is True
+    assert dedup.is_duplicate("wamid.2") is False
+    assert dedup.is_duplicate(None) is False
+
+    stats = dedup.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_forget_allows_retry():
+    """Un ID olvidado vuelve a aceptarse"""
+    dedup = MessageDeduplicator(max_size=100, ttl_seconds=60, snapshot_path="")
+    dedup.is_duplicate("wamid.1")
+    dedup.forget("wamid.1")
+
+    assert dedup.is_duplicate("wamid.1") is False
+
+
+def test_snapshot_survives_restart(tmp_path):
+    """Los IDs vigentes se restauran desde el snapshot"""
+    path = str(tmp_path / "seen.json")
+    before = MessageDeduplicator(max_size=100, ttl_seconds=60, snapshot_path=path)
+    before.is_duplicate("wamid.1")
+    assert before.save_snapshot() == 1
+
+    after = MessageDeduplicator(max_size=100, ttl_seconds=60, snapshot_path=path)
+    assert after.load_snapshot() == 1
+    assert after.is_duplicate("wamid.1") is True
+
+
+@pytest.mark.asyncio
+async def test_snapshot_is_saved_periodically(tmp_path):
+    """Sin apagado ordenado, el snapshot periódico ya tiene los IDs vistos"""
+    path = str(tmp_path / "seen.json")
+    dedup = MessageDeduplicator(max_size=100, ttl_seconds=60, snapshot_path=path)
+    dedup.start_autosave(interval=0.02)
+    dedup.is_duplicate("wamid.1")
+
+    await asyncio.sleep(0.1)
+    await dedup.stop_autosave()
+
+    restarted = MessageDeduplicator(max_size=100, ttl_seconds=60, snapshot_path=path)
+    assert restarted.load_snapshot() == 1
+    assert dedup.get_stats()["snapshot"]["saves"] == 1  # Sin cambios nuevos no se reescribe
+    assert dedup.autosave_task is None
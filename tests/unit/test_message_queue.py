@@ -0,0 +1,155 @@
+"""
+Tests para la cola de mensajes con pool de workers y carriles por usuario
+"""
+import pytest
+import asyncio
+
+from services.message_queue import MessageQueue, QueueFullError, lane_key
+
+
+@pytest.mark.asyncio
+async def test_enqueue_returns_before_processing():
+    """El encolado no espera a que el handler termine"""
+    queue = MessageQueue(workers=1, max_size=10)
+    await queue.start()
+    release = asyncio.Event()
+    done = []
+
+    async def slow_handler(value):
+        await release.wait()
+        done.append(value)
+
+    await queue.enqueue("50611111111", slow_handler, "a")
+    assert done == []
+
+    release.set()
+    await queue.stop(drain_timeout=1)
+    assert done == ["a"]
+    assert queue.get_stats()["processed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_queue_full_rejects():
+    """Con la cola llena se rechaza el mensaje"""
+    queue = MessageQueue(workers=1, max_size=2)
+    await queue.start()
+    release = asyncio.Event()
+
+    async def blocked():
+        await release.wait()
+
+    await queue.enqueue("a", blocked)
+    await queue.enqueue("b", blocked)
+
+    with pytest.raises(QueueFullError):
+        await queue.enqueue("c", blocked)
+
+    assert queue.get_stats()["rejected"] == 1
+    release.set()
+    await queue.stop(drain_timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_pending_and_survives_failures():
+    """Al apagar se procesan los pendientes aunque alguno falle"""
+    queue = MessageQueue(workers=2, max_size=10)
+    await queue.start()
+    done = []
+
+    async def handler(value):
+        if value == 2:
+            raise ValueError("boom")
+        await asyncio.sleep(0.01)
+        done.append(value)
+
+    for i in range(5):
+        await queue.enqueue(f"user-{i}", handler, i)
+
+    await queue.stop(drain_timeout=1)
+
+    assert sorted(done) == [0, 1, 3, 4]
+    stats = queue.get_stats()
+    assert stats["processed"] == 4
+    assert stats["failed"] == 1
+    assert not stats["running"]
+
+
+@pytest.mark.asyncio
+async def test_same_user_runs_in_order_one_at_a_time():
+    """Los mensajes de un mismo usuario nunca corren en paralelo y respetan el orden"""
+    queue = MessageQueue(workers=4, max_size=20)
+    await queue.start()
+    running = []
+    max_running = 0
+    order = []
+
+    async def handler(value):
+        nonlocal max_running
+        running.append(value)
+        max_running = max(max_running, len(running))
+        await asyncio.sleep(0.01 if value % 2 else 0.02)
+        order.append(value)
+        running.remove(value)
+
+    for i in range(6):
+        await queue.enqueue("50688888888", handler, i)
+
+    await queue.stop(drain_timeout=2)
+
+    assert order == [0, 1, 2, 3, 4, 5]
+    assert max_running == 1
+
+
+@pytest.mark.asyncio
+async def test_different_users_run_in_parallel_and_fairly():
+    """Un usuario con ráfaga no bloquea a otro usuario"""
+    queue = MessageQueue(workers=1, max_size=20)
+    await queue.start()
+    order = []
+
+    async def handler(user, value):
+        await asyncio.sleep(0)
+        order.append((user, value))
+
+    for i in range(3):
+        await queue.enqueue("heavy", handler, "heavy", i)
+    await queue.enqueue("light", handler, "light", 0)
+
+    await queue.stop(drain_timeout=1)
+
+    # Con un solo worker los carriles se alternan: light no espera a toda la ráfaga
+    assert order.index(("light", 0)) < order.index(("heavy", 2))
+
+
+@pytest.mark.asyncio
+async def test_lane_limits():
+    """Se respetan el backlog por carril y el número máximo de carriles"""
+    queue = MessageQueue(workers=1, max_size=50, max_lanes=2, lane_max_backlog=2)
+    await queue.start()
+    release = asyncio.Event()
+
+    async def blocked():
+        await release.wait()
+
+    await queue.enqueue("a", blocked)
+    await queue.enqueue("a", blocked)
+    with pytest.raises(QueueFullError):
+        await queue.enqueue("a", blocked)
+
+    await queue.enqueue("b", blocked)
+    with pytest.raises(QueueFullError):
+        await queue.enqueue("c", blocked)
+
+    stats = queue.get_stats()
+    assert stats["rejected_lane_backlog"] == 1
+    assert stats["rejected_lane_limit"] == 1
+
+    release.set()
+    await queue.stop(drain_timeout=1)
+
+
+def test_lane_key_normalizes_phone():
+    """La clave de carril ignora el sufijo legacy de WAHA"""
+    assert lane_key("50612345678@c.us") == "50612345678"
+    assert lane_key("+506 1234 5678") == "50612345678"
+    assert lane_key(None) == "unknown"
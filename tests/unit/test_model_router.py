@@ -0,0 +1,234 @@
+"""
+Tests para el router de modelos de GeminiService y el histograma de latencias
+"""
+import json
+from unittest.mock import patch
+
+import pytest
+
+from core.metrics import LatencyHistogram
+from services.gemini import GeminiDecodeError
+
+
+EXPENSE = {
+    "type": "gasto", "description": "café", "amount": 3000,
+    "datetime": "2025-08-15T10:00:00-06:00", "confidence": 0.9
+}
+
+
+@pytest.mark.asyncio
+async def test_simple_message_stays_on_fast_model(gemini_service, fake_model):
+    """Un gasto simple se resuelve con el modelo rápido sin tocar pro"""
+    gemini_service.fast_model = fake_model(EXPENSE)
+    gemini_service.model = fake_model(EXPENSE)
+
+    result = await gemini_service.process_message("gasté 3000 en café", {"id": "u1"})
+
+    assert result["amount"] == 3000
+    assert "confidence" not in result
+    gemini_service.model.generate_content_async.assert_not_called()
+    assert gemini_service.route_stats["fast"] == 1
+    assert gemini_service.latency["fast"].count == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fast_payload, reason", [
+    ({**EXPENSE, "confidence": 0.2}, "low_confidence"),
+    ({**EXPENSE, "amount": None}, "invalid_amount"),
+    ({**EXPENSE, "type": "compra"}, "invalid_type"),
+    ("no json", "invalid_json")
+])
+async def test_invalid_or_unsure_fast_result_escalates(gemini_service, fast_payload, reason, fake_model):
+    """Respuestas inválidas o con baja confianza se repiten con pro"""
+    gemini_service.fast_model = fake_model(fast_payload)
+    gemini_service.model = fake_model({**EXPENSE, "amount": 3500})
+
+    result = await gemini_service.process_message("gasté 3000 en café", {"id": "u1"})
+
+    assert result["amount"] == 3500
+    assert gemini_service.route_stats["escalated"] == 1
+    assert gemini_service.route_stats["reasons"] == {reason: 1}
+
+
+@pytest.mark.asyncio
+async def test_complex_message_goes_straight_to_pro(gemini_service, fake_model):
+    """Mensajes con varios ítems no pasan por el modelo rápido"""
+    gemini_service.fast_model = fake_model(EXPENSE)
+    gemini_service.model = fake_model(EXPENSE)
+
+    with patch("services.gemini.settings.gemini_route_max_clauses", 2):
+        await gemini_service.process_message("gasté 3000 en café, 2000 en pan y 5000 en taxi", {"id": "u1"})
+
+    gemini_service.fast_model.generate_content_async.assert_not_called()
+    assert gemini_service.route_stats["reasons"] == {"complex_message": 1}
+
+
+def test_latency_histogram_percentiles():
+    """Los percentiles devuelven el límite del bucket correspondiente"""
+    histogram = LatencyHistogram(buckets_ms=(100, 500, 1000))
+    for elapsed in (50, 80, 90, 400, 2000):
+        histogram.observe(elapsed)
+
+    stats = histogram.get_stats()
+    assert stats["count"] == 5
+    assert stats["p50_ms"] == 100
+    assert stats["p95_ms"] == 2000
+    assert stats["buckets"] == {"<=100": 3, "<=500": 1, "<=1000": 0, ">1000": 1}
+
+
+@pytest.mark.asyncio
+async def test_fast_model_exception_escalates(gemini_service, fake_model):
+    """Un error de la llamada (no de la respuesta) también escala a pro"""
+    gemini_service.fast_model = fake_model(EXPENSE)
+    gemini_service.fast_model.generate_content_async.side_effect = RuntimeError("503")
+    gemini_service.model = fake_model(EXPENSE)
+
+    await gemini_service.process_message("gasté 3000 en café", {"id": "u1"})
+
+    assert gemini_service.route_stats["reasons"] == {"fast_error": 1}
+
+
+@pytest.mark.parametrize("text, expected", [
+    (json.dumps(EXPENSE), "gasto"),
+    (f"```json\n{json.dumps(EXPENSE)}\n```", "gasto"),
+    (json.dumps({**EXPENSE, "extra": 1, "priority": "alta"}), "gasto")
+])
+def test_decoder_accepts_schema_valid_payloads(gemini_service, text, expected):
+    """El decoder tipado acepta JSON válido, con o sin bloque ``` y con campos de más"""
+    result = gemini_service._decode_entry(text, "fast")
+
+    assert result["type"] == expected
+    assert "extra" not in result
+    assert gemini_service.decode_stats["fast"]["decoded"] == 1
+
+
+@pytest.mark.parametrize("changes, expected", [
+    ({"recurrence": None}, {"recurrence": "none"}),
+    ({"type": "tarea", "datetime": None}, {"type": "tarea"}),
+    ({"priority": "high"}, {"priority": "alta"}),
+    ({"priority": "urgente"}, {"priority": "media"}),
+    ({"status": "done"}, {"status": "completed"}),
+    ({"confidence": 85}, {"confidence": 0.85}),
+    ({"confidence": "alta"}, {"confidence": None}),
+    ({"amount": -5}, {"amount": 5.0}),
+    ({"amount": "18.500"}, {"amount": 18500.0}),
+    ({"amount": "18,500"}, {"amount": 18500.0}),
+    ({"amount": "₡18.500"}, {"amount": 18500.0}),
+    ({"amount": "1,5"}, {"amount": 1.5}),
+    ({"amount": "-2.500"}, {"amount": 2500.0})
+])
+def test_decoder_normalizes_near_miss_payloads(gemini_service, changes, expected):
+    """Valores casi correctos se normalizan en vez de caer al fallback"""
+    result = gemini_service._decode_entry(json.dumps({**EXPENSE, **changes}), "pro")
+
+    for key, value in expected.items():
+        assert result[key] == value
+    assert gemini_service.decode_stats["pro"]["failures"] == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("payload", [
+    {**EXPENSE, "recurrence": None},
+    {"type": "tarea", "description": "llamar al banco", "confidence": 0.9},
+    {"type": "tarea", "description": "llamar al banco", "datetime": None, "confidence": 0.9},
+    {**EXPENSE, "priority": "high"},
+    {**EXPENSE, "confidence": 85}
+])
+async def test_near_miss_payloads_are_not_replaced_by_fallback(gemini_service, payload, fake_model):
+    """El router guarda lo que dijo el modelo; el recordatorio genérico queda para JSON o tipo inválidos"""
+    gemini_service.fast_model = fake_model(payload)
+    gemini_service.model = fake_model(payload)
+
+    result = await gemini_service.process_message("llamar al banco", {"id": "u1"})
+
+    assert result["type"] == payload["type"]
+    assert result["description"] == payload["description"]
+    assert "datetime" not in result or result["datetime"]
+    assert gemini_service.route_stats["reasons"] == {}
+    assert gemini_service.decode_stats["fast"]["failures"] == 0
+
+
+@pytest.mark.parametrize("text, reason", [
+    ('Aquí está: {"type": "gasto"', "invalid_json"),
+    (json.dumps({**EXPENSE, "type": "compra"}), "invalid_type"),
+    (json.dumps({**EXPENSE, "description": ""}), "missing_description"),
+    (json.dumps({**EXPENSE, "amount": "inf"}), "invalid_amount"),
+    (json.dumps({**EXPENSE, "amount": "tres mil"}), "invalid_amount")
+])
+def test_decoder_failures_are_counted_per_model(gemini_service, text, reason):
+    """Cada fallo se cuenta con su motivo en el modelo que lo produjo"""
+    with pytest.raises(GeminiDecodeError) as error:
+        gemini_service._decode_entry(text, "pro")
+
+    assert error.value.reason == reason
+    assert gemini_service.decode_stats["pro"]["reasons"] == {reason: 1}
+    assert gemini_service.decode_stats["fast"]["failures"] == 0
+
+
+@pytest.fixture
+def hedging():
+    with patch.multiple("services.gemini.settings", gemini_hedge_enabled=True, gemini_hedge_model="fast",
+                        gemini_hedge_default_delay=0.05, gemini_min_call_budget=0.1):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_stalled_call_is_hedged_with_cheaper_model(gemini_service, hedging, fake_model):
+    """Si pro no responde a tiempo, gana el hedge y la llamada lenta se cancela"""
+    gemini_service.model = fake_model({**EXPENSE, "amount": 1}, delay=5)
+    gemini_service.fast_model = fake_model(EXPENSE)
+
+    result = await gemini_service._generate_json(gemini_service.model, "prompt", "pro", 2.0)
+
+    assert result["amount"] == 3000
+    assert gemini_service.hedge_stats["hedged"] == 1
+    assert gemini_service.hedge_stats["hedge_wins"] == 1
+    assert gemini_service.get_stats()["hedging"]["win_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged(gemini_service, hedging, fake_model):
+    gemini_service.model = fake_model(EXPENSE)
+    gemini_service.fast_model = fake_model(EXPENSE)
+
+    await gemini_service._generate_json(gemini_service.model, "prompt", "pro", 2.0)
+
+    gemini_service.fast_model.generate_content_async.assert_not_called()
+    assert gemini_service.hedge_stats["eligible"] == 1
+    assert gemini_service.hedge_stats["hedged"] == 0
+
+
+@pytest.mark.asyncio
+async def test_invalid_hedge_waits_for_primary(gemini_service, hedging, fake_model):
+    """La primera respuesta válida gana aunque el hedge termine antes"""
+    gemini_service.model = fake_model({**EXPENSE, "amount": 3500}, delay=0.2)
+    gemini_service.fast_model = fake_model("no json")
+
+    result = await gemini_service._generate_json(gemini_service.model, "prompt", "pro", 2.0)
+
+    assert result["amount"] == 3500
+    assert gemini_service.hedge_stats["primary_wins"] == 1
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_without_budget(gemini_service, hedging, fake_model):
+    """Sin presupuesto para que el hedge responda, no se lanza"""
+    gemini_service.model = fake_model(EXPENSE)
+
+    with patch("services.gemini.settings.gemini_min_call_budget", 5.0):
+        await gemini_service._generate_json(gemini_service.model, "prompt", "pro", 2.0)
+
+    assert gemini_service.hedge_stats["skipped_no_budget"] == 1
+
+
+@pytest.mark.asyncio
+async def test_escalation_respects_message_deadline(gemini_service, fake_model):
+    """Si el modelo rápido consumió el plazo del mensaje, no se llama a pro"""
+    gemini_service.fast_model = fake_model(EXPENSE, delay=5)
+    gemini_service.model = fake_model(EXPENSE)
+
+    with patch.multiple("services.gemini.settings", gemini_message_deadline=0.3, gemini_min_call_budget=0.5):
+        result = await gemini_service.process_message("gasté 3000 en café", {"id": "u1"})
+
+    assert result["type"] == "recordatorio"
+    gemini_service.model.generate_content_async.assert_not_called()
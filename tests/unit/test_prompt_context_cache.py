@@ -0,0 +1,60 @@
+"""
+Tests para el contexto de prompts de Gemini cacheado por usuario
+"""
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.supabase import supabase
+from services.gemini import gemini_service
+
+
+def _result(data):
+    result = MagicMock()
+    result.data = data
+    return result
+
+
+@pytest.fixture
+def now():
+    gemini_service.prompt_context_cache.clear()
+    return datetime.now(gemini_service.tz)
+
+
+def _window(now):
+    return [
+        {"type": "gasto", "amount": 5000, "category": "comida", "description": "almuerzo",
+         "datetime": (now - timedelta(days=2)).isoformat()},
+        {"type": "gasto", "amount": 12000, "category": "transporte", "description": "taxi",
+         "datetime": (now - timedelta(days=20)).isoformat()},
+        {"type": "evento", "amount": None, "category": None, "description": "reunión",
+         "datetime": (now + timedelta(days=1)).isoformat()}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_one_query_builds_all_blocks_and_is_cached(now):
+    """Una consulta alimenta los tres bloques y el segundo prompt no toca la BD"""
+    with patch.object(supabase, "execute", return_value=_result(_window(now))) as execute, \
+         patch.object(supabase, "_get_client"):
+        first = await gemini_service._get_prompt_context("u1", now)
+        second = await gemini_service._get_prompt_context("u1", now)
+
+    assert execute.call_count == 1
+    assert first is second
+    assert "₡5,000" in first["financial_context"]
+    assert "reunión" in first["upcoming_events"]
+    assert "transporte" in first["spending_patterns"]
+
+
+@pytest.mark.asyncio
+async def test_entry_write_invalidates_context(now):
+    """notify_entries_changed descarta el contexto del usuario"""
+    with patch.object(supabase, "execute", return_value=_result(_window(now))) as execute, \
+         patch.object(supabase, "_get_client"):
+        await gemini_service._get_prompt_context("u1", now)
+        supabase.notify_entries_changed("u1")
+        await gemini_service._get_prompt_context("u1", now)
+
+    assert execute.call_count == 2
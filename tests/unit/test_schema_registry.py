@@ -0,0 +1,124 @@
+"""
+Tests para el descubrimiento de columnas de Supabase
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.routes import admin
+from core.schema import SchemaRegistry
+from core.supabase import SupabaseService
+
+
+def test_shape_drops_unknown_columns():
+    """Con la tabla conocida se omiten las claves que no son columnas"""
+    registry = SchemaRegistry()
+    registry.set_columns("entries", ["id", "status", "completed_at"], "openapi")
+
+    shaped = registry.shape("entries", {"status": "completed", "updated_at": "x"})
+
+    assert shaped == {"status": "completed"}
+    assert registry.has_column("entries", "updated_at") is False
+    assert registry.get_stats()["tables"]["entries"]["dropped_keys"] == ["updated_at"]
+
+
+def test_unknown_table_is_left_untouched():
+    """Sin información de la tabla el payload no se modifica"""
+    registry = SchemaRegistry()
+    payload = {"anything": 1}
+
+    assert registry.shape("users", payload) is payload
+    assert registry.has_column("users", "anything") is None
+
+
+@pytest.mark.asyncio
+async def test_load_schema_uses_openapi_then_sample_row():
+    """Las tablas de la especificación OpenAPI no se sondean; el resto sí"""
+    service = SupabaseService()
+    response = MagicMock()
+    response.json.return_value = {"definitions": {"entries": {"properties": {"id": {}, "updated_at": {}}}}}
+    client = MagicMock()
+    client.postgrest.session.get.return_value = response
+    sample = MagicMock()
+    sample.data = [{"id": "u1", "name": "Ana"}]
+
+    with patch.object(service, "_get_client", return_value=client), \
+         patch.object(service, "execute", return_value=sample) as execute:
+        await service.load_schema(tables=("entries", "users"))
+
+    assert execute.call_count == 1
+    assert service.schema.has_column("entries", "updated_at") is True
+    assert service.schema.columns("users") == {"id", "name"}
+    assert service.schema.get_stats()["tables"]["users"]["source"] == "sample_row"
+    service.shutdown()
+
+
+def test_projection_limited_to_known_columns():
+    """Las proyecciones solo piden columnas existentes y caen a * sin schema"""
+    registry = SchemaRegistry()
+    assert registry.select("entries", "finance") == "*"
+
+    registry.set_columns("entries", ["id", "type", "amount", "description", "datetime", "status", "notes"], "openapi")
+    assert registry.select("entries", "finance") == "id, type, amount, description, datetime, status"
+
+
+@pytest.mark.asyncio
+async def test_measure_payloads_records_bytes():
+    """En modo medición se acumulan filas y bytes por consulta"""
+    service = SupabaseService()
+    query = MagicMock()
+    query.path = "/entries"
+    query.params = {"select": "id, amount"}
+    query.execute.return_value = MagicMock(data=[{"id": "1", "amount": 5000}])
+
+    with patch("core.supabase.settings.supabase_measure_payloads", True):
+        await service.execute(query)
+
+    payload = service.get_stats()["payloads"]["/entries select=id, amount"]
+    assert payload["rows"] == 1
+    assert payload["bytes"] == len('[{"id": "1", "amount": 5000}]')
+    service.shutdown()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("columns, expected", [
+    (None, True),
+    (["id", "status", "completed_at", "updated_at"], True),
+    (["id", "status", "completed_at"], False)
+])
+async def test_update_status_adds_updated_at_unless_ruled_out(columns, expected):
+    """Sin schema conocido se envía updated_at; solo se omite si la tabla no la tiene"""
+    service = SupabaseService()
+    if columns is not None:
+        service.schema.set_columns("entries", columns, "openapi")
+    table = MagicMock()
+    result = MagicMock()
+    result.data = [{"id": "e1", "user_id": "u1"}]
+
+    with patch.object(service, "table", return_value=table), \
+         patch.object(service, "execute", return_value=result):
+        await service.update_entry_status("e1", "completed")
+
+    assert ("updated_at" in table.update.call_args.args[0]) is expected
+    service.shutdown()
+
+
+def test_schema_refresh_requires_api_key():
+    """Refrescar el schema es una ruta de administración con X-API-Key"""
+    app = FastAPI()
+    app.include_router(admin.router, prefix="/api/admin")
+    client = TestClient(app)
+
+    with patch("api.routes.admin.current_settings") as current_settings, \
+         patch("api.routes.admin.supabase.load_schema", return_value={"entries": "openapi"}) as load_schema:
+        current_settings.return_value.api_key = "secret"
+
+        assert client.post("/api/admin/schema/refresh").status_code == 403
+        load_schema.assert_not_called()
+
+        response = client.post("/api/admin/schema/refresh", headers={"X-API-Key": "secret"})
+
+    assert response.status_code == 200
+    assert response.json() == {"entries": "openapi"}
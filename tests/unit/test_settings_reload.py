@@ -0,0 +1,86 @@
+"""
+Tests para el snapshot de configuración y su recarga explícita
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.config as config
+from api.routes import admin
+from api.routes.whatsapp_cloud import send_message_simple
+from services.whatsapp_cloud import WhatsAppCloudService
+
+
+@pytest.fixture
+def snapshot(monkeypatch):
+    """Restaura el snapshot original al terminar cada test"""
+    monkeypatch.setattr(config, "_snapshot", config._snapshot)
+    monkeypatch.setattr(config, "_reloads", config._reloads)
+    return config._snapshot
+
+
+def test_sends_do_not_reread_env(snapshot):
+    service = WhatsAppCloudService()
+
+    with patch("app.config.get_settings") as get_settings:
+        for _ in range(5):
+            headers, base_url = service._get_headers(), service._get_base_url()
+
+    get_settings.assert_not_called()
+    assert headers["Authorization"] == f"Bearer {snapshot.whatsapp_access_token.strip()}"
+    assert base_url.endswith(snapshot.whatsapp_phone_number_id)
+
+
+def test_reload_rotates_token(snapshot, monkeypatch):
+    service = WhatsAppCloudService()
+    service._get_headers()
+    monkeypatch.setenv("WHATSAPP_ACCESS_TOKEN", "rotated-token")
+
+    changed = config.reload_settings()
+
+    assert changed == ["whatsapp_access_token"]
+    assert config.current_settings() is not snapshot
+    assert service._get_headers()["Authorization"] == "Bearer rotated-token"
+    assert config.settings_reloads() == 1
+
+
+def test_invalid_reload_keeps_previous_snapshot(snapshot):
+    with patch("app.config.get_settings", side_effect=ValueError("gemini_api_key missing")):
+        with pytest.raises(ValueError):
+            config.reload_settings()
+
+    assert config.current_settings() is snapshot
+
+
+def test_reload_endpoint_requires_api_key(snapshot, monkeypatch):
+    monkeypatch.setattr(snapshot, "api_key", "secret")
+    app = FastAPI()
+    app.include_router(admin.router, prefix="/api/admin")
+    client = TestClient(app)
+
+    assert client.post("/api/admin/settings/reload").status_code == 403
+    assert client.post("/api/admin/settings/reload", headers={"X-API-Key": "wrong"}).status_code == 403
+
+    response = client.post("/api/admin/settings/reload", headers={"X-API-Key": "secret"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "reloaded"
+
+
+@pytest.mark.asyncio
+async def test_route_helpers_send_with_snapshot_token(snapshot, monkeypatch):
+    """Los envíos directos del webhook usan whatsapp_access_token del snapshot vigente"""
+    monkeypatch.setenv("WHATSAPP_ACCESS_TOKEN", "rotated-token")
+    config.reload_settings()
+    client = MagicMock()
+    client.post = AsyncMock(return_value=MagicMock(status_code=200))
+    client.__aenter__ = AsyncMock(return_value=client)
+    client.__aexit__ = AsyncMock(return_value=False)
+
+    with patch("httpx.AsyncClient", return_value=client):
+        assert await send_message_simple("50612345678", "hola") is True
+
+    url = client.post.call_args.args[0]
+    assert url.endswith(f"{config.current_settings().whatsapp_phone_number_id}/messages")
+    assert client.post.call_args.kwargs["headers"]["Authorization"] == "Bearer rotated-token"
@@ -0,0 +1,56 @@
+"""
+Tests para la capa de datos asíncrona de Supabase
+"""
+import pytest
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+from core.supabase import SupabaseService
+
+
+@pytest.mark.asyncio
+async def test_execute_runs_off_the_event_loop():
+    """La consulta corre en el pool dedicado y no bloquea el loop"""
+    service = SupabaseService()
+    query = MagicMock()
+    threads = []
+
+    def slow_execute():
+        threads.append(threading.current_thread().name)
+        time.sleep(0.05)
+        return "ok"
+
+    query.execute.side_effect = slow_execute
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.005)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    result = await service.execute(query)
+    task.cancel()
+
+    assert result == "ok"
+    assert threads[0].startswith("supabase")
+    assert ticks > 2
+    assert service.get_stats()["queries"] == 1
+    service.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_execute_times_out():
+    """Una consulta lenta se corta al exceder el timeout"""
+    service = SupabaseService()
+    query = MagicMock()
+    query.execute.side_effect = lambda: time.sleep(0.2)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await service.execute(query, timeout=0.02)
+
+    assert service.get_stats()["timeouts"] == 1
+    service.shutdown()
@@ -0,0 +1,247 @@
+"""
+Tests para el resolver de expresiones de tiempo (corpus anclado a Costa Rica)
+"""
+from datetime import datetime
+
+import pytest
+import pytz
+
+from services.temporal_resolver import TemporalResolver
+
+TZ = pytz.timezone("America/Costa_Rica")
+# Viernes 15 de agosto de 2025, 10:00
+NOW = TZ.localize(datetime(2025, 8, 15, 10, 0))
+
+
+@pytest.fixture
+def resolver():
+    return TemporalResolver()
+
+
+# (mensaje, "YYYY-MM-DD HH:MM" esperado, ¿incluye hora?)
+CORPUS = [
+    # Relativos
+    ("en 20 minutos", "2025-08-15 10:20", True),
+    ("en 5 min", "2025-08-15 10:05", True),
+    ("en media hora", "2025-08-15 10:30", True),
+    ("en una hora", "2025-08-15 11:00", True),
+    ("en 2 horas", "2025-08-15 12:00", True),
+    ("en dos horas y media", "2025-08-15 12:30", True),
+    ("dentro de 3 horas", "2025-08-15 13:00", True),
+    ("dentro de quince minutos", "2025-08-15 10:15", True),
+    ("en 3 días", "2025-08-18 10:00", False),
+    ("en 3 días a las 5", "2025-08-18 17:00", True),
+    ("dentro de una semana", "2025-08-22 10:00", False),
+    ("en 2 semanas", "2025-08-29 10:00", False),
+    # Solo hora: hoy si no ha pasado, si no mañana
+    ("a las 3", "2025-08-15 15:00", True),
+    ("a las 8 de la mañana", "2025-08-16 08:00", True),
+    ("a las 3:45 pm", "2025-08-15 15:45", True),
+    ("a las 7 pm", "2025-08-15 19:00", True),
+    ("a las 7 p.m.", "2025-08-15 19:00", True),
+    ("a las 9 am", "2025-08-16 09:00", True),
+    ("a las 12 am", "2025-08-16 00:00", True),
+    ("a las 12", "2025-08-15 12:00", True),
+    ("a las 3 y media", "2025-08-15 15:30", True),
+    ("a las 4 y cuarto", "2025-08-15 16:15", True),
+    ("a las 5 y 10", "2025-08-15 17:10", True),
+    ("a la una", "2025-08-15 13:00", True),
+    ("a las dos de la tarde", "2025-08-15 14:00", True),
+    ("a las 8 de la noche", "2025-08-15 20:00", True),
+    ("a las 12 de la noche", "2025-08-16 00:00", True),
+    ("para las 6", "2025-08-15 18:00", True),
+    ("tipo las 4", "2025-08-15 16:00", True),
+    ("3pm", "2025-08-15 15:00", True),
+    ("18:00", "2025-08-15 18:00", True),
+    ("a mediodía", "2025-08-15 12:00", True),
+    ("al mediodía", "2025-08-15 12:00", True),
+    ("a medianoche", "2025-08-16 00:00", True),
+    # Partes del día
+    ("esta tarde", "2025-08-15 15:00", True),
+    ("esta noche", "2025-08-15 19:00", True),
+    ("en la tarde", "2025-08-15 15:00", True),
+    ("por la noche", "2025-08-15 19:00", True),
+    ("mañana en la mañana", "2025-08-16 09:00", True),
+    ("mañana por la tarde", "2025-08-16 15:00", True),
+    # Días relativos
+    ("mañana a las 3", "2025-08-16 15:00", True),
+    ("hoy a las 5", "2025-08-15 17:00", True),
+    ("hoy a las 9 am", "2025-08-15 09:00", True),
+    ("mañana", "2025-08-16 10:00", False),
+    ("pasado mañana", "2025-08-17 10:00", False),
+    ("ayer a las 4", "2025-08-14 16:00", True),
+    # Días de la semana
+    ("el lunes", "2025-08-18 10:00", False),
+    ("el lunes a las 7 de la noche", "2025-08-18 19:00", True),
+    ("el viernes en la tarde", "2025-08-22 15:00", True),
+    ("el próximo martes a las 2 y media", "2025-08-19 14:30", True),
+    ("el miércoles que viene", "2025-08-20 10:00", False),
+    ("el domingo a mediodía", "2025-08-17 12:00", True),
+    ("jueves a las 4", "2025-08-21 16:00", True),
+    # Fechas explícitas
+    ("el 20 de agosto a las 4 pm", "2025-08-20 16:00", True),
+    ("20 de agosto", "2025-08-20 10:00", False),
+    ("el 1 de enero", "2026-01-01 10:00", False),
+    ("el 10 de agosto", "2026-08-10 10:00", False),
+    ("15 de setiembre a las 8 de la mañana", "2025-09-15 08:00", True),
+    ("el 3 de marzo de 2026", "2026-03-03 10:00", False),
+    ("15/09", "2025-09-15 10:00", False),
+    ("el 25/12 a las 7 pm", "2025-12-25 19:00", True),
+    ("02/01/26", "2026-01-02 10:00", False),
+    ("el día 20", "2025-08-20 10:00", False),
+    ("el día 10", "2025-09-10 10:00", False),
+    # Con contenido alrededor
+    ("reunión con Ana mañana a las 3", "2025-08-16 15:00", True),
+    ("llamar al doctor el lunes a las 9 am", "2025-08-18 09:00", True),
+    ("recordame sacar la ropa en 20 minutos", "2025-08-15 10:20", True),
+]
+
+
+@pytest.mark.parametrize("message, expected, has_time", CORPUS)
+def test_corpus(resolver, message, expected, has_time):
+    """Cada expresión del corpus se resuelve con confianza plena"""
+    match = resolver.resolve(message, NOW)
+
+    assert match is not None
+    assert match.datetime.strftime("%Y-%m-%d %H:%M") == expected
+    assert match.has_time is has_time
+    assert match.confidence == 1.0
+    assert match.alternative is None
+    assert match.datetime.tzinfo.zone == "America/Costa_Rica"
+
+
+# Horas 7-11 sin am/pm ni parte del día: (mensaje, lectura de la mañana, de la noche)
+AMBIGUOUS = [
+    ("a las 11", "2025-08-15 11:00", "2025-08-15 23:00"),
+    ("a las 9", "2025-08-16 09:00", "2025-08-15 21:00"),
+    ("a las 10:30", "2025-08-15 10:30", "2025-08-15 22:30"),
+    ("Mañana a las 10", "2025-08-16 10:00", "2025-08-16 22:00"),
+    ("pasado mañana a las 10:30", "2025-08-17 10:30", "2025-08-17 22:30"),
+    ("este sábado a las 9", "2025-08-16 09:00", "2025-08-16 21:00"),
+    ("cita médica el 20 de agosto a las 10:30", "2025-08-20 10:30", "2025-08-20 22:30"),
+]
+
+
+@pytest.mark.parametrize("message, morning, evening", AMBIGUOUS)
+def test_bare_morning_hours_are_ambiguous(resolver, message, morning, evening):
+    """Sin am/pm ni parte del día se conservan las dos lecturas"""
+    match = resolver.resolve(message, NOW)
+
+    assert match.datetime.strftime("%Y-%m-%d %H:%M") == morning
+    assert match.alternative.strftime("%Y-%m-%d %H:%M") == evening
+
+
+@pytest.mark.parametrize("message", [
+    "revisar el reporte de las 3 cuentas",
+    "comprar leche",
+    "la reunión fue productiva",
+    "pagar 5000",
+])
+def test_no_temporal_expression(resolver, message):
+    """Sin expresión de tiempo no se inventa una fecha"""
+    assert resolver.resolve(message, NOW) is None
+
+
+@pytest.mark.parametrize("message", [
+    "cada lunes a las 8",
+    "mañana más tarde",
+    "el fin de semana a las 10",
+    "mañana a las 3 por 2 horas",
+    "mañana a las 3 y a las 5",
+    "hoy a las 4 o el 20 de agosto",
+])
+def test_partial_expressions_have_low_confidence(resolver, message):
+    """Restos temporales sin resolver bajan la confianza"""
+    match = resolver.resolve(message, NOW)
+    assert match is None or match.confidence < resolver.min_confidence
+
+
+@pytest.mark.parametrize("message, description, expected", [
+    ("Recordame llamar a mamá mañana a las 3", "Llamar a mamá", "2025-08-16T15:00:00-06:00"),
+    ("recuérdame en 20 minutos sacar la ropa", "Sacar la ropa", "2025-08-15T10:20:00-06:00"),
+    ("recordarme pagar el agua el viernes a las 8 am", "Pagar el agua", "2025-08-22T08:00:00-06:00"),
+    ("avisame de la reunión a las 2", "La reunión", "2025-08-15T14:00:00-06:00"),
+])
+def test_simple_reminders_skip_llm(resolver, message, description, expected):
+    """Recordatorios con fecha y hora claras se construyen localmente"""
+    result = resolver.try_reminder(message, NOW)
+
+    assert result["type"] == "recordatorio"
+    assert result["description"] == description
+    assert result["datetime"] == expected
+    assert result["recurrence"] == "none"
+
+
+@pytest.mark.parametrize("message", [
+    "recordame llamar a mamá mañana",        # sin hora
+    "recordame tomar agua cada 2 horas",     # recurrente
+    "recordame a las 9 de la mañana de ayer",  # pasado
+    "llamar a mamá mañana a las 3",          # no es recordatorio explícito
+    "recordame mañana a las 3",              # sin qué recordar
+    "recordame sacar la basura a las 8",     # ¿de la mañana o de la noche?
+    "recordame mañana a las 3 y a las 5 llamar",  # dos horas
+])
+def test_reminders_left_to_llm(resolver, message):
+    assert resolver.try_reminder(message, NOW) is None
+
+
+def test_correct_fixes_llm_datetime_in_the_past(resolver):
+    """Si el LLM devuelve hoy a las 9 para "a las 9" (ya pasó) se mueve a mañana"""
+    result = {
+        "type": "evento",
+        "datetime": "2025-08-15T09:00:00-06:00",
+        "datetime_end": "2025-08-15T10:00:00-06:00",
+        "recurrence": "none"
+    }
+
+    corrected = resolver.correct(result, "reunión a las 9", NOW)
+
+    assert corrected["datetime"] == "2025-08-16T09:00:00-06:00"
+    assert corrected["datetime_end"] == "2025-08-16T10:00:00-06:00"
+    assert resolver.get_stats()["corrected"] == 1
+
+
+@pytest.mark.parametrize("message, llm_time", [
+    ("cena con Ana a las 7", "2026-10-16T19:00:00-06:00"),
+    ("partido a las 8", "2026-10-16T20:00:00-06:00"),
+    ("cena con Ana a las 7", "2026-10-17T07:00:00-06:00"),
+])
+def test_correct_keeps_llm_reading_of_ambiguous_hour(resolver, message, llm_time):
+    """Con "a las 7" el LLM decide si es de la mañana o de la noche"""
+    now = TZ.localize(datetime(2026, 10, 16, 10, 0))
+    result = {
+        "type": "evento",
+        "datetime": llm_time,
+        "datetime_end": llm_time,
+        "recurrence": "none"
+    }
+
+    assert resolver.correct(dict(result), message, now) == result
+    assert resolver.get_stats()["corrected"] == 0
+
+
+def test_correct_leaves_ambiguous_hour_when_llm_disagrees(resolver):
+    """Si la hora del LLM no es ninguna de las dos lecturas no se corrige"""
+    now = TZ.localize(datetime(2026, 10, 16, 10, 0))
+    result = {"type": "evento", "datetime": "2026-10-16T15:00:00-06:00", "recurrence": "none"}
+
+    assert resolver.correct(dict(result), "cena con Ana a las 7", now) == result
+
+
+def test_correct_keeps_llm_time_when_only_day_is_known(resolver):
+    """Con solo el día resuelto se conserva la hora elegida por el LLM"""
+    result = {
+        "type": "tarea",
+        "datetime": "2025-08-19T14:00:00-06:00",
+        "datetime_end": "2025-08-19T15:00:00-06:00"
+    }
+
+    corrected = resolver.correct(dict(result), "terminar el informe el lunes", NOW)
+
+    assert corrected["datetime"] == "2025-08-18T14:00:00-06:00"
+    assert resolver.correct(dict(corrected), "terminar el informe el lunes", NOW) == corrected
+
+
+def test_correct_ignores_finance(resolver):
+    result = {"type": "gasto", "datetime": "2025-08-14T09:00:00-06:00"}
+    assert resolver.correct(dict(result), "gasté 5000 mañana a las 3", NOW) == result
@@ -0,0 +1,147 @@
+"""
+Tests para el cache de usuarios y perfiles de SupabaseService
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+
+from core.supabase import SupabaseService
+
+
+USER = {"id": "u1", "whatsapp_number": "50612345678", "name": "Ana"}
+
+
+def _result(data):
+    result = MagicMock()
+    result.data = data
+    return result
+
+
+@pytest.fixture
+def service():
+    service = SupabaseService()
+    yield service
+    service.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_hot_user_needs_no_round_trips(service):
+    """Tras la primera carga, teléfono, id y perfil salen del cache"""
+    service.request_context_rpc = False
+    responses = [_result([USER]), _result([{"user_id": "u1", "occupation": "dev"}])]
+
+    with patch.object(service, "execute", side_effect=responses) as execute, \
+         patch.object(service, "_get_client"):
+        first = await service.get_user_with_context("50612345678")
+        second = await service.get_user_with_context("+506 1234 5678")
+        by_id = await service.get_user_by_id("u1")
+
+    assert execute.call_count == 2
+    assert first["id"] == second["id"] == "u1"
+    assert second["profile"]["occupation"] == "dev"
+    assert by_id["name"] == "Ana"
+    assert service.get_stats()["caches"]["users"]["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate_cache(service):
+    """update_user y update_user_context fuerzan una nueva lectura"""
+    service._cache_user(dict(USER))
+    service.profile_cache.set("u1", {"user_id": "u1", "context_summary": "viejo"})
+
+    responses = [
+        _result([{**USER, "name": "Ana María"}]),  # update_user
+        _result([]),                                 # update_user_context
+        _result([{**USER, "name": "Ana María"}]),  # get_user_by_id
+        _result([{"user_id": "u1", "context_summary": "nuevo"}])  # get_user_profile
+    ]
+
+    with patch.object(service, "execute", side_effect=responses), \
+         patch.object(service, "_get_client"):
+        await service.update_user("u1", {"name": "Ana María"})
+        await service.update_user_context("u1", "nuevo")
+        user = await service.get_user_by_id("u1")
+        profile = await service.get_user_profile("u1")
+
+    assert user["name"] == "Ana María"
+    assert profile["context_summary"] == "nuevo"
+
+
+@pytest.mark.asyncio
+async def test_request_context_single_round_trip(service):
+    """get_request_context trae usuario, perfil, plan e integraciones en una llamada"""
+    context = {
+        "user": USER,
+        "profile": {"user_id": "u1", "occupation": "dev"},
+        "entitlements": {"plan_type": "free", "unlimited_tasks": {"has_access": False},
+                         "limited_tasks": {"has_access": True, "remaining_tasks": 3}},
+        "remaining_tasks": 3,
+        "integrations": ["todoist"]
+    }
+
+    with patch.object(service, "execute", side_effect=[_result(context)]) as execute, \
+         patch.object(service, "_get_client"):
+        user = await service.get_user_with_context("50612345678")
+        again = await service.load_request_context("50612345678")
+        by_id = await service.get_user_by_id("u1")
+
+    assert execute.call_count == 1
+    assert user["profile"]["occupation"] == "dev"
+    assert user["request_context"]["integrations"] == ["todoist"]
+    assert again["remaining_tasks"] == 3
+    assert by_id["name"] == "Ana"
+
+
+@pytest.mark.asyncio
+async def test_request_context_falls_back_without_function(service):
+    """Sin la función SQL se arma el contexto con consultas individuales"""
+    responses = [
+        Exception("{'code': 'PGRST202', 'message': 'Could not find the function public.get_request_context(phone_input)'}"),
+        _result([USER]),
+        _result([])
+    ]
+
+    with patch.object(service, "execute", side_effect=responses), \
+         patch.object(service, "_get_client"):
+        context = await service.load_request_context("50612345678")
+
+    assert context["user"]["id"] == "u1"
+    assert context["entitlements"] is None
+    assert context["integrations"] is None
+    assert service.request_context_rpc is False
+
+
+@pytest.mark.asyncio
+async def test_transient_rpc_error_keeps_function_enabled(service):
+    """Un timeout de get_request_context no la desactiva para los mensajes siguientes"""
+    responses = [
+        Exception("canceling statement due to statement timeout: get_request_context"),
+        _result([USER]),
+        _result([])
+    ]
+
+    with patch.object(service, "execute", side_effect=responses), \
+         patch.object(service, "_get_client"):
+        context = await service.load_request_context("50612345678")
+
+    assert context["user"]["id"] == "u1"
+    assert service.request_context_rpc is True
+
+
+@pytest.mark.asyncio
+async def test_missing_function_is_retried_after_cooldown(service):
+    """Tras el cooldown se vuelve a probar la función (pudo desplegarse sin reiniciar)"""
+    missing = Exception("{'code': '42883', 'message': 'function get_request_context(text) does not exist'}")
+
+    with patch.object(service, "execute", side_effect=[missing, _result([USER]), _result([])]), \
+         patch.object(service, "_get_client"), \
+         patch("core.supabase.settings.supabase_rpc_retry_seconds", 0):
+        await service.load_request_context("50612345678")
+    assert service.request_context_rpc is False
+
+    with patch.object(service, "execute", return_value=_result({"user": USER, "entitlements": {"plan": "pro"}})) as execute, \
+         patch.object(service, "_get_client"):
+        context = await service.load_request_context("50699998888")
+
+    assert execute.call_count == 1
+    assert context["entitlements"] == {"plan": "pro"}
+    assert service.request_context_rpc is True
@@ -0,0 +1,81 @@
+"""
+Tests para el pipeline de notas de voz en una sola llamada
+"""
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from services.gemini import GeminiService, genai
+from services.gemini_prompts import VOICE_NOTE_INSTRUCTIONS
+
+USER = {"name": "Ana", "whatsapp_number": "50688887777"}
+ENTRY = {
+    "type": "gasto", "description": "almuerzo", "amount": 5000,
+    "datetime": "2025-08-15T12:00:00-06:00", "confidence": 0.9,
+    "transcription": "Gasté cinco mil colones en almuerzo"
+}
+
+
+@pytest.fixture
+def service(fake_model):
+    service = GeminiService()
+    service.fast_model = fake_model(ENTRY)
+    service.model = fake_model(ENTRY)
+    return service
+
+
+@pytest.mark.asyncio
+async def test_short_note_is_sent_inline_in_one_call(service):
+    """Bytes en línea, una sola llamada y la transcripción sale del mismo JSON"""
+    voice_note = await service.process_voice_note(b"OggS" * 100, USER)
+
+    service.fast_model.generate_content_async.assert_called_once()
+    prompt, attachment = service.fast_model.generate_content_async.call_args.args[0]
+    assert VOICE_NOTE_INSTRUCTIONS in prompt
+    assert attachment == {"mime_type": "audio/ogg", "data": b"OggS" * 100}
+
+    assert voice_note["mode"] == "inline"
+    assert voice_note["transcription"] == "Gasté cinco mil colones en almuerzo"
+    assert voice_note["result"]["amount"] == 5000
+    assert "transcription" not in voice_note["result"]
+    assert "confidence" not in voice_note["result"]
+    assert set(voice_note["timings_ms"]) == {"prompt", "model", "total"}
+    assert service.get_stats()["audio"]["stages"]["model"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_large_note_is_uploaded_and_deleted(service):
+    uploaded = MagicMock()
+    uploaded.name = "files/abc"
+    with patch("services.gemini.settings.gemini_inline_audio_max_bytes", 10), \
+         patch.object(genai, "upload_file", MagicMock(return_value=uploaded), create=True) as upload, \
+         patch.object(genai, "delete_file", MagicMock(), create=True) as delete:
+        voice_note = await service.process_voice_note(b"x" * 50, USER)
+
+    upload.assert_called_once()
+    delete.assert_called_once_with("files/abc")
+    assert service.fast_model.generate_content_async.call_args.args[0][1] is uploaded
+    assert voice_note["mode"] == "upload"
+    assert "upload" in voice_note["timings_ms"] and "delete" in voice_note["timings_ms"]
+
+
+@pytest.mark.asyncio
+async def test_large_note_stays_inline_without_upload_support(service):
+    """google-generativeai 0.3.2 no tiene upload_file: se envía en línea igual"""
+    with patch("services.gemini.settings.gemini_inline_audio_max_bytes", 10), \
+         patch("services.gemini.genai", SimpleNamespace()):
+        voice_note = await service.process_voice_note(b"x" * 50, USER)
+
+    assert voice_note["mode"] == "inline"
+
+
+@pytest.mark.asyncio
+async def test_model_failure_returns_fallback(service):
+    service.fast_model.generate_content_async.side_effect = RuntimeError("503")
+    service.model.generate_content_async.side_effect = RuntimeError("503")
+
+    voice_note = await service.process_voice_note(b"OggS", USER)
+
+    assert voice_note["result"]["type"] == "recordatorio"
+    assert voice_note["transcription"] == ""